@@ -2,4 +2,7 @@
 # shellcheck disable=SC2086
 current_version=$(hatch version)
 hatch build
-PYAPP_UV_ENABLED="1" PYAPP_PROJECT_PATH="$(ls ${PWD}/dist/nqx-${current_version}-py3-none-any.whl)" PYAPP_DISTRIBUTION_EMBED="1" hatch build -t binary
\ No newline at end of file
+# The binary runs the `nqx` script entry point (nqx.cli:main), which serves
+# activate/deactivate without importing the full CLI. Compile the bytecode at
+# install time so that the shell hook does not pay for it on first use.
+PYAPP_UV_ENABLED="1" PYAPP_PIP_EXTRA_ARGS="--compile-bytecode" PYAPP_PROJECT_PATH="$(ls ${PWD}/dist/nqx-${current_version}-py3-none-any.whl)" PYAPP_DISTRIBUTION_EMBED="1" hatch build -t binary
@@ -4,6 +4,16 @@ __nqx_exe() (
     "$NQX_EXE" "$@"
 )
 
+# Asks the resident daemon (`nqx daemon start`) when it runs, which answers
+# without starting nqx, or nqx itself otherwise. Only for the commands the
+# daemon serves, as the client falls back to nqx for the others.
+__nqx_ask() (
+    if [ -S "${__NQX_DAEMON_SOCKET:-}" ]; then
+        \exec "$__NQX_PYTHON" -I -S "$__NQX_DAEMON_CLIENT" "$__NQX_DAEMON_SOCKET" "$NQX_EXE" "$@"
+    fi
+    "$NQX_EXE" "$@"
+)
+
 __nqx_hashr() {
     if [ -n "${ZSH_VERSION:+x}" ]; then
         \rehash
@@ -21,15 +31,43 @@ __nqx_activate() {
         PS1="$CONDA_PS1_BACKUP"
         \unset CONDA_PS1_BACKUP
     fi
+    if __nqx_source_scripts "$@"; then
+        __nqx_hashr
+        \return
+    fi
     \local ask_nqx
-    ask_nqx="$(PS1="${PS1:-}" __nqx_exe "$@")" || \return
+    ask_nqx="$(PS1="${PS1:-}" __nqx_ask "$@")" || \return
     \eval "$ask_nqx"
     __nqx_hashr
 }
 
+# Sources the activation scripts precompiled in the environments, without
+# starting Python. Returns 1 if they are missing or stale, in which case
+# the activation must go through `nqx activate` (which refreshes them).
+__nqx_source_scripts() {
+    case "$1" in
+        activate)
+            [ "$#" -eq 2 ] && [ -n "${__NQX_DEPOT:-}" ] || \return 1
+            [ -f "${__NQX_DEPOT}/$2/activate.sh" ] || \return 1
+            if [ -n "${NQX_ENV:-}" ]; then
+                __nqx_source_scripts deactivate || \return 1
+            fi
+            . "${__NQX_DEPOT}/$2/activate.sh"
+            ;;
+        deactivate)
+            [ "$#" -eq 1 ] && [ -n "${NQX_ENV:-}" ] || \return 1
+            [ -f "${VIRTUAL_ENV:-}/deactivate.sh" ] || \return 1
+            . "${VIRTUAL_ENV}/deactivate.sh"
+            ;;
+        *)
+            \return 1
+            ;;
+    esac
+}
+
 __nqx_reactivate() {
     \local ask_nqx
-    ask_nqx="$(PS1="${PS1:-}" __nqx_exe reactivate)" || \return
+    ask_nqx="$(PS1="${PS1:-}" __nqx_ask reactivate)" || \return
     \eval "$ask_nqx"
     __nqx_hashr
 }
@@ -40,10 +78,13 @@ nqx() {
         activate|deactivate)
             __nqx_activate "$@"
             ;;
-        install|update|upgrade|remove|uninstall)
+        create|sync|remove)
             __nqx_exe "$@" || \return
             __nqx_reactivate
             ;;
+        list|run)
+            __nqx_ask "$@"
+            ;;
         *)
             __nqx_exe "$@"
             ;;
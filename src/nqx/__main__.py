@@ -0,0 +1,3 @@
+from nqx.cli import main
+
+main()
@@ -1,15 +1,89 @@
-import typer
+import sys
+from importlib import import_module
 
-from .app import app
-from . import create
-from . import list
-from . import activate
-from . import hook
-from . import setup
+# Commands are registered on the typer `app` when the module defining them is
+# imported. To keep the startup time low, only the module of the invoked command
+# is imported (all of them are imported to render the help).
+COMMANDS = {
+    "create": "create",
+    "create-many": "create",
+    "sync": "create",
+    "remove": "create",
+    "list": "list",
+    "config": "list",
+    "activate": "activate",
+    "deactivate": "activate",
+    "reactivate": "activate",
+    "rebuild-activation": "activate",
+    "run": "activate",
+    "hook": "hook",
+    "init": "hook",
+    "setup": "setup",
+    "prefetch": "prefetch",
+    "lock": "prefetch",
+    "pack": "pack",
+    "unpack": "pack",
+    "du": "du",
+    "dedupe": "du",
+    "gc": "du",
+    "kernel-pool": "kernel",
+    "cache": "cache",
+    "python": "python",
+    "daemon": "daemon",
+}
 
+# Commands served by the typer-free fast path in `nqx.cli.shell`, with their
+# number of arguments. Anything else (options, --help...) goes through typer,
+# except `nqx run NAME ...` whose arguments belong to the command it runs.
+SHELL_COMMANDS = {"activate": 1, "deactivate": 0, "reactivate": 0}
 
-def main():
-    app()
+
+# Global options (of `nqx.cli.app.main`) followed by a value
+VALUE_OPTIONS = ("--trace",)
+
+
+def _find_command(argv):
+    args = iter(argv)
+    for arg in args:
+        if arg in VALUE_OPTIONS:
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def load_commands(command=None):
+    """
+    Register the commands on the typer app, importing only the module defining
+    `command` if it is known, or all of them otherwise.
+    """
+    if command in COMMANDS:
+        modules = [COMMANDS[command]]
+    else:
+        modules = list(dict.fromkeys(COMMANDS.values()))
+
+    for module in modules:
+        import_module(f"{__name__}.{module}")
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    command = _find_command(argv)
+    if (
+        command in SHELL_COMMANDS
+        and len(argv) == SHELL_COMMANDS[command] + 1
+        and not any(arg.startswith("-") for arg in argv)
+    ) or (argv[:1] == ["run"] and len(argv) > 1 and not argv[1].startswith("-")):
+        from .shell import main as shell_main
+
+        return shell_main(argv)
+
+    from .app import app
+
+    load_commands(command)
+    app(args=argv)
 
 
 if __name__ == "__main__":
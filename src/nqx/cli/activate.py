@@ -1,79 +1,35 @@
-from typing import Annotated
-import os
-import logging
+from typing import Annotated, Optional
 
-from rich import print
+import rich
 import typer
 
-from nqx.core import EnvConfig, VenvProviderType, EnvType
-from nqx.providers import get_venv_provider, get_python_provider
+from nqx.core import VenvProviderType
+from nqx.providers import get_venv_provider
 
 from .config import get_config
 from .app import app
+from . import shell
+from .shell import (
+    activate_lines,
+    deactivate_lines,
+    reactivate_lines,
+    write_activation_scripts,
+)
 
 
 @app.command(no_args_is_help=True)
 def activate(
     name: Annotated[str, typer.Argument(help="The name of the environment.")],
+    stack: Annotated[
+        bool,
+        typer.Option(help="Keep the current environment, below this one."),
+    ] = False,
 ):
     """
-    Create a new environment with NAME of type TYPE
+    Activate the environment NAME
     """
-    config = get_config()
-
-    # Create EnvConfig
-    env_config = EnvConfig(env={})
-
-    ###############################################################
-    # Check if a nqx environment is already loaded. In which case,
-    # we need to deactivate it first
-    current_env = os.environ.get("NQX_ENV", None)
-    if current_env is not None:
-        deactivate()
-
-    ###############################################################
-    # Get Python : not needed for activating the environment as
-    # it is set by the virtualenv activation script
-    python_provider = get_python_provider()
-    env_config = python_provider.get_env_with_python(env_config)
-
-    ###############################################################
-    # Create the virtual environment
-    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
-    venv_depot = config["venv_location"]
-    env_config = provider.activate_env(
-        name, venv_depot=venv_depot, environment=env_config
-    )
-
-    ###############################################################
-    # Setup env variables
-    type = EnvType(provider.get_env_config(name, venv_depot, "type"))
-    env_config.update(config["configurations"][type.value].get("env", {}))
-
-    ###############################################################
-    #
-    for k, v in env_config.env.items():
-        print(f'export {k}="{v}"')
-    print(f'export NQX_ENV="{name}"')
-
-    ###############################################################
-    # Setup modules
-    modules_to_load = config["configurations"][type.value].get("modules", [])
-    logging.debug("Must load modules: %s", modules_to_load)
-    if len(modules_to_load) > 0:
-        logging.debug("Loading modules")
-        # env_config = modules.load_modules(*modules_to_load, environment=env_config)
-        cmd = "module load " + " ".join(modules_to_load)
-        print(cmd)
-
-    # PS1
-    ps1 = os.getenv("PS1", "")
-    if "POWERLINE_COMMAND" in ps1:
-        # defer
-        pass
-    else:
-        print("""export _NQX_PS1_BACKUP="$PS1" """)
-        print(f"""PS1="(nqx:{name}) $PS1" """)
+    # Printed without rich, as the output is evaluated by the shell
+    print("\n".join(activate_lines(name, stack=stack)))
 
 
 @app.command()
@@ -81,50 +37,65 @@ def deactivate():
     """
     Disable the current environment
     """
-    config = get_config()
-
-    # Create EnvConfig
-    # env_config = EnvConfig(env={})
+    print("\n".join(deactivate_lines()))
 
-    ###############################################################
-    # Get Python : not needed for activating the environment as
-    # it is set by the virtualenv activation script
-    # python_provider = get_python_provider()
-    # env_config = python_provider.get_env_with_python(env_config)
 
-    ###############################################################
-    # Create the virtual environment
-    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
-    venv_depot = config["venv_location"]
-    disable_lines = provider.deactivate_env(venv_depot)
-    for line in disable_lines:
-        print(line)
+@app.command()
+def reactivate():
+    """
+    Activate the current environments again, after they changed
+    """
+    print("\n".join(reactivate_lines()))
 
-    ###############################################################
-    # remove env variables
-    # Check what is the current environment
-    current_env = os.environ.get("NQX_ENV", None)
 
-    if current_env is not None:
-        type = EnvType(provider.get_env_config(current_env, venv_depot, "type"))
-        env_variables = config["configurations"][type.value].get("env", {})
-        for k in env_variables.keys():
-            print(f"unset {k}")
-        print("unset NQX_ENV")
+@app.command(
+    no_args_is_help=True,
+    context_settings={"allow_extra_args": True, "ignore_unknown_options": True},
+)
+def run(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+    command: Annotated[
+        list[str], typer.Argument(help="The command to run, after `--`.")
+    ],
+):
+    """
+    Run COMMAND in the environment NAME, without activating it
+    """
+    raise typer.Exit(shell.run(name, command))
 
-        ###############################################################
-        # unload modules
-        modules_to_load = config["configurations"][type.value].get("modules", [])
-        if len(modules_to_load) > 0:
-            # env_config = modules.load_modules(*modules_to_load, environment=env_config)
-            cmd = "module unload " + " ".join(modules_to_load)
-            print(cmd)
 
-    # psi1
-    ps1 = os.getenv("PS1", "")
-    old_psi1 = os.getenv("_NQX_PS1_BACKUP", None)
-    if "POWERLINE_COMMAND" in ps1:
-        # defer
-        pass
-    elif old_psi1 is not None:
-        print("""PS1="$_NQX_PS1_BACKUP" """)
+@app.command()
+def rebuild_activation(
+    name: Annotated[
+        Optional[str],
+        typer.Argument(help="The name of the environment (default: all of them)."),
+    ] = None,
+    kernel_only: Annotated[
+        bool,
+        typer.Option(
+            help="Only regenerate the kernel launchers, which do not depend on "
+            "the modules loaded in this shell."
+        ),
+    ] = False,
+):
+    """
+    Regenerate the precompiled activation scripts of the environments
+    """
+    config = get_config()
+    if name is None:
+        provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+        names = [env for env, _ in provider.list_envs(config["venv_location"])]
+    else:
+        names = [name]
+
+    for name in names:
+        try:
+            if kernel_only:
+                path = shell.write_kernel_launcher(name, config)
+            else:
+                path, _ = write_activation_scripts(name, config)
+        except (ValueError, FileNotFoundError) as err:
+            rich.print(f"[yellow]Skipping {name}: {err}")
+            continue
+        if path is not None:
+            rich.print(f"Written {path}")
@@ -1,17 +1,31 @@
-from typing import Annotated
+from typing import Annotated, Optional
+from pathlib import Path
 import logging
+import sys
 
 import typer
 
-from .config import get_config
+from .config import get_config, get_nqx_home
 
 app = typer.Typer(no_args_is_help=True)
 
 
 @app.callback()
 def main(
+    ctx: typer.Context,
     verbose: Annotated[bool, typer.Option(help="Verbose output")] = False,
     debug: Annotated[bool, typer.Option(help="Debug output")] = False,
+    trace_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--trace",
+            help="Write the timings of the phases and subprocesses as a Chrome trace.",
+        ),
+    ] = None,
+    trace_log: Annotated[
+        Optional[bool],
+        typer.Option(help="Append the timings to $NQX_HOME/logs/trace.jsonl."),
+    ] = None,
 ):
     """
     CLI for everything related to the Neural Quantum Group @ X.
@@ -23,5 +37,43 @@ def main(
     config["verbose"] = verbose
     config["debug"] = debug
 
+    if trace_log is None:
+        trace_log = config.get("trace_log", False)
+    if trace_file is not None or trace_log:
+        start_trace(ctx, trace_file, trace_log)
+
     config["app_dir"] = typer.get_app_dir("NQX")
     logging.debug("app dir: %s", config["app_dir"])
+
+
+def start_trace(ctx: typer.Context, trace_file: Optional[Path], trace_log: bool):
+    """
+    Trace the command, and write the trace when it ends.
+    """
+    from nqx.utils import trace
+
+    def finish():
+        events = trace.stop()
+        if trace_file is not None:
+            trace.write(trace_file, events)
+        if trace_log:
+            path = get_nqx_home() / "logs" / "trace.jsonl"
+            trace.append_log(path, sys.argv[1:], events, get_config().cluster)
+        print_trace_summary(events)
+
+    trace.start()
+    # Closed in reverse order: the span of the command ends first
+    ctx.call_on_close(finish)
+    ctx.with_resource(trace.span(ctx.invoked_subcommand or "nqx", "command"))
+
+
+def print_trace_summary(events: list):
+    from rich.console import Console
+    from rich.table import Table
+
+    from nqx.utils import trace
+
+    table = Table("span", "kind", "count", "seconds", title="Timings")
+    for name, total, count, category in trace.summary(events):
+        table.add_row(name, category, str(count), f"{total:.3f}")
+    Console(stderr=True).print(table)
@@ -0,0 +1,119 @@
+from typing import Annotated, Optional
+import shutil
+import subprocess
+import time
+
+from rich import print
+from rich.table import Table
+import typer
+
+from nqx.providers.venv.uv import cache as uv_cache
+from nqx.utils import disk
+
+from .config import get_config
+from .app import app
+from .du import format_size, parse_duration, parse_size, select_evictions
+
+cache_app = typer.Typer(no_args_is_help=True)
+app.add_typer(cache_app, name="cache", help="The package cache of uv.")
+
+
+@cache_app.command()
+def info():
+    """
+    Show where the uv cache is, its size and whether it can hardlink
+    """
+    config = get_config()
+    try:
+        mode = uv_cache.link_mode()
+    except ValueError as err:
+        print(f"[red]{err}")
+        raise typer.Exit(1)
+
+    root = uv_cache.cache_dir()
+    table = Table("", "")
+    table.add_row("location", str(root))
+    table.add_row("link mode", mode or "uv default")
+    max_size = uv_cache.cache_settings().get("max_size", None)
+    table.add_row("size limit", str(max_size) if max_size is not None else "none")
+    if root.exists():
+        usage = disk.disk_usage({"cache": root})["cache"]
+        table.add_row("size", format_size(usage["size"]))
+        table.add_row("shared with environments", format_size(usage["shared_size"]))
+    table.add_row(
+        "same device as the environments",
+        "yes" if uv_cache.same_device(config["venv_location"]) else "[red]no",
+    )
+    print(table)
+
+    warning = uv_cache.check_cache(config["venv_location"])
+    if warning is not None:
+        print(f"[yellow]{warning}")
+
+
+@cache_app.command()
+def prune(
+    max_size: Annotated[
+        Optional[str],
+        typer.Option(help="Size to keep the cache under (default: uv_cache.max_size)."),
+    ] = None,
+    older_than: Annotated[
+        Optional[str],
+        typer.Option(help="Remove the entries unused for this long (e.g. 30d)."),
+    ] = None,
+    dry_run: Annotated[
+        bool, typer.Option(help="Only show what would be removed.")
+    ] = False,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Number of entries scanned at once."),
+    ] = None,
+):
+    """
+    Remove the unused and least recently used entries of the uv cache
+    """
+    from nqx.providers.venv.uv.setup import UV_BIN, is_installed
+
+    if max_size is None:
+        max_size = uv_cache.cache_settings().get("max_size", None)
+
+    # Entries no longer referenced by uv itself
+    if not dry_run and is_installed():
+        result = subprocess.run(
+            [UV_BIN, "cache", "prune"], env=uv_cache.uv_environment()
+        )
+        if result.returncode != 0:
+            print("[red]uv cache prune failed")
+            raise typer.Exit(1)
+
+    if max_size is None and older_than is None:
+        return
+
+    entries = uv_cache.cache_entries()
+    ages, usage = uv_cache.scan_entries(entries, jobs)
+    evicted = select_evictions(
+        ages,
+        usage,
+        max_size=None if max_size is None else parse_size(str(max_size)),
+        older_than=None if older_than is None else parse_duration(older_than),
+    )
+
+    freed = sum(usage[name]["size"] - usage[name]["shared_size"] for name in evicted)
+    verb = "Would remove" if dry_run else "Removed"
+    if dry_run:
+        table = Table("entry", "last used", "size")
+        for name in evicted:
+            table.add_row(
+                name,
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(ages[name])),
+                format_size(usage[name]["size"]),
+            )
+        print(table)
+    else:
+        for name in evicted:
+            path = entries[name]
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+    print(f"{verb} {len(evicted)} cache entries, freeing {format_size(freed)}")
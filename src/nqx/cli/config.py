@@ -1,6 +1,5 @@
 import logging
 
-import typer
 import json
 import socket
 import os
@@ -8,6 +7,7 @@ import os
 from pathlib import Path
 
 from nqx.utils import resolve_env_vars
+from nqx.utils.path import env_var_names
 
 SEARCH_PATHS = [
     "$NQX_HOME",
@@ -15,6 +15,9 @@ SEARCH_PATHS = [
     "$NQX_INTERNAL_CONFIG/config",
 ]
 
+# Bump when the layout of the compiled configuration changes
+CONFIG_CACHE_VERSION = 1
+
 _config = None
 
 
@@ -23,6 +26,13 @@ class ConfigDict(dict):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Paths inspected while loading, whose changes invalidate the config
+        self.sources = []
+        # Names of the known clusters, and the one matching this hostname
+        self.clusters = []
+        self.cluster = None
+        # Environment variables used to resolve the search paths
+        self.env_vars = set()
 
     def set_env(self, key, value):
         if "env" not in self:
@@ -38,8 +48,11 @@ class ConfigDict(dict):
 
 def get_config():
     global _config
+    if _config is None:
+        _config = read_config_cache()
     if _config is None:
         _config = _load_config()
+        write_config_cache(_config)
     return _config
 
 
@@ -53,21 +66,29 @@ def _load_config():
     logging.debug("Searching in %s", SEARCH_PATHS)
 
     for path in reversed(SEARCH_PATHS):
+        config.env_vars.update(env_var_names(path))
+        for value in config.get("env", {}).values():
+            config.env_vars.update(env_var_names(str(value)))
         path = resolve_env_vars(path, config.get("env", {}))
         logging.debug("Inspecting %s", path)
 
         # load main config file
+        config.sources.append(path / "config.json")
         maybe_load_config_file(path / "config.json", config)
 
         # check cluster specific configurations
         clusters_path = path / "clusters"
+        config.sources.append(clusters_path)
         if clusters_path.exists():
             logging.debug("Found clusters path %s", clusters_path)
             hostname = socket.gethostname()
             for cluster in os.listdir(clusters_path):
                 cluster_name = os.path.splitext(cluster)[0]
+                config.clusters.append(cluster_name)
                 if hostname.startswith(cluster_name):
                     cluster_path = clusters_path / cluster
+                    config.sources.append(cluster_path)
+                    config.cluster = cluster_name
                     maybe_load_config_file(cluster_path, config)
                     break
     return config
@@ -81,6 +102,8 @@ def maybe_load_config_file(path, config):
         with open(path) as f:
             data = json.load(f)
     except json.JSONDecodeError:
+        import typer
+
         print(f"Invalid configuration file {path} (not valid Json).")
         raise typer.Exit()
 
@@ -89,6 +112,126 @@ def maybe_load_config_file(path, config):
     return
 
 
+def get_nqx_home() -> Path:
+    config = get_config()
+    nqx_home = resolve_env_vars("$NQX_HOME", config.get("env", {}))
+    if str(nqx_home) == ".":
+        nqx_home = Path.home() / ".nqx"
+    return nqx_home
+
+
+def get_cache_dir(*parts: str) -> Path:
+    """
+    Directory under $NQX_HOME/cache where nqx stores data derived from the
+    configuration and the environment (it can be deleted at any time).
+    """
+    return get_nqx_home().joinpath("cache", *parts)
+
+
+###############################################################
+# Compiled configuration
+#
+# The merged configuration is cached in a single file together with the state
+# (mtime and size) of every file and directory inspected to build it, the
+# environment variables used to find them and the cluster selected by the
+# hostname. Loading it from the cache costs one stat per source and one read.
+
+
+def config_cache_path() -> Path:
+    """
+    Path of the compiled configuration.
+
+    It lives in $NQX_HOME/cache, or in the default NQX_HOME if the variable is
+    not set, as resolving it requires loading the configuration.
+    """
+    nqx_home = os.environ.get("NQX_HOME") or os.path.join(
+        os.path.expanduser("~"), ".nqx"
+    )
+    return Path(nqx_home) / "cache" / "config.json"
+
+
+def _stat_sources(paths) -> list:
+    state = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            state.append([str(path), st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            state.append([str(path), None, None])
+    return state
+
+
+def _selects_cluster(hostname: str, clusters: list, cluster) -> bool:
+    """
+    Whether HOSTNAME selects the same cluster configuration as the one cached.
+    """
+    if cluster is not None:
+        return hostname.startswith(cluster)
+    return not any(hostname.startswith(c) for c in clusters)
+
+
+def config_state(config: ConfigDict) -> list:
+    """
+    The state of the sources and environment variables CONFIG was loaded from,
+    for processes that keep it loaded: it must be loaded again once it differs.
+    """
+    environ = {k: os.environ.get(k) for k in sorted(config.env_vars)}
+    return [_stat_sources(config.sources), environ]
+
+
+def read_config_cache():
+    """
+    Returns the compiled configuration, or None if it is missing or stale.
+    """
+    path = config_cache_path()
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        logging.debug("No compiled configuration in %s", path)
+        return None
+
+    if cache.get("version") != CONFIG_CACHE_VERSION:
+        return None
+    if any(os.environ.get(k) != v for k, v in cache["environ"].items()):
+        logging.debug("Compiled configuration stale: environment changed")
+        return None
+    if _stat_sources(s[0] for s in cache["sources"]) != cache["sources"]:
+        logging.debug("Compiled configuration stale: sources changed")
+        return None
+    if not _selects_cluster(socket.gethostname(), cache["clusters"], cache["cluster"]):
+        logging.debug("Compiled configuration stale: different cluster")
+        return None
+
+    config = ConfigDict(cache["config"])
+    config.sources = [Path(s[0]) for s in cache["sources"]]
+    config.clusters = cache["clusters"]
+    config.cluster = cache["cluster"]
+    config.env_vars = set(cache["environ"])
+    logging.debug("Loaded compiled configuration %s", path)
+    return config
+
+
+def write_config_cache(config: ConfigDict):
+    path = config_cache_path()
+    cache = {
+        "version": CONFIG_CACHE_VERSION,
+        "environ": {k: os.environ.get(k) for k in sorted(config.env_vars)},
+        "sources": _stat_sources(config.sources),
+        "clusters": config.clusters,
+        "cluster": config.cluster,
+        "config": config,
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logging.debug("Could not write the compiled configuration: %s", err)
+
+
 def get_requirements_file_for_type(requirement_file_name: Path) -> Path:
     config = get_config()
 
@@ -1,19 +1,157 @@
-from typing import Annotated
+from typing import Annotated, Optional
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
+import subprocess
+import sys
+import time
 import os
 import logging
 import json
-import re
 
 from rich import print
 import typer
 
-from nqx.core import EnvConfig, EnvType, VenvProviderType
-from nqx.providers import get_venv_provider, get_python_provider, modules
+from nqx.core import EnvConfig, EnvDelta, EnvType, VenvProviderType
+from nqx.providers import get_venv_provider, get_python_provider
+from nqx.providers.modules import snapshot
+from nqx.utils import resolve_env_vars, trace
 
-from .config import get_config, get_requirements_file_for_type
+from .config import get_config, get_nqx_home, get_requirements_file_for_type
 from .app import app
+from .shell import (
+    KERNEL_LAUNCHER,
+    refresh_activation_scripts,
+    write_activation_scripts,
+)
+
+
+def set_pycache_prefix(
+    provider, name, venv_depot, type: EnvType, config, pycache_prefix=None
+):
+    """
+    Store the PYTHONPYCACHEPREFIX policy of NAME: PYCACHE_PREFIX if given, or
+    the `pycache_prefix` of its configuration, if any.
+    """
+    if pycache_prefix is None:
+        pycache_prefix = config["configurations"][type.value].get("pycache_prefix", None)
+    if pycache_prefix is not None:
+        provider.set_env_config(name, venv_depot, "pycache_prefix", pycache_prefix)
+
+
+def compile_bytecode(provider, name, venv_depot, env_config: EnvConfig):
+    """
+    Byte-compile the packages of NAME, unless it has a PYTHONPYCACHEPREFIX
+    policy: Python would then only look for the bytecode in the prefix.
+    """
+    if provider.get_env_config(name, venv_depot, "pycache_prefix", None) is not None:
+        print("[yellow]Not compiling the bytecode, as the pycache prefix is used instead")
+        return
+    with trace.span("compile bytecode"):
+        provider.compile_bytecode(name, venv_depot, environment=env_config)
+
+
+def capture_modules(env_config: EnvConfig, type: EnvType, config) -> EnvDelta:
+    """
+    The changes made by loading the modules of the configuration TYPE in
+    ENV_CONFIG, with the environment variables of TYPE set.
+    """
+    modules_to_load = config["configurations"][type.value].get("modules", [])
+    if len(modules_to_load) == 0:
+        return EnvDelta()
+
+    env_config = env_config.copy()
+    env_config.update(config["configurations"][type.value].get("env", {}))
+    logging.debug("Loading modules")
+    with trace.span("load modules", modules=modules_to_load):
+        _, modules_delta = snapshot.get_snapshot(
+            *modules_to_load, environment=env_config
+        )
+    return modules_delta
+
+
+def configure_environment(
+    env_config: EnvConfig, type: EnvType, config, modules_delta: EnvDelta = None
+):
+    """
+    Set the environment variables and load the modules of the configuration
+    TYPE, or apply their MODULES_DELTA if already captured. Returns the new
+    environment and the changes made by the modules.
+    """
+    if modules_delta is None:
+        modules_delta = capture_modules(env_config, type, config)
+    env_config.update(config["configurations"][type.value].get("env", {}))
+    if len(modules_delta) > 0:
+        env_config = EnvConfig(env=modules_delta.apply(env_config.env))
+    return env_config, modules_delta
+
+
+def jupyter_kernels_dir() -> Path:
+    """
+    The directory of the kernels of the user, as `ipykernel install --user`.
+    """
+    data_dir = os.environ.get("JUPYTER_DATA_DIR", None)
+    if data_dir is None:
+        xdg_data_home = os.environ.get("XDG_DATA_HOME", None)
+        if not xdg_data_home:
+            xdg_data_home = Path.home() / ".local" / "share"
+        data_dir = Path(xdg_data_home) / "jupyter"
+    return Path(data_dir) / "kernels"
+
+
+def write_kernel_spec(name: str, venv_path: Path, staging_path: Path):
+    """
+    Write the kernelspec of NAME, like `ipykernel install --user` but started
+    by the nqx launcher, in STAGING_PATH: it is moved to the directory of the
+    kernels by `install_kernel_spec` once the environment is complete. It does
+    not need ipykernel to be installed yet.
+    """
+    kernel_path = jupyter_kernels_dir() / name.lower()
+    staging_path.mkdir(parents=True, exist_ok=True)
+
+    # The launcher is written with the activation scripts
+    argv = [str(kernel_path / KERNEL_LAUNCHER), str(venv_path / "bin" / "python")]
+    argv += ["-m", "ipykernel_launcher", "-f", "{connection_file}"]
+    kernel_config = {
+        "argv": argv,
+        "display_name": f"NQX:Python ({name})",
+        "language": "python",
+        "metadata": {"debugger": True},
+        "env": {
+            "MODULESHOME": os.environ.get("MODULESHOME", ""),
+            "MODULEPATH": os.environ.get("MODULEPATH", ""),
+        },
+    }
+    with open(staging_path / "kernel.json", "w") as f:
+        json.dump(kernel_config, f, indent=1)
+
+
+def install_kernel_spec(name: str, staging_path: Path) -> Path:
+    """
+    Move the kernelspec of NAME written in STAGING_PATH in place, replacing the
+    previous one. Returns its directory.
+    """
+    kernel_path = jupyter_kernels_dir() / name.lower()
+    if kernel_path.exists():
+        shutil.rmtree(kernel_path)
+    kernel_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(staging_path, kernel_path)
+    logging.debug("Kernel installed in %s", kernel_path)
+    return kernel_path
+
+
+def copy_kernel_resources(kernel_path: Path, venv_path: Path) -> bool:
+    """
+    Copy the logos of ipykernel to the kernelspec. Returns False if ipykernel
+    is not installed in the environment.
+    """
+    resources = sorted(venv_path.glob("lib/python*/site-packages/ipykernel/resources"))
+    if len(resources) == 0:
+        return False
+    for path in resources[-1].iterdir():
+        if path.is_file():
+            shutil.copy(path, kernel_path / path.name)
+    return True
 
 
 @app.command(no_args_is_help=True)
@@ -38,6 +176,15 @@ def create(
         VenvProviderType, typer.Option(help="The provider to use for the environment.")
     ] = VenvProviderType.auto,
     force: Annotated[bool, typer.Option(help="Force override.")] = False,
+    precompile: Annotated[
+        bool, typer.Option(help="Byte-compile the packages, using all cores.")
+    ] = True,
+    pycache_prefix: Annotated[
+        Optional[str],
+        typer.Option(
+            help="PYTHONPYCACHEPREFIX set on activation, like '$TMPDIR/pycache'."
+        ),
+    ] = None,
 ):
     """
     Create a new environment with NAME of type TYPE
@@ -51,7 +198,8 @@ def create(
     # Get Python
     python_provider = get_python_provider()
 
-    env_config = python_provider.get_env_with_python(env_config)
+    with trace.span("get python"):
+        env_config = python_provider.get_env_with_python(env_config)
 
     ###############################################################
     # Create the virtual environment
@@ -60,31 +208,37 @@ def create(
 
     provider = get_venv_provider(provider)
     venv_depot = config["venv_location"]
-
-    if not skip_create:
-        env_config = provider.create_env(
-            name, type, venv_depot=venv_depot, force=force, environment=env_config
-        )
-    else:
-        print("Skipping environment creation")
-        env_config = provider.activate_env(
-            name, venv_depot=venv_depot, environment=env_config
-        )
+    venv_path = resolve_env_vars(venv_depot) / name
+
+    warning = provider.check_cache(venv_depot)
+    if warning is not None:
+        print(f"[yellow]{warning}")
+
+    # The modules are captured while the virtual environment is created
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        modules_future = executor.submit(capture_modules, env_config.copy(), type, config)
+        if not skip_create:
+            with trace.span("create venv"):
+                env_config = provider.create_env(
+                    name, type, venv_depot=venv_depot, force=force, environment=env_config
+                )
+        else:
+            print("Skipping environment creation")
+            env_config = provider.activate_env(
+                name, venv_depot=venv_depot, environment=env_config
+            )
+        modules_delta = modules_future.result()
 
     ###############################################################
     # Write the nqx tag file to store the env type
     provider.set_env_config(name, venv_depot, "type", type.value)
+    if not skip_create:
+        provider.set_env_config(name, venv_depot, "created", time.time())
+    set_pycache_prefix(provider, name, venv_depot, type, config, pycache_prefix)
 
     ###############################################################
-    # Setup env variables
-    env_config.update(config["configurations"][type.value].get("env", {}))
-
-    ###############################################################
-    # Setup modules
-    modules_to_load = config["configurations"][type.value].get("modules", [])
-    if len(modules_to_load) > 0:
-        logging.debug("Loading modules")
-        env_config = modules.load_modules(*modules_to_load, environment=env_config)
+    # Setup env variables and modules
+    env_config, _ = configure_environment(env_config, type, config, modules_delta)
 
     ###############################################################
     # Install python packages
@@ -96,94 +250,321 @@ def create(
         print(f"Requirements file {requirements_file} does not exist")
         typer.Exit(1)
 
-    # install packages using pip
+    # install packages using pip, with ipykernel resolved together with them,
+    # while the kernelspec is written
     print("installing packages")
-    provider.install_packages(
-        name, file=requirements_file, venv_depot=venv_depot, environment=env_config
-    )
+    packages = ["ipykernel"] if kernel else []
+    # Out of the directory of the kernels, where Jupyter would find it
+    staging_path = jupyter_kernels_dir().parent / f"nqx-kernel.tmp{os.getpid()}"
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            if kernel:
+                kernel_future = executor.submit(
+                    write_kernel_spec, name, venv_path, staging_path
+                )
+            with trace.span("install packages"):
+                provider.install_packages(
+                    name,
+                    *packages,
+                    file=requirements_file,
+                    venv_depot=venv_depot,
+                    environment=env_config,
+                )
+            if kernel:
+                kernel_future.result()
+    except BaseException:
+        # No kernel is left for an environment that could not be installed
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
     print("installed")
 
+    if precompile:
+        print("compiling bytecode")
+        compile_bytecode(provider, name, venv_depot, env_config)
+
     ###############################################################
-    # Create the iPyKernel kernel
+    # Complete the iPyKernel kernel
     if kernel:
-        print("Creating kernel")
-        provider.install_packages(
-            name, "ipykernel", venv_depot=venv_depot, environment=env_config
-        )
-        result = provider.run_python_command(
-            name,
-            [
-                "-m",
-                "ipykernel",
-                "install",
-                "--user",
-                "--name",
-                name,
-                "--display-name",
-                f"NQX:Python ({name})",
-            ],
-            venv_depot=venv_depot,
-            environment=env_config,
-            capture_output=True,
+        if not copy_kernel_resources(staging_path, venv_path):
+            print("[yellow]ipykernel is not installed in the environment")
+        base_path = install_kernel_spec(name, staging_path)
+        print(f"Installed the kernel in {base_path}")
+
+        # Remember us where it is located
+        provider.set_env_config(name, venv_depot, "kernel_path", str(base_path))
+
+    ###############################################################
+    # Precompile the activation scripts and the kernel launcher, now that
+    # nqx_config.json is final
+    with trace.span("activation scripts"):
+        write_activation_scripts(name, config)
+    provider.update_registry(name, venv_depot)
+
+
+@app.command(no_args_is_help=True)
+def sync(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+    *,
+    upgrade: Annotated[
+        bool, typer.Option(help="Resolve the requirements again.")
+    ] = False,
+    precompile: Annotated[
+        bool, typer.Option(help="Byte-compile the packages, using all cores.")
+    ] = True,
+    pycache_prefix: Annotated[
+        Optional[str],
+        typer.Option(
+            help="PYTHONPYCACHEPREFIX set on activation, like '$TMPDIR/pycache'."
+        ),
+    ] = None,
+):
+    """
+    Update the environment NAME to its requirements and configuration
+    """
+    config = get_config()
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    venv_depot = config["venv_location"]
+
+    try:
+        type = EnvType(provider.get_env_config(name, venv_depot, "type"))
+    except (FileNotFoundError, ValueError) as err:
+        print(f"[red]Cannot synchronize {name}: {err}")
+        raise typer.Exit(1)
+
+    set_pycache_prefix(provider, name, venv_depot, type, config, pycache_prefix)
+
+    with trace.span("get python"):
+        env_config = get_python_provider().get_env_with_python(
+            EnvConfig(env=os.environ.copy())
         )
+    env_config = provider.activate_env(name, venv_depot=venv_depot, environment=env_config)
+    env_config, _ = configure_environment(env_config, type, config)
+
+    ###############################################################
+    # Install and remove only the packages that changed
+    file_subpath = config["configurations"][type.value]["requirements"]
+    requirements_file = get_requirements_file_for_type(file_subpath)
+    kernel_path = provider.get_env_config(name, venv_depot, "kernel_path", None)
+    packages = ["ipykernel"] if kernel_path is not None else []
 
-        output = result.stdout.decode("utf-8").strip()
+    try:
+        with trace.span("sync packages"):
+            changed = provider.sync_packages(
+                name,
+                *packages,
+                file=requirements_file,
+                venv_depot=venv_depot,
+                environment=env_config,
+                upgrade=upgrade,
+            )
+    except (RuntimeError, FileNotFoundError) as err:
+        print(f"[red]{err}")
+        raise typer.Exit(1)
+    print("Synchronized packages" if changed else "Packages are up to date")
+    if changed and precompile:
+        compile_bytecode(provider, name, venv_depot, env_config)
 
-        match = re.search(r"in (.*)", output)
-        if match:
-            base_path = match.group(1)
-            logging.debug("Kernel installed in %s", base_path)
+    ###############################################################
+    # Refresh the activation scripts and kernel launcher, if they changed
+    if refresh_activation_scripts(name, config):
+        print("Updated the activation scripts")
+    provider.update_registry(name, venv_depot)
 
-        base_path = Path(base_path)
 
-        script_path = base_path / "launch_kernel"
-        with open(script_path, "w") as f:
-            f.write(modules.generate_module_bash_script(*modules_to_load, environment=env_config))
-        
-        os.chmod(str(script_path), os.stat(str(script_path)).st_mode | 0o111)
+###############################################################
+# Parallel creation
+#
+# Every environment is built by its own `nqx create` process, so that the module
+# captures, the resolutions and the installations of different environments run
+# concurrently. The processes inherit the same environment and therefore share
+# the uv cache, which is safe to use concurrently.
 
 
-        kernel_path = base_path / "kernel.json"
-        with open(kernel_path) as f:
-            kernel_config = json.load(f)
-        _env = kernel_config.get("env", {})
-        #_env["PYTHONSTARTUP"] = str(base_path / "startup.py")
-        _env["MODULESHOME"] = os.environ.get("MODULESHOME", "")
-        _env["MODULEPATH"] = os.environ.get("MODULEPATH", "")
-        kernel_config["env"] = _env
+def parse_env_specs(specs: list[str], types: list[EnvType]) -> list[tuple[str, EnvType]]:
+    """
+    The (name, type) of the environments to build from SPECS, which are either
+    `name:type` or `name`. The latter is built for all TYPES, with the type
+    appended to its name if there are several of them. Raises a ValueError if
+    several environments have the same name.
+    """
+    envs = []
+    for spec in specs:
+        name, _, type = spec.partition(":")
+        if type:
+            envs.append((name, EnvType(type)))
+        elif len(types) == 1:
+            envs.append((name, types[0]))
+        else:
+            envs.extend((f"{name}-{t.value}", t) for t in types)
+
+    names = [name for name, _ in envs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if len(duplicates) > 0:
+        raise ValueError(f"Environments given several times: {', '.join(duplicates)}")
+    return envs
+
+
+def _create_command(name: str, type: EnvType, options: list[str]) -> list[str]:
+    return [sys.executable, "-m", "nqx", "create", name, type.value, *options]
+
+
+def _build_env(name, type, options, log_path: Path, env: dict):
+    start = time.monotonic()
+    with open(log_path, "w") as log:
+        result = subprocess.run(
+            _create_command(name, type, options),
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env=env,
+        )
+    return result.returncode, time.monotonic() - start
 
-        kernel_config["argv"] = [str(script_path)] + kernel_config["argv"]
-        with open(kernel_path, "w") as f:
-            json.dump(kernel_config, f)
-        print("edited kernel at ", kernel_path)
 
-        # Remember us where it is located
-        provider.set_env_config(name, venv_depot, "kernel_path", str(base_path))
+def create_envs(
+    envs: list[tuple[str, EnvType]],
+    options: list[str],
+    *,
+    jobs: int,
+    log_dir: Path,
+) -> dict:
+    """
+    Build the environments ENVS with at most JOBS concurrent `nqx create`
+    processes, writing the output of each in LOG_DIR. Returns the return code
+    and the duration of each build.
+    """
+    from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
+    log_dir.mkdir(parents=True, exist_ok=True)
+    env = os.environ.copy()
+
+    results = {}
+    with Progress(
+        SpinnerColumn(), TextColumn("{task.description}"), TimeElapsedColumn()
+    ) as progress:
+        tasks = {
+            name: progress.add_task(f"{name} ({type.value}): queued", total=1)
+            for name, type in envs
+        }
+
+        def build(name, type):
+            progress.update(tasks[name], description=f"{name} ({type.value}): building")
+            returncode, duration = _build_env(
+                name, type, options, log_dir / f"{name}.log", env
+            )
+            status = "done" if returncode == 0 else "[red]failed"
+            progress.update(
+                tasks[name], description=f"{name} ({type.value}): {status}", completed=1
+            )
+            results[name] = (returncode, duration)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for future in [executor.submit(build, name, type) for name, type in envs]:
+                future.result()
+
+    return results
 
 
 @app.command(no_args_is_help=True)
-def remove(
-    name: Annotated[str, typer.Argument(help="The name of the environment to delete.")],
+def create_many(
+    specs: Annotated[
+        list[str],
+        typer.Argument(help="Environments to create, as NAME or NAME:TYPE."),
+    ],
+    *,
+    types: Annotated[
+        str,
+        typer.Option(help="Comma separated types of the environments given by NAME."),
+    ] = EnvType.cpu.value,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Maximum number of concurrent builds."),
+    ] = None,
+    kernel: Annotated[
+        bool,
+        typer.Option(help="Create the iPyKernel kernel for the environments."),
+    ] = True,
+    provider: Annotated[
+        VenvProviderType, typer.Option(help="The provider to use for the environments.")
+    ] = VenvProviderType.auto,
+    force: Annotated[bool, typer.Option(help="Force override.")] = False,
 ):
     """
-    Remove an environment
+    Create several environments concurrently
     """
+    from rich.table import Table
+
+    try:
+        envs = parse_env_specs(specs, [EnvType(t) for t in types.split(",")])
+    except ValueError as err:
+        print(f"[red]{err}")
+        raise typer.Exit(1)
+
     config = get_config()
+    if provider is VenvProviderType.auto:
+        provider = VenvProviderType(config["venv_provider"])
+    # Install uv here, rather than have every build ask for it
+    venv_provider = get_venv_provider(provider)
+    if hasattr(venv_provider, "is_installed") and not venv_provider.is_installed():
+        venv_provider.install()
+
+    options = ["--provider", provider.value]
+    options.append("--kernel" if kernel else "--no-kernel")
+    if force:
+        options.append("--force")
+
+    if jobs is None:
+        jobs = min(len(envs), os.cpu_count() or 1)
+    log_dir = get_nqx_home() / "logs" / "create"
+
+    results = create_envs(envs, options, jobs=max(jobs, 1), log_dir=log_dir)
+
+    table = Table("name", "type", "status", "time", "log")
+    for name, type in envs:
+        returncode, duration = results[name]
+        status = "[green]ok" if returncode == 0 else f"[red]failed ({returncode})"
+        log = str(log_dir / f"{name}.log") if returncode != 0 else ""
+        table.add_row(name, type.value, status, f"{duration:.1f}s", log)
+    print(table)
+
+    failed = [name for name, (returncode, _) in results.items() if returncode != 0]
+    if len(failed) > 0:
+        print(f"[red]{len(failed)} of {len(envs)} environments failed: {', '.join(failed)}")
+        raise typer.Exit(1)
+
+
+def remove_environment(name: str, config=None):
+    """
+    Remove the environment NAME, its kernel and its registry entry.
+    """
+    if config is None:
+        config = get_config()
 
     provider = config["venv_provider"]
 
-    venv_depot = Path(config["venv_location"])
+    venv_depot = resolve_env_vars(config["venv_location"])
     provider = get_venv_provider(provider)
 
     kernel_path = provider.get_env_config(name, venv_depot, "kernel_path", None)
-    if kernel_path is not None:
+    if kernel_path is not None and os.path.exists(kernel_path):
         shutil.rmtree(kernel_path)
 
     provider.remove_env(name, venv_depot=venv_depot)
-    print(f"Environment {name} removed")
 
     # final cleanup
     path = venv_depot / name
     if path.exists():
         shutil.rmtree(path)
+    provider.update_registry(name, venv_depot)
+
+
+@app.command(no_args_is_help=True)
+def remove(
+    name: Annotated[str, typer.Argument(help="The name of the environment to delete.")],
+):
+    """
+    Remove an environment
+    """
+    remove_environment(name)
+    print(f"Environment {name} removed")
     return 0
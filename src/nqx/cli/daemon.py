@@ -0,0 +1,165 @@
+from typing import Annotated
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+import io
+import os
+import sys
+
+from rich import print
+import rich
+import typer
+
+from nqx.utils import daemon, memo
+from nqx.utils.kernel_pool import rss
+
+from . import load_commands, main as cli_main
+from . import config as nqx_config
+from .config import get_nqx_home
+from .app import app
+from .du import format_size, parse_duration
+from . import shell
+
+daemon_app = typer.Typer(no_args_is_help=True)
+app.add_typer(
+    daemon_app,
+    name="daemon",
+    help="A resident nqx answering the shell function without starting Python.",
+)
+
+# Stopped when no request came for this long
+DEFAULT_IDLE_TIMEOUT = "8h"
+
+# Commands answered by the daemon, given first (without global options)
+SERVED_COMMANDS = ("activate", "deactivate", "reactivate", "list", "run")
+
+
+@contextmanager
+def _client_process(request: dict):
+    """
+    Run as the client of REQUEST: with its arguments, environment and working
+    directory, capturing the output.
+    """
+    environ = dict(os.environ)
+    cwd = os.getcwd()
+    argv = sys.argv
+    sys.argv = ["nqx", *request["argv"]]
+    os.environ.clear()
+    os.environ.update(request["env"])
+    # Set by nqx for itself when imported
+    os.environ["NQX_INTERNAL_CONFIG"] = environ["NQX_INTERNAL_CONFIG"]
+    try:
+        os.chdir(request["cwd"])
+    except OSError:
+        pass
+    stdout, stderr = io.StringIO(), io.StringIO()
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            yield stdout, stderr
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+        sys.argv = argv
+
+
+class Handler:
+    """
+    Answers the requests of the clients, reloading the configuration when its
+    files or the environment variables it depends on change.
+    """
+
+    def __init__(self):
+        self.config_state = None
+
+    def _refresh_config(self):
+        config = nqx_config._config
+        if config is not None and nqx_config.config_state(config) != self.config_state:
+            nqx_config._config = None
+        self.config_state = nqx_config.config_state(nqx_config.get_config())
+
+    def _run(self, argv: list) -> dict:
+        name, command = shell.run_arguments(argv[1:])
+        if len(command) == 0:
+            return {"fallback": True}
+        command, env = shell.run_command(name, command)
+        return {"exec": command, "env": env}
+
+    def _main(self, argv: list, request: dict) -> int:
+        # Rendered for the terminal of the client
+        tty = request.get("tty", False)
+        rich.reconfigure(force_terminal=tty or None, width=request.get("columns"))
+        try:
+            status = cli_main(argv)
+        except SystemExit as err:
+            status = err.code
+        if status is None:
+            return 0
+        return status if isinstance(status, int) else 1
+
+    def __call__(self, request: dict) -> dict:
+        argv = request["argv"]
+        if len(argv) == 0 or argv[0] not in SERVED_COMMANDS:
+            return {"fallback": True}
+
+        with _client_process(request) as (stdout, stderr):
+            self._refresh_config()
+            if argv[0] == "run":
+                return self._run(argv)
+            status = self._main(argv, request)
+        return {"status": status, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+@daemon_app.command()
+def start(
+    idle_timeout: Annotated[
+        str, typer.Option(help="Stop when no request comes for this long (e.g. 2h).")
+    ] = DEFAULT_IDLE_TIMEOUT,
+):
+    """
+    Start the daemon on this node, in the background
+    """
+    command = [sys.executable, "-m", "nqx", "daemon", "serve"]
+    command += ["--idle-timeout", idle_timeout]
+    log_path = get_nqx_home() / "logs" / "daemon.log"
+    pid = daemon.start(command, log_path)
+    print(f"nqx daemon running as {pid}, logs in {log_path}")
+
+
+@daemon_app.command()
+def stop():
+    """
+    Stop the daemon on this node
+    """
+    if daemon.stop():
+        print("Stopped the nqx daemon")
+    else:
+        print("The nqx daemon is not running")
+
+
+@daemon_app.command()
+def status():
+    """
+    Show whether the daemon runs on this node
+    """
+    pid = daemon.running_pid()
+    if pid is None:
+        print("The nqx daemon is not running")
+        raise typer.Exit(1)
+
+    print(f"nqx daemon running as {pid} ({format_size(rss(pid))}), on {daemon.socket_path()}")
+
+
+@daemon_app.command(hidden=True)
+def serve(
+    idle_timeout: Annotated[
+        str, typer.Option(help="Stop when no request comes for this long (e.g. 2h).")
+    ] = DEFAULT_IDLE_TIMEOUT,
+):
+    """
+    Serve the daemon in the foreground
+    """
+    memo.enable()
+    # Everything the requests need is imported once
+    load_commands()
+    server = daemon.Daemon(Handler(), idle_timeout=parse_duration(idle_timeout))
+    if not daemon.serve(server):
+        print("The nqx daemon is already running")
@@ -0,0 +1,250 @@
+from typing import Annotated, Optional
+import builtins
+import json
+import os
+import re
+import time
+
+from rich import print
+from rich.table import Table
+import typer
+
+from nqx.core import VenvProviderType
+from nqx.providers import get_venv_provider
+from nqx.utils import disk, resolve_env_vars
+
+from .config import get_config
+from .app import app
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def _parse_quantity(value: str, units: dict, what: str) -> float:
+    match = re.fullmatch(r"([0-9.]+)([a-zA-Z]?)", value.strip())
+    if match is None or match.group(2) not in units:
+        raise typer.BadParameter(f"Invalid {what}: {value}")
+    return float(match.group(1)) * units[match.group(2)]
+
+
+def parse_size(value: str) -> int:
+    """
+    A size in bytes from a string like 500M or 1.5G.
+    """
+    return int(_parse_quantity(value.upper().rstrip("B"), SIZE_UNITS, "size"))
+
+
+def parse_duration(value: str) -> float:
+    """
+    A duration in seconds from a string like 12h, 30d or 2w.
+    """
+    return _parse_quantity(value, DURATION_UNITS, "duration")
+
+
+def _depot_envs(names: Optional[list[str]] = None):
+    """
+    The provider, the depot and the paths of the environments NAMES (by
+    default, all of them) by name.
+    """
+    config = get_config()
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    venv_depot = config["venv_location"]
+    if not names:
+        names = sorted(provider.get_registry(venv_depot))
+    depot_path = resolve_env_vars(venv_depot)
+    missing = [name for name in names if not (depot_path / name).is_dir()]
+    if len(missing) > 0:
+        print(f"[red]Unknown environments: {', '.join(missing)}")
+        raise typer.Exit(1)
+    return provider, venv_depot, {name: depot_path / name for name in names}
+
+
+@app.command()
+def du(
+    names: Annotated[
+        Optional[list[str]],
+        typer.Argument(help="The environments (default: all of them)."),
+    ] = None,
+    json_output: Annotated[
+        bool, typer.Option("--json", help="Print the usage as JSON.")
+    ] = False,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Number of environments scanned at once."),
+    ] = None,
+):
+    """
+    Show the disk usage and inodes of the environments
+    """
+    provider, venv_depot, envs = _depot_envs(names)
+    usage = disk.disk_usage(envs, jobs)
+
+    # Recorded in the registry, for `nqx list`
+    provider.record_sizes(venv_depot, {name: usage[name]["size"] for name in envs})
+
+    if json_output:
+        builtins.print(json.dumps(usage, indent=2))
+        return
+
+    table = Table("name", "size", "inodes", "shared size", "shared inodes")
+    for name, u in usage.items():
+        table.add_row(
+            f"[bold]{name}" if name == "total" else name,
+            format_size(u["size"]),
+            str(u["inodes"]),
+            format_size(u["shared_size"]),
+            str(u["shared_inodes"]),
+        )
+    print(table)
+    print("Shared files are hardlinked to other files (environments or the uv cache).")
+
+
+@app.command()
+def dedupe(
+    names: Annotated[
+        Optional[list[str]],
+        typer.Argument(help="The environments (default: all of them)."),
+    ] = None,
+    dry_run: Annotated[
+        bool, typer.Option(help="Only report what would be deduplicated.")
+    ] = False,
+    min_size: Annotated[
+        int, typer.Option(help="Size in bytes under which files are ignored.")
+    ] = 1024,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Number of files hashed at once."),
+    ] = None,
+):
+    """
+    Replace identical files of the environments by hardlinks
+    """
+    _, _, envs = _depot_envs(names)
+    groups = disk.find_duplicates(envs, min_size=min_size, jobs=jobs)
+    replaced, freed = disk.dedupe(groups, dry_run=dry_run)
+
+    verb = "Would replace" if dry_run else "Replaced"
+    print(
+        f"{verb} {replaced} files in {len(groups)} groups of identical files "
+        f"by hardlinks, freeing {format_size(freed)}"
+    )
+
+
+def select_evictions(
+    envs: dict,
+    usage: dict,
+    *,
+    max_size: Optional[int] = None,
+    max_inodes: Optional[int] = None,
+    older_than: Optional[float] = None,
+    now: Optional[float] = None,
+) -> list[str]:
+    """
+    The environments to remove, least recently used first: those unused for
+    OLDER_THAN seconds, then as many as needed for the depot to fit in
+    MAX_SIZE bytes and MAX_INODES inodes. ENVS gives the time every environment
+    was last used, and USAGE their disk usage with a `total`.
+    """
+    if now is None:
+        now = time.time()
+
+    size = usage["total"]["size"]
+    inodes = usage["total"]["inodes"]
+    evicted = []
+    for name in sorted(envs, key=lambda n: envs[n]):
+        too_old = older_than is not None and now - envs[name] > older_than
+        too_large = (max_size is not None and size > max_size) or (
+            max_inodes is not None and inodes > max_inodes
+        )
+        if not too_old and not too_large:
+            # The next ones are more recent
+            break
+        evicted.append(name)
+        # Files shared with other environments are not freed
+        size -= usage[name]["size"] - usage[name]["shared_size"]
+        inodes -= usage[name]["inodes"] - usage[name]["shared_inodes"]
+    return evicted
+
+
+@app.command()
+def gc(
+    max_size: Annotated[
+        Optional[str],
+        typer.Option(help="Size of the depot to stay under (e.g. 500G)."),
+    ] = None,
+    max_inodes: Annotated[
+        Optional[int], typer.Option(help="Number of inodes of the depot to stay under.")
+    ] = None,
+    older_than: Annotated[
+        Optional[str],
+        typer.Option(help="Remove the environments unused for this long (e.g. 30d)."),
+    ] = None,
+    dry_run: Annotated[
+        bool, typer.Option(help="Only show the environments that would be removed.")
+    ] = False,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Number of environments scanned at once."),
+    ] = None,
+):
+    """
+    Remove the least recently used environments and their kernels
+    """
+    from .create import remove_environment
+
+    if max_size is None and max_inodes is None and older_than is None:
+        print("[red]Give at least one of --max-size, --max-inodes and --older-than")
+        raise typer.Exit(1)
+
+    config = get_config()
+    provider, venv_depot, envs = _depot_envs()
+    registry = provider.get_registry(venv_depot)
+
+    # Environments never used since the tracking began count from their creation
+    last_used = {}
+    for name, path in envs.items():
+        used = provider.last_used(path)
+        if used is None:
+            used = registry.get(name, {}).get("created") or os.stat(path).st_ctime
+        last_used[name] = used
+
+    # The active environment is never removed
+    last_used.pop(os.environ.get("NQX_ENV"), None)
+
+    usage = disk.disk_usage(envs, jobs)
+    evicted = select_evictions(
+        last_used,
+        usage,
+        max_size=None if max_size is None else parse_size(max_size),
+        max_inodes=max_inodes,
+        older_than=None if older_than is None else parse_duration(older_than),
+    )
+
+    table = Table("name", "last used", "size", "inodes")
+    for name in evicted:
+        table.add_row(
+            name,
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used[name])),
+            format_size(usage[name]["size"]),
+            str(usage[name]["inodes"]),
+        )
+    if len(evicted) == 0:
+        print("Nothing to remove")
+        return
+    print(table)
+    if dry_run:
+        print(f"Would remove {len(evicted)} environments")
+        return
+
+    for name in evicted:
+        remove_environment(name, config)
+    print(f"Removed {len(evicted)} environments")
@@ -1,13 +1,17 @@
 from typing import Annotated
 from pathlib import Path
+import builtins
 import os
 import shutil
+import sys
 import logging
 
 from rich import print
 import typer
 
+from nqx.utils import daemon, resolve_env_vars
 
+from .config import get_config
 from .app import app
 
 
@@ -22,9 +26,18 @@ def hook():
         bash_config = f.read()
 
     nqx_exe = shutil.which("nqx")
-    bash_config = f"export NQX_EXE='{nqx_exe}'\n" + bash_config
-
-    print(bash_config)
+    config = get_config()
+    venv_depot = resolve_env_vars(config["venv_location"])
+    bash_config = (
+        f"export NQX_EXE='{nqx_exe}'\n"
+        f"__NQX_DEPOT='{venv_depot}'\n"
+        f"__NQX_PYTHON='{sys.executable}'\n"
+        f"__NQX_DAEMON_CLIENT='{daemon.CLIENT_SCRIPT}'\n"
+        f"__NQX_DAEMON_SOCKET='{daemon.socket_path()}'\n" + bash_config
+    )
+
+    # Printed without rich, which would wrap the long lines of the script
+    builtins.print(bash_config)
 
     return 0
 
@@ -0,0 +1,163 @@
+from typing import Annotated, Optional
+import sys
+
+from rich import print
+from rich.table import Table
+import typer
+
+from nqx.core import VenvProviderType
+from nqx.providers import get_venv_provider
+from nqx.utils import kernel_pool, resolve_env_vars
+
+from .config import get_config, get_nqx_home
+from .app import app
+from .du import format_size, parse_duration, parse_size
+from .shell import kernel_pool_config, refresh_activation_scripts, run_environment
+
+pool_app = typer.Typer(no_args_is_help=True)
+app.add_typer(
+    pool_app,
+    name="kernel-pool",
+    help="Warm interpreters for the Jupyter kernels of the environments.",
+)
+
+# Stopped when no kernel started for this long
+DEFAULT_IDLE_TIMEOUT = "1h"
+
+
+def _parse(value, parse):
+    return value if value is None or isinstance(value, (int, float)) else parse(value)
+
+
+@pool_app.command()
+def enable(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+    size: Annotated[
+        Optional[int], typer.Option(help="Number of warm interpreters.")
+    ] = None,
+    preload: Annotated[
+        Optional[list[str]],
+        typer.Option(help="Module imported by the interpreters (can be repeated)."),
+    ] = None,
+    idle_timeout: Annotated[
+        Optional[str],
+        typer.Option(help="Stop the pool when no kernel starts for this long (e.g. 2h)."),
+    ] = None,
+    max_memory: Annotated[
+        Optional[str],
+        typer.Option(help="Memory the waiting interpreters may use (e.g. 8G)."),
+    ] = None,
+):
+    """
+    Serve the kernels of an environment from a pool of warm interpreters
+    """
+    config = get_config()
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    venv_depot = config["venv_location"]
+
+    if provider.get_env_config(name, venv_depot, "kernel_path", None) is None:
+        print(f"[red]Environment {name} has no kernel")
+        raise typer.Exit(1)
+
+    pool = provider.get_env_config(name, venv_depot, "kernel_pool", None) or {}
+    pool["enabled"] = True
+    options = {
+        "size": size,
+        "preload": preload or None,
+        "idle_timeout": idle_timeout,
+        "max_memory": max_memory,
+    }
+    pool.update({k: v for k, v in options.items() if v is not None})
+    provider.set_env_config(name, venv_depot, "kernel_pool", pool)
+    refresh_activation_scripts(name, config)
+    start(name)
+
+
+@pool_app.command()
+def disable(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+):
+    """
+    Start the kernels of an environment without a pool
+    """
+    config = get_config()
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    venv_depot = config["venv_location"]
+
+    pool = provider.get_env_config(name, venv_depot, "kernel_pool", None) or {}
+    pool["enabled"] = False
+    provider.set_env_config(name, venv_depot, "kernel_pool", pool)
+    refresh_activation_scripts(name, config)
+    stop(name)
+
+
+@pool_app.command()
+def start(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+):
+    """
+    Start the pool of an environment on this node, in the background
+    """
+    if kernel_pool_config(name) is None:
+        print(f"[red]The kernel pool of {name} is not enabled, or its Python is too old")
+        raise typer.Exit(1)
+
+    command = [sys.executable, "-m", "nqx", "kernel-pool", "serve", name]
+    log_path = get_nqx_home() / "logs" / "kernel-pool" / f"{name}.log"
+    pid = kernel_pool.start(name, command, log_path)
+    print(f"Kernel pool of {name} running as {pid}, logs in {log_path}")
+
+
+@pool_app.command()
+def stop(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+):
+    """
+    Stop the pool of an environment on this node
+    """
+    if kernel_pool.stop(name):
+        print(f"Stopped the kernel pool of {name}")
+    else:
+        print(f"The kernel pool of {name} is not running")
+
+
+@pool_app.command()
+def status():
+    """
+    Show the pools running on this node
+    """
+    table = Table("name", "pid", "memory")
+    for name, pid in sorted(kernel_pool.running_pools().items()):
+        table.add_row(name, str(pid), format_size(kernel_pool.pool_memory(pid)))
+    print(table)
+
+
+@pool_app.command(hidden=True)
+def serve(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+):
+    """
+    Serve the pool of an environment in the foreground
+    """
+    config = get_config()
+    pool = kernel_pool_config(name, config)
+    if pool is None:
+        print(f"[red]The kernel pool of {name} is not enabled, or its Python is too old")
+        raise typer.Exit(1)
+
+    env, modules_to_load = run_environment(name, config)
+    if len(modules_to_load) > 0:
+        print(f"[red]Cannot capture the modules of {name}: {modules_to_load}")
+        raise typer.Exit(1)
+
+    pool = kernel_pool.KernelPool(
+        name,
+        str(resolve_env_vars(config["venv_location"]) / name / "bin" / "python"),
+        preload=pool.get("preload", []),
+        size=pool.get("size", 1),
+        idle_timeout=_parse(pool.get("idle_timeout", DEFAULT_IDLE_TIMEOUT), parse_duration),
+        max_memory=_parse(pool.get("max_memory", None), parse_size),
+        env=env,
+    )
+    if not kernel_pool.serve(pool):
+        print(f"The kernel pool of {name} is already running")
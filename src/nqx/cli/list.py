@@ -1,13 +1,26 @@
+from typing import Annotated
+import builtins
+import json
+
 from rich import print
+import typer
 
 from nqx.providers import get_venv_provider
+from nqx.utils import resolve_env_vars
 
 from .config import get_config
 from .app import app
 
 
 @app.command()
-def list():
+def list(
+    json_output: Annotated[
+        bool, typer.Option("--json", help="Print the environments as JSON.")
+    ] = False,
+    rebuild: Annotated[
+        bool, typer.Option(help="Scan the depot again to rebuild its registry.")
+    ] = False,
+):
     """
     List all environments
     """
@@ -19,17 +32,31 @@ def list():
     venv_depot = config["venv_location"]
     provider = get_venv_provider(provider)
 
-    envs = provider.list_envs(venv_depot)
+    # The environments are read from the registry of the depot
+    if rebuild:
+        envs = provider.rebuild_registry(venv_depot)
+    else:
+        envs = provider.get_registry(venv_depot)
+    depot_path = resolve_env_vars(venv_depot)
+
+    if json_output:
+        data = [
+            {"name": name, "path": str(depot_path / name), **entry}
+            for name, entry in sorted(envs.items())
+        ]
+        builtins.print(json.dumps(data, indent=2))
+        return 0
 
     print()
     print("# Available NQX-friendly environments are:")
-    print(f"# {'name':<20} \t {'type':<5} \t {'path'}")
-    for name, path in envs:
-        type = provider.get_env_config(name, venv_depot, "type")
+    print(f"# {'name':<20} \t {'type':<5} \t {'python':<6} \t {'path'}")
+    for name, entry in sorted(envs.items()):
+        type = entry["type"]
         if type is None:
             type = "?"
+        python = entry["python"] or "?"
 
-        print(f"- {name:<20} \t {type:<5} \t {path}")
+        print(f"- {name:<20} \t {type:<5} \t {python:<6} \t {depot_path / name}")
 
     return 0
 
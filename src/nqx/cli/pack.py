@@ -0,0 +1,84 @@
+from typing import Annotated, Optional
+from pathlib import Path
+import time
+
+from rich import print
+import typer
+
+from nqx.core import VenvProviderType
+from nqx.providers import get_venv_provider
+
+from .config import get_config
+from .app import app
+from .shell import write_activation_scripts
+
+
+@app.command(no_args_is_help=True)
+def pack(
+    name: Annotated[str, typer.Argument(help="The name of the environment.")],
+    output: Annotated[
+        Optional[Path],
+        typer.Argument(help="The archive to write (default: NAME.tar.zst)."),
+    ] = None,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Number of threads hashing the files."),
+    ] = None,
+):
+    """
+    Pack the environment NAME into a single compressed archive
+    """
+    from nqx.providers.venv.uv.pack import archive_suffix
+
+    config = get_config()
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+
+    if output is None:
+        output = Path(f"{name}{archive_suffix()}")
+
+    start = time.monotonic()
+    try:
+        manifest = provider.pack_env(name, config["venv_location"], output, jobs=jobs)
+    except (FileNotFoundError, RuntimeError) as err:
+        print(f"[red]{err}")
+        raise typer.Exit(1)
+    print(
+        f"Packed {len(manifest['files'])} files of {name} in {output} "
+        f"({time.monotonic() - start:.1f}s)"
+    )
+
+
+@app.command(no_args_is_help=True)
+def unpack(
+    archive: Annotated[Path, typer.Argument(help="The archive written by pack.")],
+    name: Annotated[
+        Optional[str],
+        typer.Argument(help="The name of the environment (default: the packed one)."),
+    ] = None,
+    *,
+    force: Annotated[
+        bool, typer.Option(help="Replace the existing environment and kernel.")
+    ] = False,
+    verify: Annotated[
+        bool, typer.Option(help="Check the files against the hashes of the manifest.")
+    ] = False,
+):
+    """
+    Unpack an environment from an archive written by pack
+    """
+    config = get_config()
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+
+    start = time.monotonic()
+    try:
+        name = provider.unpack_env(
+            archive, config["venv_location"], name, force=force, verify=verify
+        )
+    except (OSError, ValueError, RuntimeError) as err:
+        print(f"[red]{err}")
+        raise typer.Exit(1)
+
+    # The activation scripts embed the location of the environment
+    write_activation_scripts(name, config)
+    provider.update_registry(name, config["venv_location"])
+    print(f"Unpacked {name} from {archive} ({time.monotonic() - start:.1f}s)")
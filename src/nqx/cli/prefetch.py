@@ -0,0 +1,107 @@
+from typing import Annotated, Optional
+import os
+
+from rich import print
+import typer
+
+from nqx.core import EnvConfig, EnvType
+from nqx.providers import get_python_provider
+from nqx.providers.python import registry as python_registry
+from nqx.providers.venv.uv import lock as uv_lock, wheelhouse
+
+from .config import get_config, get_requirements_file_for_type
+from .app import app
+
+
+def _python_version() -> str:
+    """
+    The `major.minor` version of the Python environments are created with.
+    """
+    env_config = get_python_provider().get_env_with_python(
+        EnvConfig(env=os.environ.copy())
+    )
+    version = python_registry.get_interpreter(env_config.env)["version"]
+    return ".".join(version.split(".")[:2])
+
+
+def _requirements_files(types: Optional[list[EnvType]]) -> dict:
+    """
+    The requirements files of TYPES (by default, all the configured ones), with
+    the types using each of them, so that types sharing them are resolved once.
+    """
+    config = get_config()
+    if not types:
+        types = [EnvType(t) for t in config["configurations"]]
+
+    files = {}
+    for t in types:
+        file_subpath = config["configurations"][t.value]["requirements"]
+        files.setdefault(get_requirements_file_for_type(file_subpath), []).append(t.value)
+    return files
+
+
+def _python_versions(python: Optional[list[str]]) -> list[str]:
+    if python:
+        return python
+    return get_config().get("python_versions", None) or [_python_version()]
+
+
+@app.command()
+def prefetch(
+    type: Annotated[
+        Optional[list[EnvType]],
+        typer.Option("--type", help="Type of environments (default: all of them)."),
+    ] = None,
+    python: Annotated[
+        Optional[list[str]],
+        typer.Option(help="Python versions, like 3.11 (default: the one in use)."),
+    ] = None,
+    jobs: Annotated[
+        Optional[int],
+        typer.Option("--jobs", "-j", help="Maximum number of concurrent downloads."),
+    ] = None,
+):
+    """
+    Download the packages of the environments for installing them offline
+    """
+    packages = ["ipykernel"]
+    for file, types in _requirements_files(type).items():
+        for python_version in _python_versions(python):
+            print(f"Prefetching {', '.join(types)} for Python {python_version}")
+            try:
+                path = wheelhouse.prefetch(file, python_version, *packages, jobs=jobs)
+            except RuntimeError as err:
+                print(f"[red]{err}")
+                raise typer.Exit(1)
+            print(f"Pinned requirements written to {path}")
+
+    print(f"Wheelhouse: {wheelhouse.wheelhouse_dir()}")
+
+
+@app.command()
+def lock(
+    type: Annotated[
+        Optional[list[EnvType]],
+        typer.Option("--type", help="Type of environments (default: all of them)."),
+    ] = None,
+    python: Annotated[
+        Optional[list[str]],
+        typer.Option(help="Python versions, like 3.11 (default: the one in use)."),
+    ] = None,
+    upgrade: Annotated[
+        bool, typer.Option(help="Resolve the requirements again.")
+    ] = False,
+):
+    """
+    Resolve the requirements of the environments into locks used by create
+    """
+    # Environments are created with ipykernel, resolved with the requirements
+    packages = ["ipykernel"]
+    for file, types in _requirements_files(type).items():
+        for python_version in _python_versions(python):
+            try:
+                path = uv_lock.get_lock(file, python_version, *packages, upgrade=upgrade)
+            except RuntimeError as err:
+                print(f"[red]{err}")
+                raise typer.Exit(1)
+            print(f"{', '.join(types)} (Python {python_version}): {path}")
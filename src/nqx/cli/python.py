@@ -0,0 +1,39 @@
+import time
+
+from rich import print
+from rich.table import Table
+import typer
+
+from nqx.providers.python import registry
+
+from .app import app
+
+python_app = typer.Typer(no_args_is_help=True)
+app.add_typer(python_app, name="python", help="The Python interpreters found by nqx.")
+
+
+@python_app.command("list")
+def list_interpreters():
+    """
+    Show the registered interpreters
+    """
+    table = Table("path", "version", "abi", "modules", "registered", "status")
+    for path, entry in sorted(registry.read_registry().items()):
+        table.add_row(
+            path,
+            entry["version"],
+            entry["abi"],
+            " ".join(entry["modules"]),
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["registered"])),
+            "ok" if registry.is_valid(entry) else "[red]changed",
+        )
+    print(table)
+
+
+@python_app.command()
+def forget():
+    """
+    Empty the registry, so that the interpreters are probed again
+    """
+    registry.registry_path().unlink(missing_ok=True)
+    print("Forgot the registered interpreters")
@@ -0,0 +1,760 @@
+"""
+Typer-free implementation of the commands evaluated by the `nqx()` shell function.
+
+`nqx activate` and `nqx deactivate` run every time an environment is activated,
+so this module must only import what is needed to compute the shell lines (no
+typer, no rich, no other command).
+
+The same lines are also precompiled in every environment as `activate.sh` and
+`deactivate.sh`, which the `nqx()` shell function sources directly. Those scripts
+check that the files they were generated from did not change, and return 1 when
+they are stale so that the shell function falls back to this module.
+
+`nqx run NAME -- COMMAND` executes a command in an environment without a shell.
+Every environment also has a `bin/nqx-exec` wrapper doing the same from the
+precompiled lines, to be started by `srun`/`mpirun` on every rank without
+starting nqx, which it only falls back to when the lines are stale.
+"""
+
+from typing import Optional
+import hashlib
+import logging
+import os
+import shlex
+import sys
+
+from nqx.core import EnvConfig, EnvType, VenvProviderType, journal
+from nqx.providers import modules
+from nqx.providers.modules import snapshot
+from nqx.providers.venv import get_provider as get_venv_provider
+from nqx.providers.venv.uv.registry import LAST_USED_FILE
+from nqx.providers.venv.uv.wheelhouse import python_version_of
+from nqx.utils.path import ENV_VAR_PATTERN
+
+from .config import get_config
+
+ACTIVATE_SCRIPT = "activate.sh"
+DEACTIVATE_SCRIPT = "deactivate.sh"
+EXEC_SCRIPT = os.path.join("bin", "nqx-exec")
+# In the directory of the Jupyter kernel of the environment
+KERNEL_LAUNCHER = "launch_kernel"
+
+# Variables giving the rank of a process started by srun or mpirun
+RANK_VARIABLES = ("SLURM_PROCID", "PMI_RANK", "OMPI_COMM_WORLD_RANK")
+
+FINGERPRINT_TAG = "# nqx-fingerprint: "
+
+
+def _get_env(name: str, config):
+    """
+    Returns the venv provider, the depot and the type of the environment NAME.
+    """
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    venv_depot = config["venv_location"]
+    type = EnvType(provider.get_env_config(name, venv_depot, "type"))
+    return provider, venv_depot, type
+
+
+def get_modules_snapshot(name: str, config=None, environment: dict = None):
+    """
+    Returns the key and the snapshot of the modules of NAME in ENVIRONMENT
+    (by default, the current one), or (None, None) if it has no modules or if
+    the `module` command is not available.
+    """
+    if config is None:
+        config = get_config()
+
+    _, _, type = _get_env(name, config)
+    modules_to_load = config["configurations"][type.value].get("modules", [])
+    logging.debug("Must load modules: %s", modules_to_load)
+    if len(modules_to_load) == 0 or not modules.is_available():
+        return None, None
+    if environment is not None:
+        environment = EnvConfig(env=environment)
+    return snapshot.get_snapshot(*modules_to_load, environment=environment)
+
+
+def environment_ops(name: str, config=None, modules_snapshot=None):
+    """
+    The changes made to the environment variables by the activation of NAME,
+    as `(op, name, word)` like in `EnvDelta` but with shell words as values,
+    expanded when the lines are evaluated (so that the PYTHONPYCACHEPREFIX
+    policy can point to node-local scratch like `$TMPDIR/pycache`), and the
+    modules to load with `module load` as they could not be captured.
+
+    Those do not depend on the state of the shell they are evaluated in.
+    """
+    if config is None:
+        config = get_config()
+
+    # Python is not needed for activating the environment as it is set
+    # by the virtualenv activation
+    env_config = EnvConfig(env={})
+
+    ###############################################################
+    # Activate the virtual environment
+    provider, venv_depot, type = _get_env(name, config)
+    env_config = provider.activate_env(
+        name, venv_depot=venv_depot, environment=env_config
+    )
+
+    # Changes computed when the environment was installed, with literal values
+    ops = [
+        (op, k, None if v is None else shlex.quote(v))
+        for op, k, v in provider.activation_delta(name, venv_depot).ops
+    ]
+
+    ###############################################################
+    # Setup env variables
+    env_config.update(config["configurations"][type.value].get("env", {}))
+
+    for k, v in env_config.env.items():
+        # The providers extend the variables of the shell, like "bin:$PATH"
+        suffix = f"{os.pathsep}${k}"
+        if v.endswith(suffix):
+            ops.append(("prepend", k, f'"{v[: -len(suffix)]}"'))
+        else:
+            ops.append(("set", k, f'"{v}"'))
+    pycache_prefix = provider.get_env_config(name, venv_depot, "pycache_prefix", None)
+    if pycache_prefix is not None:
+        ops.append(("set", "PYTHONPYCACHEPREFIX", f'"{pycache_prefix}"'))
+    ops.append(("set", "NQX_ENV", f'"{name}"'))
+
+    ###############################################################
+    # Setup modules
+    modules_to_load = config["configurations"][type.value].get("modules", [])
+    if len(modules_to_load) > 0:
+        if modules_snapshot is None:
+            modules_snapshot = get_modules_snapshot(name, config)
+        key, delta = modules_snapshot
+        if delta is not None:
+            for op, k, v in delta.ops:
+                ops.append((op, k, None if v is None else shlex.quote(v)))
+            ops.append(("set", "NQX_MODULES_SNAPSHOT", f'"{key}"'))
+            modules_to_load = []
+
+    return ops, modules_to_load
+
+
+def environment_lines(name: str, config=None, modules_snapshot=None) -> list[str]:
+    """
+    Shell lines setting the environment variables and modules of NAME.
+
+    The modules are loaded by replaying their snapshot, or with `module load`
+    if the `module` command is not available to capture it.
+    """
+    ops, modules_to_load = environment_ops(name, config, modules_snapshot)
+    lines = journal.op_lines(ops)
+    if len(modules_to_load) > 0:
+        lines.append("module load " + " ".join(modules_to_load))
+    return lines
+
+
+def journaled_lines(
+    name: str, level: int, config=None, modules_snapshot=None
+) -> list[str]:
+    """
+    Shell lines activating NAME at LEVEL, recording the changes they make in
+    the journal of the shell (see `nqx.core.journal`).
+    """
+    if config is None:
+        config = get_config()
+
+    ops, modules_to_load = environment_ops(name, config, modules_snapshot)
+    lines = journal.activation_lines(ops, level, modules_to_load, label=name)
+    lines.extend(last_used_lines(name, config))
+    return lines
+
+
+def cleanup_lines(name: str, config=None, modules_snapshot=None) -> list[str]:
+    """
+    Shell lines unsetting the environment variables and modules of NAME.
+
+    Those do not include the removal of NAME from the PATH. The modules are
+    unloaded by undoing their snapshot, by default the one recorded at
+    activation in NQX_MODULES_SNAPSHOT.
+    """
+    if config is None:
+        config = get_config()
+
+    provider, venv_depot, type = _get_env(name, config)
+
+    lines = []
+    env_variables = config["configurations"][type.value].get("env", {})
+    for k in env_variables.keys():
+        lines.append(f"unset {k}")
+    if provider.get_env_config(name, venv_depot, "pycache_prefix", None) is not None:
+        lines.append("unset PYTHONPYCACHEPREFIX")
+    lines.append("unset NQX_ENV")
+
+    modules_to_load = config["configurations"][type.value].get("modules", [])
+    if len(modules_to_load) > 0:
+        if modules_snapshot is None:
+            key = os.environ.get("NQX_MODULES_SNAPSHOT", None)
+            delta = snapshot.read_snapshot(key) if key is not None else None
+        else:
+            key, delta = modules_snapshot
+        if delta is not None:
+            lines.extend(delta.inverse_shell_lines())
+            lines.append("unset NQX_MODULES_SNAPSHOT")
+        else:
+            lines.append("module unload " + " ".join(modules_to_load))
+
+    return lines
+
+
+def last_used_lines(name: str, config=None, first_rank=False) -> list[str]:
+    """
+    Shell lines recording that NAME is used, by changing the modification time
+    of its LAST_USED_FILE. With FIRST_RANK, only the first MPI rank does, to
+    spare the filesystem.
+    """
+    if config is None:
+        config = get_config()
+
+    path = shlex.quote(os.path.join(_venv_path(name, config), LAST_USED_FILE))
+    line = f": > {path} 2>/dev/null || :"
+    if not first_rank:
+        return [line]
+    rank = "0"
+    for var in reversed(RANK_VARIABLES):
+        rank = f"${{{var}:-{rank}}}"
+    return [f'case "{rank}" in 0) {line} ;; esac']
+
+
+def touch_last_used(name: str, config=None):
+    if config is None:
+        config = get_config()
+    try:
+        with open(os.path.join(_venv_path(name, config), LAST_USED_FILE), "w"):
+            pass
+    except OSError as err:
+        logging.debug("Cannot record the use of %s: %s", name, err)
+
+
+def activate_lines(name: str, stack: bool = False) -> list[str]:
+    """
+    Shell lines activating the environment NAME, in place of the current one
+    or on top of it with STACK.
+    """
+    config = get_config()
+    level = journal.shell_level()
+    environment = dict(os.environ)
+
+    ###############################################################
+    # Check if a nqx environment is already loaded. In which case,
+    # we need to deactivate it first
+    lines = []
+    if (level > 0 and not stack) or (level == 0 and "NQX_ENV" in environment):
+        lines.extend(deactivate_lines())
+        if level > 0:
+            environment = journal.undo_environ(environment, level)
+            level -= 1
+
+    modules_snapshot = get_modules_snapshot(name, config, environment)
+    lines.extend(journaled_lines(name, level + 1, config, modules_snapshot))
+    return lines
+
+
+def deactivate_lines() -> list[str]:
+    """
+    Shell lines deactivating the current environment, reactivating the one it
+    was stacked on, if any.
+    """
+    level = journal.shell_level()
+    if level > 0:
+        return journal.undo_lines(journal.journal(os.environ, level), level)
+
+    ###############################################################
+    # Without journal (activated by an older nqx), the changes are
+    # computed from the configuration
+    config = get_config()
+
+    ###############################################################
+    # Deactivate the virtual environment
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    venv_depot = config["venv_location"]
+    lines = list(provider.deactivate_env(venv_depot))
+
+    ###############################################################
+    # remove env variables and modules of the current environment
+    current_env = os.environ.get("NQX_ENV", None)
+    if current_env is not None:
+        lines.extend(cleanup_lines(current_env, config))
+
+    # PS1
+    ps1 = os.getenv("PS1", "")
+    old_ps1 = os.getenv("_NQX_PS1_BACKUP", None)
+    if "POWERLINE_COMMAND" in ps1:
+        # defer
+        pass
+    elif old_ps1 is not None:
+        lines.append("""PS1="$_NQX_PS1_BACKUP" """)
+
+    return lines
+
+
+def reactivate_lines() -> list[str]:
+    """
+    Shell lines activating again the stacked environments, after their
+    configuration or packages changed. Those removed are deactivated.
+    """
+    config = get_config()
+    level = journal.shell_level()
+    environment = dict(os.environ)
+
+    lines = []
+    if level == 0:
+        names = [environment["NQX_ENV"]] if "NQX_ENV" in environment else []
+        if len(names) > 0:
+            lines.extend(deactivate_lines())
+    else:
+        names = [n for n in journal.active_envs(environment) if n is not None]
+        for level in range(level, 0, -1):
+            lines.extend(journal.undo_lines(journal.journal(environment, level), level))
+            environment = journal.undo_environ(environment, level)
+
+    level = 0
+    for name in names:
+        try:
+            modules_snapshot = get_modules_snapshot(name, config, environment)
+        except (FileNotFoundError, ValueError):
+            print(f"nqx: the environment {name} does not exist anymore", file=sys.stderr)
+            continue
+        level += 1
+        lines.extend(journaled_lines(name, level, config, modules_snapshot))
+        if modules_snapshot[1] is not None:
+            environment = modules_snapshot[1].apply(environment)
+    return lines
+
+
+###############################################################
+# Running commands without activation
+
+
+def _expand(value: str, env: dict) -> str:
+    """
+    Expand the variables in VALUE like the shell does in double quotes.
+    """
+    return ENV_VAR_PATTERN.sub(lambda m: env.get(m.group(1) or m.group(2), ""), value)
+
+
+def run_environment(name: str, config=None, environment: dict = None):
+    """
+    Returns the environment variables of the environment NAME applied to
+    ENVIRONMENT (by default, the current one), and the modules to load with
+    `module load` as they could not be captured.
+    """
+    if config is None:
+        config = get_config()
+    if environment is None:
+        environment = os.environ.copy()
+
+    provider, venv_depot, type = _get_env(name, config)
+    env = provider.activate_env(
+        name, venv_depot=venv_depot, environment=EnvConfig(env=environment)
+    ).env
+    env = provider.activation_delta(name, venv_depot).apply(env)
+
+    for k, v in config["configurations"][type.value].get("env", {}).items():
+        env[k] = _expand(str(v), env)
+    pycache_prefix = provider.get_env_config(name, venv_depot, "pycache_prefix", None)
+    if pycache_prefix is not None:
+        env["PYTHONPYCACHEPREFIX"] = _expand(pycache_prefix, env)
+    env["NQX_ENV"] = name
+
+    modules_to_load = config["configurations"][type.value].get("modules", [])
+    if len(modules_to_load) > 0:
+        key = environment.get("NQX_MODULES_SNAPSHOT", None)
+        if environment.get("NQX_ENV", None) == name and key is not None:
+            if snapshot.read_snapshot(key) is not None:
+                # Already active, with the modules loaded
+                return env, []
+        key, delta = get_modules_snapshot(name, config)
+        if delta is None:
+            return env, modules_to_load
+        env = delta.apply(env)
+        env["NQX_MODULES_SNAPSHOT"] = key
+    return env, []
+
+
+def run_arguments(args: list[str]):
+    """
+    The environment and the command of the arguments of `nqx run`.
+    """
+    name, *command = args
+    if len(command) > 0 and command[0] == "--":
+        command = command[1:]
+    return name, command
+
+
+def run_command(name: str, command: list[str]):
+    """
+    Returns the command executing COMMAND in the environment NAME, and its
+    environment variables.
+    """
+    env, modules_to_load = run_environment(name)
+    touch_last_used(name)
+    if len(modules_to_load) > 0:
+        load = "module load " + " ".join(shlex.quote(m) for m in modules_to_load)
+        command = ["bash", "-c", f'{load} && exec "$@"', "nqx-run", *command]
+    return command, env
+
+
+def run(name: str, command: list[str]) -> int:
+    """
+    Replace this process by COMMAND executed in the environment NAME.
+    """
+    command, env = run_command(name, command)
+    logging.debug("Executing %s in %s", command, name)
+    try:
+        os.execvpe(command[0], command, env)
+    except OSError as err:
+        print(f"nqx: {command[0]}: {err.strerror}", file=sys.stderr)
+        return 127
+
+
+###############################################################
+# Precompiled activation scripts
+
+
+def _venv_path(name: str, config) -> str:
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    return os.path.dirname(provider.env_config_path(name, config["venv_location"]))
+
+
+def _script_modules(name: str, config) -> list:
+    """
+    The modules whose snapshot is replayed by the activation scripts of NAME.
+    """
+    _, _, type = _get_env(name, config)
+    modules_to_load = config["configurations"][type.value].get("modules", [])
+    if len(modules_to_load) == 0 or not modules.is_available():
+        return []
+    return modules_to_load
+
+
+def _script_sources(name: str, config) -> list:
+    """
+    Files the activation scripts of NAME are generated from.
+    """
+    provider = get_venv_provider(VenvProviderType(config["venv_provider"]))
+    return [
+        *config.sources,
+        provider.env_config_path(name, config["venv_location"]),
+        *snapshot.snapshot_sources(_script_modules(name, config)),
+    ]
+
+
+def fingerprint(name: str, config=None) -> str:
+    """
+    Fingerprint of the hostname and of the files the scripts of NAME are built from.
+    """
+    if config is None:
+        config = get_config()
+
+    h = hashlib.sha1(f"cluster:{config.cluster}\n".encode())
+    if len(_script_modules(name, config)) > 0:
+        for var in snapshot.KEY_VARIABLES:
+            h.update(f"{var}={os.environ.get(var, '')}\n".encode())
+    for path in _script_sources(name, config):
+        try:
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+        except FileNotFoundError:
+            h.update(f"{path}:-\n".encode())
+    return h.hexdigest()
+
+
+def _freshness_checks(name: str, script_path, config) -> list[str]:
+    """
+    Shell lines returning 1 if any of the sources of the script changed, or if
+    this host would select a different cluster configuration.
+    """
+    script_path = shlex.quote(str(script_path))
+
+    lines = []
+    for path in _script_sources(name, config):
+        if os.path.exists(path):
+            test = f"[ {shlex.quote(str(path))} -nt {script_path} ]"
+        else:
+            test = f"[ -e {shlex.quote(str(path))} ]"
+        lines.append(f"if {test}; then return 1; fi")
+
+    hostname = '"${HOSTNAME:-${HOST:-}}"'
+    if config.cluster is not None:
+        pattern = shlex.quote(config.cluster) + "*"
+        lines.append(f"case {hostname} in {pattern}) ;; *) return 1 ;; esac")
+    elif len(config.clusters) > 0:
+        pattern = "|".join(shlex.quote(c) + "*" for c in config.clusters)
+        lines.append(f"case {hostname} in {pattern}) return 1 ;; esac")
+    return lines
+
+
+def _write_script(path, lines):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def write_activation_scripts(name: str, config=None):
+    """
+    Precompile the `activate.sh` and `deactivate.sh` scripts of the environment NAME.
+    """
+    if config is None:
+        config = get_config()
+
+    modules_snapshot = get_modules_snapshot(name, config)
+    venv_path = _venv_path(name, config)
+
+    header = [
+        f"# Generated by nqx for the environment {name}, do not edit.",
+        FINGERPRINT_TAG + fingerprint(name, config),
+        "# Returns 1 without changing anything if nqx must be used instead.",
+    ]
+
+    # The scripts only activate in a shell without active environment, as
+    # the environments stacked on others go through nqx
+    activate_path = os.path.join(venv_path, ACTIVATE_SCRIPT)
+    lines = header + _freshness_checks(name, activate_path, config)
+    lines.append(f'if [ "${{{journal.SHLVL}:-0}}" != 0 ]; then return 1; fi')
+    if len(_script_modules(name, config)) > 0:
+        # The snapshot of the modules depends on the modules already loaded
+        for var in snapshot.KEY_VARIABLES:
+            value = shlex.quote(os.environ.get(var, ""))
+            lines.append(f'if [ "${{{var}:-}}" != {value} ]; then return 1; fi')
+    lines += journaled_lines(name, 1, config, modules_snapshot)
+    _write_script(activate_path, lines)
+
+    # Undoes the activation above, as recorded in the journal
+    deactivate_path = os.path.join(venv_path, DEACTIVATE_SCRIPT)
+    tokens = journal.journal_tokens(*environment_ops(name, config, modules_snapshot))
+    recorded = f"${{{journal.journal_var(1)}:-}}"
+    lines = header + [
+        f'if [ "${{{journal.SHLVL}:-0}}" != 1 ] || [ "{recorded}" != '
+        f"{shlex.quote(' '.join(tokens))} ]; then return 1; fi"
+    ]
+    lines += journal.undo_lines(tokens, 1)
+    _write_script(deactivate_path, lines)
+
+    # Wrapper executing its arguments in the environment, for every MPI rank
+    exec_path = os.path.join(venv_path, EXEC_SCRIPT)
+    lines = ["#!/bin/sh"] + header + ["__nqx_env() {"]
+    checks = _freshness_checks(name, exec_path, config)
+    if len(_script_modules(name, config)) > 0:
+        # Already active (the ranks started from an activated shell or by
+        # `nqx run`), with the modules loaded by this very snapshot
+        key = shlex.quote(modules_snapshot[0] or "")
+        checks += [
+            f'if [ "${{NQX_ENV:-}}" = {shlex.quote(name)} ] && '
+            f'[ "${{NQX_MODULES_SNAPSHOT:-}}" = {key} ]; then',
+            *("    " + line for line in last_used_lines(name, config, first_rank=True)),
+            "    return 0",
+            "fi",
+        ]
+        for var in snapshot.KEY_VARIABLES:
+            value = shlex.quote(os.environ.get(var, ""))
+            checks.append(f'if [ "${{{var}:-}}" != {value} ]; then return 1; fi')
+    checks += environment_lines(name, config, modules_snapshot)
+    checks += last_used_lines(name, config, first_rank=True)
+    lines += ["    " + line for line in checks]
+    lines += [
+        "}",
+        f'__nqx_env || exec "${{NQX_EXE:-nqx}}" run {shlex.quote(name)} -- "$@"',
+        'exec "$@"',
+    ]
+    os.makedirs(os.path.dirname(exec_path), exist_ok=True)
+    _write_script(exec_path, lines)
+    os.chmod(exec_path, 0o755)
+
+    write_kernel_launcher(name, config, modules_snapshot)
+
+    logging.debug("Written activation scripts of %s in %s", name, venv_path)
+    return activate_path, deactivate_path
+
+
+def _kernel_launcher_path(name: str, config):
+    """
+    The path of the kernel launcher of NAME, or None if it has no kernel.
+    """
+    provider, venv_depot, _ = _get_env(name, config)
+    kernel_path = provider.get_env_config(name, venv_depot, "kernel_path", None)
+    if kernel_path is None or not os.path.isdir(kernel_path):
+        return None
+    return os.path.join(kernel_path, KERNEL_LAUNCHER)
+
+
+def kernel_pool_config(name: str, config=None):
+    """
+    The settings of the warm kernel pool of NAME: the `kernel_pool` of its
+    configuration, updated by the one of the environment. None if the pool is
+    not enabled (by `nqx kernel-pool enable` or the configuration), or if the
+    Python of NAME cannot run its workers.
+    """
+    from nqx.utils import kernel_pool
+
+    if config is None:
+        config = get_config()
+
+    provider, venv_depot, type = _get_env(name, config)
+    pool = dict(config["configurations"][type.value].get("kernel_pool", None) or {})
+    pool.update(provider.get_env_config(name, venv_depot, "kernel_pool", None) or {})
+    if not pool.get("enabled", False) or pool.get("size", 1) <= 0:
+        return None
+    python_version = python_version_of(_venv_path(name, config))
+    if not kernel_pool.supports(python_version):
+        logging.debug("No kernel pool for %s with Python %s", name, python_version)
+        return None
+    return pool
+
+
+def _kernel_pool_lines(name: str, config) -> list[str]:
+    """
+    Shell lines handing the kernel to a warm interpreter of the pool of NAME,
+    starting the pool in the background for the next kernels if needed.
+    """
+    from nqx.utils import kernel_pool
+
+    python = os.path.join(_venv_path(name, config), "bin", "python")
+    client = " ".join(shlex.quote(arg) for arg in kernel_pool.client_command(name, python))
+    sock = shlex.quote(str(kernel_pool.socket_path(name)))
+    return [
+        f'if [ -S {sock} ]; then exec {client} "$@"; fi',
+        f'"${{NQX_EXE:-nqx}}" kernel-pool start {shlex.quote(name)} '
+        ">/dev/null 2>&1 </dev/null &",
+    ]
+
+
+def write_kernel_launcher(name: str, config=None, modules_snapshot=None):
+    """
+    Write the script launching the Jupyter kernel of NAME, if it has one.
+
+    The environment of NAME is precomputed in the script, so that starting a
+    kernel only runs a few builtins and `exec`. When the sources of the script
+    changed, it is regenerated by `nqx rebuild-activation --kernel-only` and run
+    again: the other scripts would capture the modules loaded by the Jupyter
+    server.
+    """
+    if config is None:
+        config = get_config()
+
+    launcher_path = _kernel_launcher_path(name, config)
+    if launcher_path is None:
+        return None
+    if modules_snapshot is None:
+        modules_snapshot = get_modules_snapshot(name, config)
+
+    # MODULEPATH is set by kernel.json, so the snapshot always applies
+    lines = [
+        "#!/bin/sh",
+        f"# Generated by nqx for the kernel of the environment {name}, do not edit.",
+        FINGERPRINT_TAG + fingerprint(name, config),
+        "__nqx_env() {",
+    ]
+    checks = _freshness_checks(name, launcher_path, config)
+    if modules_snapshot[1] is None:
+        _, _, type = _get_env(name, config)
+        if len(config["configurations"][type.value].get("modules", [])) > 0:
+            # Loaded with `module load` as no snapshot could be captured
+            checks.append('. "$MODULESHOME/init/sh" || return 1')
+    checks += environment_lines(name, config, modules_snapshot)
+    checks += last_used_lines(name, config)
+    lines += ["    " + line for line in checks]
+    quoted_name = shlex.quote(name)
+    lines += [
+        "}",
+        "if ! __nqx_env; then",
+        '    if [ -z "${_NQX_KERNEL_REFRESH:-}" ]; then',
+        "        export _NQX_KERNEL_REFRESH=1",
+        f'        "${{NQX_EXE:-nqx}}" rebuild-activation --kernel-only {quoted_name} \\',
+        "            >/dev/null 2>&1 \\",
+        '            && exec "$0" "$@"',
+        "    fi",
+        "    unset _NQX_KERNEL_REFRESH",
+        f'    exec "${{NQX_EXE:-nqx}}" run {quoted_name} -- "$@"',
+        "fi",
+        "unset _NQX_KERNEL_REFRESH",
+    ]
+    if kernel_pool_config(name, config) is not None:
+        lines += _kernel_pool_lines(name, config)
+    lines.append('exec "$@"')
+    _write_script(launcher_path, lines)
+    os.chmod(launcher_path, 0o755)
+    return launcher_path
+
+
+def read_fingerprint(script_path) -> Optional[str]:
+    """
+    The fingerprint recorded in an activation script, or None.
+    """
+    try:
+        with open(script_path) as f:
+            for line in f:
+                if line.startswith(FINGERPRINT_TAG):
+                    return line[len(FINGERPRINT_TAG) :].strip()
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def refresh_activation_scripts(name: str, config=None) -> bool:
+    """
+    Rewrite the activation scripts of NAME if they are missing or stale.
+
+    Returns True if they were rewritten.
+    """
+    if config is None:
+        config = get_config()
+
+    venv_path = _venv_path(name, config)
+    current = fingerprint(name, config)
+    scripts = [
+        os.path.join(venv_path, script)
+        for script in (ACTIVATE_SCRIPT, DEACTIVATE_SCRIPT, EXEC_SCRIPT)
+    ]
+    launcher_path = _kernel_launcher_path(name, config)
+    if launcher_path is not None:
+        scripts.append(launcher_path)
+    if all(read_fingerprint(script) == current for script in scripts):
+        return False
+
+    write_activation_scripts(name, config)
+    return True
+
+
+def main(argv: list[str]) -> int:
+    """
+    Entry point of `nqx activate NAME`, `nqx deactivate`, `nqx reactivate`
+    and `nqx run NAME -- COMMAND` used by `nqx.cli.main`.
+    """
+    command, *args = argv
+    try:
+        if command == "run":
+            name, args = run_arguments(args)
+            if len(args) == 0:
+                print("Usage: nqx run NAME -- COMMAND [ARGS]...", file=sys.stderr)
+                return 2
+            return run(name, args)
+        elif command == "activate":
+            lines = activate_lines(*args)
+        elif command == "reactivate":
+            lines = reactivate_lines()
+        else:
+            lines = deactivate_lines()
+    except Exception as err:
+        # `typer.Exit`, raised by the providers after printing the error
+        exit_code = getattr(err, "exit_code", None)
+        if exit_code is None:
+            raise
+        return exit_code
+
+    print("\n".join(lines))
+
+    # The shell function only gets here if the precompiled scripts were stale
+    if command == "activate":
+        try:
+            refresh_activation_scripts(*args)
+        except OSError as err:
+            logging.debug("Could not refresh the activation scripts: %s", err)
+    return 0
@@ -2,6 +2,7 @@ from typing import Annotated
 from enum import Enum
 
 from .env_config import EnvConfig
+from .env_delta import EnvDelta
 
 
 class EnvType(str, Enum):
@@ -0,0 +1,127 @@
+import os
+import re
+import shlex
+
+# Variables changed by spawning a shell, that are not part of a delta
+IGNORED_VARIABLES = ("_", "SHLVL", "PWD", "OLDPWD")
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class EnvDelta:
+    """
+    Changes to environment variables, as a list of operations `(op, name, value)`
+    where op is one of `set`, `prepend`, `append` (to a path-like variable) or
+    `unset` (value is None).
+    """
+
+    def __init__(self, ops: list = None):
+        if ops is None:
+            ops = []
+        self.ops = [tuple(op) for op in ops]
+
+    def __repr__(self) -> str:
+        return f"EnvDelta({self.ops})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, EnvDelta) and self.ops == other.ops
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    @classmethod
+    def between(cls, before: dict, after: dict):
+        """
+        The delta transforming the environment BEFORE into AFTER.
+        """
+        ops = []
+        for name, value in after.items():
+            if name in IGNORED_VARIABLES or not _NAME_PATTERN.match(name):
+                continue
+            old = before.get(name, None)
+            if old == value:
+                continue
+            elif old and value.endswith(os.pathsep + old):
+                ops.append(("prepend", name, value[: -len(old) - 1]))
+            elif old and value.startswith(old + os.pathsep):
+                ops.append(("append", name, value[len(old) + 1 :]))
+            else:
+                ops.append(("set", name, value))
+        for name in before:
+            if name not in after and name not in IGNORED_VARIABLES:
+                if _NAME_PATTERN.match(name):
+                    ops.append(("unset", name, None))
+        return cls(ops)
+
+    def to_list(self) -> list:
+        return [list(op) for op in self.ops]
+
+    @classmethod
+    def from_list(cls, ops: list):
+        return cls(ops)
+
+    def apply(self, env: dict) -> dict:
+        """
+        Returns a copy of ENV with the delta applied.
+        """
+        env = env.copy()
+        for op, name, value in self.ops:
+            old = env.get(name, "")
+            if op == "set":
+                env[name] = value
+            elif op == "prepend":
+                env[name] = value + os.pathsep + old if old else value
+            elif op == "append":
+                env[name] = old + os.pathsep + value if old else value
+            elif op == "unset":
+                env.pop(name, None)
+        return env
+
+    def shell_lines(self) -> list[str]:
+        """
+        Shell lines applying the delta.
+        """
+        lines = []
+        for op, name, value in self.ops:
+            if op == "set":
+                lines.append(f"export {name}={shlex.quote(value)}")
+            elif op == "prepend":
+                lines.append(f'export {name}={shlex.quote(value)}"${{{name}:+:${name}}}"')
+            elif op == "append":
+                lines.append(f'export {name}="${{{name}:+${name}:}}"{shlex.quote(value)}')
+            elif op == "unset":
+                lines.append(f"unset {name}")
+        return lines
+
+    def inverse_shell_lines(self) -> list[str]:
+        """
+        Shell lines undoing the delta: the entries prepended or appended to a
+        variable are removed, and the variables set are unset. Variables that
+        were unset cannot be restored.
+        """
+        lines = []
+        for op, name, value in reversed(self.ops):
+            if op == "set":
+                lines.append(f"unset {name}")
+            elif op in ("prepend", "append"):
+                for entry in value.split(os.pathsep):
+                    lines.extend(remove_entry_lines(name, entry))
+        return lines
+
+
+def remove_entry_lines(name: str, entry: str) -> list[str]:
+    """
+    POSIX shell lines removing all occurrences of ENTRY from the path-like
+    variable NAME.
+    """
+    return [
+        f'__nqx_rest="${{{name}:-}}:"',
+        '__nqx_path=""',
+        'while [ -n "$__nqx_rest" ]; do',
+        '    __nqx_p="${__nqx_rest%%:*}"',
+        '    __nqx_rest="${__nqx_rest#*:}"',
+        f'    [ "$__nqx_p" = {shlex.quote(entry)} ] || __nqx_path="${{__nqx_path:+$__nqx_path:}}$__nqx_p"',
+        "done",
+        f'export {name}="$__nqx_path"',
+        "unset __nqx_rest __nqx_path __nqx_p",
+    ]
@@ -0,0 +1,253 @@
+"""
+Journal of the changes made to a shell by the activation of environments.
+
+The activation at level N (the value of NQX_SHLVL once active) records what
+it changed in exported variables of the shell itself:
+
+- `_NQX_JOURNAL_N` lists the changed variables, as `saved:NAME` when NAME was
+  set or unset (its previous value, if it had one, is kept in
+  `_NQX_SAVED_N_NAME`), as `path:NAME` when entries were added to the
+  path-like variable NAME (those it did not contain yet are listed in
+  `_NQX_ADDED_N_NAME`), and the modules loaded by `module load` as
+  `module:MODULE`;
+- `_NQX_PS1_N` keeps the prompt.
+
+Deactivating level N undoes exactly those changes, whatever the configuration
+became since, and leaves the environment of level N-1 active, so that
+activations stack. The path-like variables changed are de-duplicated.
+"""
+
+import os
+import shlex
+
+SHLVL = "NQX_SHLVL"
+
+
+def journal_var(level: int) -> str:
+    return f"_NQX_JOURNAL_{level}"
+
+
+def saved_var(level: int, name: str) -> str:
+    return f"_NQX_SAVED_{level}_{name}"
+
+
+def added_var(level: int, name: str) -> str:
+    return f"_NQX_ADDED_{level}_{name}"
+
+
+def prompt_var(level: int) -> str:
+    return f"_NQX_PS1_{level}"
+
+
+def shell_level(environ: dict = None) -> int:
+    """
+    The number of activations stacked in the shell of ENVIRON.
+    """
+    if environ is None:
+        environ = os.environ
+    try:
+        return max(int(environ.get(SHLVL, "") or 0), 0)
+    except ValueError:
+        return 0
+
+
+def journal(environ: dict, level: int) -> list[str]:
+    return environ.get(journal_var(level), "").split()
+
+
+def journal_tokens(ops: list, modules: list = ()) -> list[str]:
+    """
+    The journal of the activation applying OPS, a list of `(op, name, word)`
+    as in `EnvDelta` but with shell words as values, and loading MODULES.
+    """
+    kinds = {}
+    for op, name, _ in ops:
+        if op in ("set", "unset"):
+            kinds[name] = "saved"
+        else:
+            kinds.setdefault(name, "path")
+    return [f"{kind}:{name}" for name, kind in kinds.items()] + [
+        f"module:{module}" for module in modules
+    ]
+
+
+def normalize_lines(name: str, exclude: str = "") -> list[str]:
+    """
+    POSIX shell lines removing the empty and duplicate entries of the
+    path-like variable NAME, and the entries listed in EXCLUDE (a colon
+    separated list, expanded in double quotes). NAME is unset if it ends up
+    empty.
+    """
+    return [
+        f'__nqx_rest="${{{name}:-}}:"',
+        '__nqx_path=""',
+        'while [ -n "$__nqx_rest" ]; do',
+        '    __nqx_p="${__nqx_rest%%:*}"',
+        '    __nqx_rest="${__nqx_rest#*:}"',
+        '    [ -n "$__nqx_p" ] || continue',
+        f'    case ":$__nqx_path:{exclude}:" in',
+        '        *":$__nqx_p:"*) ;;',
+        '        *) __nqx_path="${__nqx_path:+$__nqx_path:}$__nqx_p" ;;',
+        "    esac",
+        "done",
+        f'if [ -n "$__nqx_path" ]; then export {name}="$__nqx_path"; else unset {name}; fi',
+        "unset __nqx_rest __nqx_path __nqx_p",
+    ]
+
+
+def _record_added_lines(level: int, name: str, words: list[str]) -> list[str]:
+    """
+    Shell lines listing the entries of WORDS that NAME does not contain yet.
+    """
+    added = added_var(level, name)
+    lines = [f"unset {added}"]
+    for word in words:
+        lines += [
+            f'__nqx_rest={word}":"',
+            'while [ -n "$__nqx_rest" ]; do',
+            '    __nqx_p="${__nqx_rest%%:*}"',
+            '    __nqx_rest="${__nqx_rest#*:}"',
+            '    [ -n "$__nqx_p" ] || continue',
+            f'    case ":${{{name}:-}}:" in',
+            '        *":$__nqx_p:"*) ;;',
+            f'        *) export {added}="${{{added}:+${added}:}}$__nqx_p" ;;',
+            "    esac",
+            "done",
+        ]
+    lines.append("unset __nqx_rest __nqx_p")
+    return lines
+
+
+def op_lines(ops: list) -> list[str]:
+    """
+    Shell lines applying OPS, whose values are shell words.
+    """
+    lines = []
+    for op, name, word in ops:
+        if op == "set":
+            lines.append(f"export {name}={word}")
+        elif op == "prepend":
+            lines.append(f'export {name}={word}"${{{name}:+:${name}}}"')
+        elif op == "append":
+            lines.append(f'export {name}="${{{name}:+${name}:}}"{word}')
+        elif op == "unset":
+            lines.append(f"unset {name}")
+    return lines
+
+
+def activation_lines(
+    ops: list, level: int, modules: list = (), label: str = None
+) -> list[str]:
+    """
+    Shell lines applying OPS and loading MODULES as the activation at LEVEL,
+    recording them in the journal. The prompt is prefixed with LABEL.
+    """
+    tokens = journal_tokens(ops, modules)
+    lines = []
+    for token in tokens:
+        kind, name = token.split(":", 1)
+        if kind == "saved":
+            saved = saved_var(level, name)
+            lines.append(
+                f'unset {saved}; if [ -n "${{{name}+x}}" ]; then export {saved}="${name}"; fi'
+            )
+        elif kind == "path":
+            words = [word for _, n, word in ops if n == name]
+            lines.extend(_record_added_lines(level, name, words))
+
+    lines.extend(op_lines(ops))
+    for token in tokens:
+        kind, name = token.split(":", 1)
+        if kind == "path":
+            lines.extend(normalize_lines(name))
+    if len(modules) > 0:
+        lines.append("module load " + " ".join(shlex.quote(m) for m in modules))
+
+    lines.append(f"export {journal_var(level)}={shlex.quote(' '.join(tokens))}")
+    lines.append(f"export {SHLVL}={level}")
+    if label is not None:
+        prompt = prompt_var(level)
+        lines += [
+            'case "${PS1:-}" in',
+            "    *POWERLINE_COMMAND*) ;;",
+            f'    *) export {prompt}="${{PS1:-}}"; PS1={shlex.quote(f"(nqx:{label}) ")}"${{PS1:-}}" ;;',
+            "esac",
+        ]
+    return lines
+
+
+def undo_lines(tokens: list[str], level: int) -> list[str]:
+    """
+    Shell lines undoing the activation at LEVEL, whose journal is TOKENS.
+    """
+    lines = []
+    modules = [t.split(":", 1)[1] for t in tokens if t.startswith("module:")]
+    if len(modules) > 0:
+        lines.append(
+            "module unload " + " ".join(shlex.quote(m) for m in reversed(modules))
+        )
+    for token in reversed(tokens):
+        kind, name = token.split(":", 1)
+        if kind == "saved":
+            saved = saved_var(level, name)
+            lines.append(
+                f'if [ -n "${{{saved}+x}}" ]; then export {name}="${saved}"; '
+                f"unset {saved}; else unset {name}; fi"
+            )
+        elif kind == "path":
+            added = added_var(level, name)
+            lines.extend(normalize_lines(name, f"${{{added}:-}}"))
+            lines.append(f"unset {added}")
+
+    prompt = prompt_var(level)
+    lines += [
+        f'if [ -n "${{{prompt}+x}}" ]; then PS1="${prompt}"; unset {prompt}; fi',
+        f"unset {journal_var(level)}",
+        f"export {SHLVL}={level - 1}",
+    ]
+    return lines
+
+
+def undo_environ(environ: dict, level: int) -> dict:
+    """
+    The variables of ENVIRON once the activation at LEVEL is undone (except
+    for the modules loaded by `module load`).
+    """
+    env = dict(environ)
+    for token in reversed(journal(environ, level)):
+        kind, name = token.split(":", 1)
+        if kind == "saved":
+            saved = saved_var(level, name)
+            if saved in env:
+                env[name] = env.pop(saved)
+            else:
+                env.pop(name, None)
+        elif kind == "path":
+            added = set(env.pop(added_var(level, name), "").split(os.pathsep))
+            entries = []
+            for entry in env.get(name, "").split(os.pathsep):
+                if entry and entry not in added and entry not in entries:
+                    entries.append(entry)
+            if len(entries) > 0:
+                env[name] = os.pathsep.join(entries)
+            else:
+                env.pop(name, None)
+    env.pop(journal_var(level), None)
+    env.pop(prompt_var(level), None)
+    env[SHLVL] = str(level - 1)
+    return env
+
+
+def active_envs(environ: dict = None) -> list[str]:
+    """
+    The names of the environments stacked in the shell of ENVIRON, from the
+    first activated.
+    """
+    if environ is None:
+        environ = os.environ
+    names = []
+    env = dict(environ)
+    for level in range(shell_level(environ), 0, -1):
+        names.insert(0, env.get("NQX_ENV", None))
+        env = undo_environ(env, level)
+    return names
@@ -1,17 +1,10 @@
 import os
-import subprocess
 import logging
-import sys
-import tempfile
 
 from pathlib import Path
 
-from rich import print
-
 from nqx.core import EnvConfig
 
-import typer
-
 PYTHON_MODULEFILES_INIT = [
     "init/env_modules_python.py",
     "init/python.py",
@@ -187,7 +180,7 @@ def generate_module_python_script(*modules_command: tuple[str, ...], environment
         print(
             "MODULESHOME is not set or does not exist. Please set MODULESHOME to the path of the modules directory."
         )
-        typer.Exit(1)
+        raise FileNotFoundError("MODULESHOME is not set or does not exist.")
 
     MODULESHOME = Path(MODULESHOME)
 
@@ -243,7 +236,7 @@ def execute_module_in_env(*modules_command: tuple[str, ...], environment: EnvCon
     """
     Executes a modules command in an environment.
 
-    This spawns a subpython shell.
+    This runs in the persistent module worker shared by this nqx invocation.
 
     This uses the `module ***` command to load the modules in the specified environment.
     """
@@ -253,7 +246,6 @@ def execute_module_in_env(*modules_command: tuple[str, ...], environment: EnvCon
         print(
             "MODULESHOME is not set or does not exist. Please set MODULESHOME to the path of the modules directory."
         )
-        typer.Exit(1)
         raise FileNotFoundError("MODULESHOME is not set or does not exist.")
 
     MODULESHOME = Path(MODULESHOME)
@@ -285,31 +277,15 @@ def execute_module_in_env(*modules_command: tuple[str, ...], environment: EnvCon
     # Create a copy of the current environment variables dictionary
     env = environment.copy().env
     env["MODULESHOME"] = str(MODULESHOME)
-    env["MODULEPATH"] = os.environ.get("MODULEPATH")
-    env["MODULEPATH_modshare"] = os.environ.get("MODULEPATH_modshare")
+    for key in ("MODULEPATH", "MODULEPATH_modshare"):
+        if key in os.environ:
+            env[key] = os.environ[key]
 
-    modules_command = ["module"] + list(modules_command)
-    modules_command = " ".join(modules_command)
+    # All module commands of this invocation are executed by the same worker
+    from . import worker
 
-    magic_string = "!!!NQX!!!NQX!!!NQX!!!"
-    script = []
-    script.append(modules_command)
-    script.append(f'echo "{magic_string}"')
-    script.append(f'{sys.executable} -c "import os; print(os.environ.copy());"')
-    script = " && ".join(script)
-
-    logging.debug("executing python to extract the env variables")
-    logging.debug("python script contains: %s", script)
-
-    result = subprocess.run([script], capture_output=True, env=env, shell=True)
-
-    # Parse the output of the command to get the environment dictionary
-    erroutput = result.stderr.decode("utf-8").strip()
-    logging.debug("Got error output message %s", erroutput)
-    output = result.stdout.decode("utf-8").strip()
-    # logging.debug("Got output message %s", output)
-    parts = output.split(magic_string)
-    new_env = eval(parts[1])
+    logging.debug("Executing `module %s` in the module worker", modules_command)
+    new_env = worker.get_worker(env).execute(*modules_command, environment=env)
 
     logging.debug("Parsing env variables of which there are %i", len(new_env))
     if logging.getLogger().getEffectiveLevel() <= logging.DEBUG:
@@ -0,0 +1,138 @@
+"""
+Snapshots of the changes made to the environment by `module load`.
+
+Loading modules takes seconds on the clusters, so the resulting changes are
+captured once and replayed afterwards. A snapshot is keyed by the MODULEPATH,
+the modules already loaded, the modules to load and the state of the modulefiles
+that can provide them, so it is captured again whenever any of those change.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from nqx.core import EnvConfig, EnvDelta
+from nqx.cli.config import get_cache_dir
+from nqx.utils import memo
+
+from . import execute_module_in_env
+
+# Bump when the layout of the snapshots changes
+SNAPSHOT_VERSION = 1
+
+# Variables describing the state of the modules a snapshot is captured from
+KEY_VARIABLES = ("MODULEPATH", "LOADEDMODULES")
+
+
+def modulefile_paths(module_names, modulepath: str) -> list[str]:
+    """
+    Paths of the modulefiles (and of the files selecting the default version)
+    that may provide the modules, whether they exist or not.
+    """
+    paths = []
+    for directory in modulepath.split(os.pathsep):
+        if not directory:
+            continue
+        for name in module_names:
+            base = os.path.join(directory, name)
+            paths.extend([base, base + ".lua"])
+            if "/" not in name:
+                for default_file in (".version", "default", ".modulerc", ".modulerc.lua"):
+                    paths.append(os.path.join(base, default_file))
+    return paths
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def fingerprint(module_names, environment: dict) -> str:
+    modulepath = environment.get("MODULEPATH", "") or ""
+    key = {
+        "version": SNAPSHOT_VERSION,
+        "modules": list(module_names),
+        "environ": {k: environment.get(k) for k in KEY_VARIABLES},
+        "modulefiles": [
+            [path, _stat(path)] for path in modulefile_paths(module_names, modulepath)
+        ],
+    }
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def _snapshot_path(key: str):
+    return get_cache_dir("modules") / f"{key}.json"
+
+
+def read_snapshot(key: str):
+    """
+    Returns the snapshot with KEY, or None if it is not in the cache.
+    """
+    try:
+        return EnvDelta.from_list(memo.load_json(_snapshot_path(key))["delta"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def capture(module_names, environment: EnvConfig) -> EnvDelta:
+    """
+    Load the modules in ENVIRONMENT and return the changes they made.
+    """
+    logging.debug("Capturing the environment of modules %s", module_names)
+    new_environment = execute_module_in_env("load", *module_names, environment=environment)
+    return EnvDelta.between(environment.env, new_environment.env)
+
+
+def get_snapshot(*module_names: str, environment: EnvConfig = None):
+    """
+    Returns the key and the snapshot of the changes made by loading the modules
+    in ENVIRONMENT (by default, the current environment), capturing it if it is
+    not in the cache.
+    """
+    if environment is None:
+        environment = EnvConfig(env=os.environ.copy())
+
+    key = fingerprint(module_names, environment.env)
+    delta = read_snapshot(key)
+    if delta is not None:
+        logging.debug("Using the snapshot %s of modules %s", key, module_names)
+        return key, delta
+
+    delta = capture(module_names, environment)
+
+    path = _snapshot_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+        with open(tmp_path, "w") as f:
+            json.dump({"modules": list(module_names), "delta": delta.to_list()}, f)
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logging.debug("Could not store the snapshot of modules: %s", err)
+    return key, delta
+
+
+def snapshot_sources(module_names, environment: dict = None) -> list[str]:
+    """
+    The files a snapshot of the modules depends on.
+    """
+    if environment is None:
+        environment = os.environ
+    return modulefile_paths(module_names, environment.get("MODULEPATH", "") or "")
+
+
+def generate_snapshot_bash_script(delta: EnvDelta, exports: list[str] = ()) -> str:
+    """
+    A bash script executing its arguments in the environment with the snapshot
+    replayed, instead of loading the modules, and the shell lines EXPORTS.
+    """
+    script = ["#!/bin/bash"]
+    script.extend(delta.shell_lines())
+    script.extend(exports)
+    script.append('exec "$@"')
+    script.append("")
+    return "\n".join(script)
@@ -0,0 +1,180 @@
+"""
+A long-lived shell executing module commands.
+
+Initialising Environment Modules or Lmod and spawning a shell for every module
+command is slow, so a single bash process is started per nqx invocation and
+reused by all module operations. It receives `purge`, `load`... commands on its
+stdin and reports the exit codes and the captured environments on its stdout as
+NUL-delimited records, which are parsed as they are streamed.
+"""
+
+import atexit
+import logging
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import threading
+import uuid
+
+from nqx.utils import trace
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_worker = None
+
+
+class ModuleWorker:
+    """
+    A bash process with the `module` command initialised once.
+    """
+
+    def __init__(self, environment: dict):
+        self._token = f"__nqx_{uuid.uuid4().hex}".encode()
+        self._buffer = b""
+        self._lock = threading.RLock()
+
+        fd, self._log_path = tempfile.mkstemp(prefix="nqx-modules-", suffix=".log")
+        os.close(fd)
+
+        logging.debug("Starting the module worker")
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=environment,
+        )
+        self.env = dict(environment)
+
+        # Initialise the module command, unless it was exported by the parent shell
+        moduleshome = shlex.quote(environment.get("MODULESHOME", ""))
+        self._send(
+            "if ! type module >/dev/null 2>&1; then",
+            f"    . {moduleshome}/init/bash >>{shlex.quote(self._log_path)} 2>&1",
+            "fi",
+        )
+        self.env = self.capture()
+
+    def _send(self, *lines: str):
+        if self.process.poll() is not None:
+            raise RuntimeError("The module worker exited unexpectedly.")
+        script = "\n".join(lines) + f"\nprintf '%s\\0' {self._token.decode()}\n"
+        self.process.stdin.write(script.encode())
+        self.process.stdin.flush()
+        return self._read_records()
+
+    def _read_records(self) -> list[bytes]:
+        """
+        Read the NUL-delimited records written by the worker until the token.
+        """
+        records = []
+        fd = self.process.stdout.fileno()
+        while True:
+            parts = self._buffer.split(b"\0")
+            self._buffer = parts.pop()
+            for i, part in enumerate(parts):
+                if part == self._token:
+                    self._buffer = b"\0".join(parts[i + 1 :] + [self._buffer])
+                    return records
+                records.append(part)
+
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                raise RuntimeError("The module worker exited unexpectedly.")
+            self._buffer += chunk
+
+    def set_environment(self, environment: dict):
+        """
+        Make the environment of the worker equal to ENVIRONMENT, sending only
+        the variables that changed.
+        """
+        lines = []
+        for name in self.env:
+            if name not in environment and _NAME_PATTERN.match(name):
+                lines.append(f"unset {name}")
+        for name, value in environment.items():
+            if self.env.get(name) != value and _NAME_PATTERN.match(name):
+                lines.append(f"export {name}={shlex.quote(value)}")
+        if len(lines) > 0:
+            with self._lock:
+                self._send(*lines)
+                self.env = dict(environment)
+
+    def run(self, *args: str):
+        """
+        Execute `module ARGS...`, raising a RuntimeError if it fails.
+        """
+        command = " ".join(["module"] + [shlex.quote(arg) for arg in args])
+        logging.debug("Module worker executing: %s", command)
+        log_path = shlex.quote(self._log_path)
+        with self._lock:
+            records = self._send(
+                f": >{log_path}",
+                f"{command} >>{log_path} 2>&1",
+                "printf '%s\\0' \"$?\"",
+            )
+        returncode = int(records[-1])
+
+        with open(self._log_path) as f:
+            output = f.read().strip()
+        if output:
+            logging.debug("Module worker output: %s", output)
+        if returncode != 0:
+            raise RuntimeError(f"Command `{command}` failed: {output}")
+
+    def purge(self):
+        return self.run("purge")
+
+    def load(self, *module_names: str):
+        return self.run("load", *module_names)
+
+    def capture(self) -> dict:
+        """
+        Returns the current environment of the worker.
+        """
+        with self._lock:
+            records = self._send("env -0")
+            env = {}
+            for record in records:
+                name, _, value = record.decode("utf-8", "surrogateescape").partition("=")
+                env[name] = value
+            self.env = env
+        return env.copy()
+
+    def execute(self, *args: str, environment: dict) -> dict:
+        """
+        Execute `module ARGS...` in ENVIRONMENT and returns the resulting environment.
+        """
+        with self._lock, trace.span(f"module {args[0]}", "module", args=list(args)):
+            self.set_environment(environment)
+            try:
+                self.run(*args)
+            except RuntimeError:
+                # A failed command may have changed the environment of the
+                # worker: it is sent again in full by the next one
+                if self.process.poll() is None:
+                    self.capture()
+                raise
+            return self.capture()
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        if os.path.exists(self._log_path):
+            os.remove(self._log_path)
+
+
+def get_worker(environment: dict = None) -> ModuleWorker:
+    """
+    The module worker shared by all module operations of this nqx invocation.
+    """
+    global _worker
+    if _worker is None or _worker.process.poll() is not None:
+        if environment is None:
+            environment = os.environ.copy()
+        _worker = ModuleWorker(environment)
+        atexit.register(_worker.close)
+    return _worker
@@ -20,5 +20,9 @@ def get_provider(provider: Optional[PythonProviderType] = None):
         from . import modules
 
         return modules
+    elif provider == PythonProviderType.mamba:
+        from . import mamba
+
+        return mamba
     else:
         raise ValueError(f"Unknown Python Provider {provider}")
@@ -0,0 +1,13 @@
+import typer
+
+from nqx.core import EnvConfig
+
+from ..venv.mamba.setup import is_installed
+
+
+def get_env_with_python(env: EnvConfig):
+    # Python is installed in the environments by micromamba
+    if not is_installed():
+        print("micromamba is not available. Cannot use python provider.")
+        raise typer.Exit(1)
+    return env
@@ -3,6 +3,8 @@ from nqx.core import EnvConfig
 import typer
 
 from .. import modules
+from ..modules.snapshot import get_snapshot
+from . import registry
 
 
 def is_available():
@@ -16,5 +18,12 @@ def get_env_with_python(env: EnvConfig):
         )
         raise typer.Exit(1)
 
-    modules.execute_module_in_env("load", "python", environment=env)
+    # Replayed from its snapshot, unless the python modulefiles changed
+    _, delta = get_snapshot("python", environment=env)
+    env = EnvConfig(env=delta.apply(env.env))
+    try:
+        registry.get_interpreter(env.env)
+    except (FileNotFoundError, RuntimeError) as err:
+        print(f"`module load python` does not provide Python: {err}")
+        raise typer.Exit(1)
     return env
@@ -0,0 +1,127 @@
+"""
+Registry of the Python interpreters found by the providers.
+
+Asking an interpreter for its version takes a process spawn, and finding it
+through the modules a whole `module load`, so both are done once. The registry
+($NQX_HOME/interpreters.json) records, by real path, the version, ABI tag and
+loaded modules of every interpreter, together with its mtime: an entry is
+valid as long as the interpreter file has not changed.
+"""
+
+from typing import Optional
+from pathlib import Path
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+from nqx.cli.config import get_nqx_home
+from nqx.utils import memo
+
+REGISTRY_FILE = "interpreters.json"
+
+# Bump when the layout of the entries changes
+REGISTRY_VERSION = 1
+
+PROBE_SCRIPT = (
+    "import json, sys, sysconfig; print(json.dumps({"
+    "'version': '%d.%d.%d' % sys.version_info[:3], "
+    "'abi': sysconfig.get_config_var('SOABI') or sys.implementation.cache_tag}))"
+)
+
+
+def registry_path() -> Path:
+    return get_nqx_home() / REGISTRY_FILE
+
+
+def read_registry() -> dict:
+    """
+    The registered interpreters, by real path.
+    """
+    try:
+        registry = memo.load_json(registry_path())
+    except (OSError, ValueError):
+        return {}
+    if registry.get("version") != REGISTRY_VERSION:
+        return {}
+    return dict(registry.get("interpreters", {}))
+
+
+def write_registry(interpreters: dict):
+    path = registry_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"version": REGISTRY_VERSION, "interpreters": interpreters},
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, path)
+    except OSError as err:
+        logging.debug("Could not write the interpreter registry: %s", err)
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def is_valid(entry: dict) -> bool:
+    return entry.get("mtime") is not None and _mtime(entry["path"]) == entry["mtime"]
+
+
+def find_python(environment: dict) -> Optional[str]:
+    """
+    The real path of the `python` of ENVIRONMENT, without running it.
+    """
+    path = shutil.which("python", path=environment.get("PATH", ""))
+    return None if path is None else os.path.realpath(path)
+
+
+def probe(path: str, environment: dict) -> dict:
+    """
+    Run the interpreter at PATH to get its version and ABI tag.
+    """
+    logging.debug("Probing the interpreter %s", path)
+    result = subprocess.run(
+        [path, "-I", "-S", "-c", PROBE_SCRIPT],
+        env=environment,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"The interpreter {path} does not run: {result.stderr}")
+    return json.loads(result.stdout)
+
+
+def get_interpreter(environment: dict) -> dict:
+    """
+    The registry entry of the `python` of ENVIRONMENT, probing and registering
+    it if it is new or changed.
+    """
+    path = find_python(environment)
+    if path is None:
+        raise FileNotFoundError("Python is not available in the environment")
+
+    interpreters = read_registry()
+    entry = interpreters.get(path)
+    if entry is not None and is_valid(entry):
+        logging.debug("Using the registered interpreter %s", path)
+        return entry
+
+    entry = {
+        "path": path,
+        "mtime": _mtime(path),
+        **probe(path, environment),
+        "modules": [m for m in environment.get("LOADEDMODULES", "").split(":") if m],
+        "registered": time.time(),
+    }
+    interpreters[path] = entry
+    write_registry(interpreters)
+    return entry
@@ -0,0 +1,33 @@
+from .setup import (
+    is_installed,
+    install,
+    create_env,
+    activate_env,
+    activation_delta,
+    install_packages,
+    sync_packages,
+    check_cache,
+)
+
+# The environments are laid out in the depot like the ones of uv
+from ..uv.setup import (
+    deactivate_env,
+    list_envs,
+    compile_bytecode,
+    remove_env,
+    set_env_config,
+    get_env_config,
+    env_config_path,
+    write_env_config,
+    read_env_config,
+    run_python_command,
+)
+from .pack import unpack_env
+from ..uv.pack import pack_env
+from ..uv.registry import (
+    get_registry,
+    last_used,
+    rebuild_registry,
+    record_sizes,
+    update_registry,
+)
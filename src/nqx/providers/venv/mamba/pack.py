@@ -0,0 +1,27 @@
+from typing import Optional
+from pathlib import Path
+
+from ..uv import pack
+from .setup import capture_activate_scripts
+
+
+def unpack_env(
+    archive: Path,
+    venv_depot,
+    name: Optional[str] = None,
+    *,
+    force=False,
+    verify=False,
+    jobs: Optional[int] = None,
+) -> str:
+    """
+    Extract the environment packed in ARCHIVE to the depot as NAME, which must
+    be where it was packed from: the prefix of conda packages is not only found
+    in their scripts. Returns its name.
+    """
+    name = pack.unpack_env(
+        archive, venv_depot, name, force=force, verify=verify, jobs=jobs, relocatable=False
+    )
+    # The activate.d scripts are run again in the environment of this host
+    capture_activate_scripts(name, venv_depot)
+    return name
@@ -0,0 +1,324 @@
+"""
+Environments of conda packages, created by micromamba (or mamba).
+
+The packages are extracted once, in parallel, into a package cache shared by
+all the environments, from which they are hardlinked: the cache should be on
+the filesystem of the depot (see `check_cache`). The `mamba` section of the
+configuration sets:
+
+- `bin`: the micromamba executable, by default the one on the PATH;
+- `channels`: the channels to install from, `conda-forge` by default;
+- `local_channel`: a directory with an indexed channel, searched first, and
+  the only one used when `internet` is false;
+- `pkgs_dirs`: the package cache, by default $NQX_HOME/mamba/pkgs;
+- `extract_threads`: the number of packages extracted at once (0: one per core);
+- `python`: the spec of the Python of the environments, like "python=3.11".
+
+The environments live in the depot like the ones of uv, and are listed and
+removed the same way. They are activated like them too, with CONDA_PREFIX and
+CONDA_DEFAULT_ENV set, and the changes made by the `etc/conda/activate.d`
+shell scripts of their packages: those are captured once the packages are
+installed and replayed as an `EnvDelta`, without running the scripts on every
+activation.
+
+They are packed like the ones of uv too, but since conda packages embed their
+prefix in binary files as well, they are only unpacked at their original path.
+"""
+
+from typing import Optional
+from pathlib import Path
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+
+from nqx.core import EnvConfig, EnvDelta
+from nqx.cli.config import get_config, get_nqx_home
+from nqx.utils import disk, resolve_env_vars
+
+from ..uv.setup import activate_env as activate_venv, get_env_config, set_env_config
+
+# Executables looked for on the PATH, by order of preference
+MAMBA_BINARIES = ("micromamba", "mamba")
+
+DEFAULT_CHANNELS = ("conda-forge",)
+
+
+def mamba_settings() -> dict:
+    return get_config().get("mamba", None) or {}
+
+
+def mamba_bin() -> Optional[str]:
+    configured = mamba_settings().get("bin", None)
+    if configured is not None:
+        return str(resolve_env_vars(configured))
+    if os.environ.get("MAMBA_EXE"):
+        return os.environ["MAMBA_EXE"]
+    for binary in MAMBA_BINARIES:
+        path = shutil.which(binary)
+        if path is not None:
+            return path
+    return None
+
+
+def is_installed():
+    return mamba_bin() is not None
+
+
+def install(verbose=False):
+    import typer
+
+    print()
+    print(
+        "micromamba is not installed. To create conda environments, NQX requires micromamba to be installed."
+    )
+    print("Install it by running the following command :")
+    print()
+    print('"${SHELL}" <(curl -L micro.mamba.pm/install.sh)')
+    print()
+    raise typer.Exit(1)
+
+
+def pkgs_dir() -> Path:
+    location = mamba_settings().get("pkgs_dirs", None)
+    if location is not None:
+        return resolve_env_vars(location)
+    return get_nqx_home() / "mamba" / "pkgs"
+
+
+def local_channel() -> Optional[Path]:
+    location = mamba_settings().get("local_channel", None)
+    if location is None:
+        return None
+    return resolve_env_vars(location)
+
+
+def mamba_environment(environment: dict) -> dict:
+    """
+    A copy of ENVIRONMENT setting the package cache and extraction threads.
+    """
+    env = dict(environment)
+    env["CONDA_PKGS_DIRS"] = str(pkgs_dir())
+    threads = mamba_settings().get("extract_threads", 0)
+    env["MAMBA_EXTRACT_THREADS"] = str(threads or os.cpu_count() or 1)
+    env.setdefault("MAMBA_ROOT_PREFIX", str(get_nqx_home() / "mamba"))
+    return env
+
+
+def channel_args() -> list[str]:
+    """
+    The channels to install from: the local one first, then the remote ones
+    if there is internet.
+    """
+    config = get_config()
+    args = ["--override-channels"]
+    channel = local_channel()
+    if channel is not None:
+        args.extend(["-c", channel.absolute().as_uri()])
+    if config.get("internet", True):
+        for name in mamba_settings().get("channels", DEFAULT_CHANNELS):
+            args.extend(["-c", name])
+    elif channel is None:
+        raise RuntimeError("Cannot install conda packages without internet nor local_channel")
+    else:
+        args.append("--offline")
+    return args
+
+
+def conda_variables(name: str, venv_path: Path) -> dict:
+    return {"CONDA_PREFIX": str(venv_path), "CONDA_DEFAULT_ENV": name}
+
+
+def capture_activate_scripts(name, venv_depot):
+    """
+    Record the changes made by the `etc/conda/activate.d` shell scripts of the
+    environment NAME, replayed by `activate_env`.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    scripts = sorted((venv_path / "etc" / "conda" / "activate.d").glob("*.sh"))
+    delta = EnvDelta()
+    if len(scripts) > 0:
+        before = activate_venv(
+            name, venv_depot, environment=EnvConfig(env=dict(os.environ))
+        ).env
+        before.update(conda_variables(name, venv_path))
+        script = 'for f in "$@"; do . "$f" || exit; done; env -0'
+        result = subprocess.run(
+            ["bash", "--noprofile", "--norc", "-c", script, "activate.d", *scripts],
+            env=before,
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"Failed to run the activation scripts of {name}: "
+                + result.stderr.decode(errors="replace").strip()
+            )
+        after = {}
+        for record in result.stdout.split(b"\0"):
+            key, _, value = record.decode("utf-8", "surrogateescape").partition("=")
+            if key:
+                after[key] = value
+        delta = EnvDelta.between(before, after)
+    logging.debug("Activation scripts of %s: %s", name, delta)
+    set_env_config(name, venv_depot, "activate_d", delta.to_list())
+
+
+def activate_env(name: str, venv_depot: str, *, environment: EnvConfig):
+    """
+    Activate the environment NAME like a virtual environment, with the
+    variables of conda. The changes of its activation scripts are given by
+    `activation_delta`.
+    """
+    environment = activate_venv(name, venv_depot, environment=environment)
+    venv_path = resolve_env_vars(venv_depot) / name
+    environment.env.update(conda_variables(name, venv_path))
+    return environment
+
+
+def activation_delta(name: str, venv_depot: str) -> EnvDelta:
+    """
+    The changes made by the `etc/conda/activate.d` scripts of NAME, as
+    captured by `capture_activate_scripts`.
+    """
+    return EnvDelta.from_list(get_env_config(name, venv_depot, "activate_d", None) or [])
+
+
+def check_cache(venv_depot) -> Optional[str]:
+    """
+    A warning if micromamba cannot hardlink packages from the cache to the depot.
+    """
+    if disk.same_device(pkgs_dir(), resolve_env_vars(venv_depot)):
+        return None
+    return (
+        f"The package cache {pkgs_dir()} is not on the filesystem of the environments "
+        f"{resolve_env_vars(venv_depot)}: packages will be copied instead of "
+        "hardlinked. Set `mamba.pkgs_dirs` in the configuration of the cluster."
+    )
+
+
+def _run_mamba(
+    command: str, venv_path: Path, args: list[str], environment: EnvConfig
+):
+    config = get_config()
+    mamba = mamba_bin()
+    if mamba is None:
+        raise RuntimeError("micromamba is not installed")
+    argv = [mamba, command, "--yes", "--prefix", str(venv_path)]
+    if config.get("verbose", False):
+        argv.append("-v")
+    argv += channel_args() + args
+    logging.debug("Running %s", argv)
+    return subprocess.run(argv, env=mamba_environment(environment.env))
+
+
+def create_env(
+    name, pkg, venv_depot: str, *, environment: EnvConfig, force=False, process=None
+):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not is_installed():
+        install()
+
+    if venv_path.exists():
+        if force:
+            shutil.rmtree(venv_path)
+        else:
+            import typer
+
+            print(f"Environment {venv_path} already exists")
+            raise typer.Exit()
+
+    logging.debug("Creating conda environment %s", venv_path)
+    python = mamba_settings().get("python", "python")
+    result = _run_mamba("create", venv_path, [python], environment)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to create environment {name}")
+
+    environment.env["VIRTUAL_ENV"] = str(venv_path)
+    return environment
+
+
+def requirements_hash(file: Optional[Path], *packages) -> str:
+    """
+    The hash of what an environment is installed from: the requirements FILE,
+    the PACKAGES and the channels.
+    """
+    h = hashlib.sha256()
+    if file is not None:
+        h.update(Path(file).read_bytes())
+    h.update("\n".join([*packages, *channel_args()]).encode())
+    return h.hexdigest()
+
+
+def _specs(file: Path) -> list[str]:
+    """
+    The package specs of the requirements FILE.
+    """
+    with open(file) as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+    return [line for line in lines if line]
+
+
+def install_packages(
+    name,
+    *packages,
+    file: Optional[Path] = None,
+    venv_depot: str,
+    environment: EnvConfig,
+):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Environment {venv_path} does not exist")
+
+    args = [] if file is None else ["--file", str(file)]
+    logging.debug("Installing packages (%s) in environment %s", args, venv_path)
+    result = _run_mamba("install", venv_path, args + list(packages), environment)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to install packages in environment {name}")
+    set_env_config(name, venv_depot, "lock", requirements_hash(file, *packages))
+    capture_activate_scripts(name, venv_depot)
+    return result
+
+
+def sync_packages(
+    name,
+    *packages,
+    file: Path,
+    venv_depot: str,
+    environment: EnvConfig,
+    upgrade=False,
+) -> bool:
+    """
+    Install the requirements FILE and PACKAGES again if they changed, or update
+    them if UPGRADE. Unlike with uv, the packages no longer required are kept.
+    Returns False if the environment was already up to date.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Environment {venv_path} does not exist")
+
+    digest = requirements_hash(file, *packages)
+    if not upgrade and get_env_config(name, venv_depot, "lock") == digest:
+        logging.debug("Environment %s is up to date with %s", name, file)
+        return False
+
+    if upgrade:
+        # `update` only takes specs
+        result = _run_mamba("update", venv_path, [*_specs(file), *packages], environment)
+    else:
+        args = ["--file", str(file), *packages]
+        result = _run_mamba("install", venv_path, args, environment)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to synchronize environment {name}")
+
+    set_env_config(name, venv_depot, "lock", digest)
+    capture_activate_scripts(name, venv_depot)
+    return True
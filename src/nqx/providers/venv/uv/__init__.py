@@ -0,0 +1,28 @@
+from .setup import (
+    is_installed,
+    install,
+    create_env,
+    activate_env,
+    activation_delta,
+    deactivate_env,
+    list_envs,
+    install_packages,
+    sync_packages,
+    compile_bytecode,
+    remove_env,
+    set_env_config,
+    get_env_config,
+    env_config_path,
+    write_env_config,
+    read_env_config,
+    run_python_command,
+)
+from .cache import check_cache
+from .pack import pack_env, unpack_env
+from .registry import (
+    get_registry,
+    last_used,
+    rebuild_registry,
+    record_sizes,
+    update_registry,
+)
@@ -0,0 +1,124 @@
+"""
+Placement and link mode of the uv cache.
+
+The `uv_cache` section of the configuration (usually of a cluster) sets:
+
+- `location`: the cache directory, which should be on the filesystem of the
+  venv depot so that uv can hardlink the installed files from it;
+- `link_mode`: how uv installs files from the cache, `hardlink`, `copy`,
+  `symlink` or `clone`;
+- `max_size`: the size `nqx cache prune` keeps the cache under, like "50G".
+
+They are passed to every uv invocation through UV_CACHE_DIR and UV_LINK_MODE.
+"""
+
+from typing import Optional
+from pathlib import Path
+import os
+
+from nqx.cli.config import get_config
+from nqx.utils import disk, resolve_env_vars
+
+LINK_MODES = ("hardlink", "copy", "symlink", "clone")
+
+# Directories of the cache buckets grouping entries by source
+NAMESPACES = ("pypi", "index", "url", "path", "git", "local", "built")
+
+
+def cache_settings() -> dict:
+    return get_config().get("uv_cache", None) or {}
+
+
+def cache_dir() -> Path:
+    """
+    The directory of the uv cache: the configured location, or the one uv
+    would use by default.
+    """
+    location = cache_settings().get("location", None)
+    if location is not None:
+        return resolve_env_vars(location)
+    if os.environ.get("UV_CACHE_DIR"):
+        return Path(os.environ["UV_CACHE_DIR"])
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache_home) / "uv"
+
+
+def link_mode() -> Optional[str]:
+    mode = cache_settings().get("link_mode", None)
+    if mode is not None and mode not in LINK_MODES:
+        raise ValueError(f"Invalid uv link mode {mode}, expected one of {LINK_MODES}")
+    return mode
+
+
+def uv_environment(environment: Optional[dict] = None) -> dict:
+    """
+    A copy of ENVIRONMENT (by default, the current one) setting the cache and
+    link mode of uv.
+    """
+    env = dict(os.environ if environment is None else environment)
+    if cache_settings().get("location", None) is not None:
+        env["UV_CACHE_DIR"] = str(cache_dir())
+    mode = link_mode()
+    if mode is not None:
+        env["UV_LINK_MODE"] = mode
+    return env
+
+
+def same_device(venv_depot) -> bool:
+    """
+    Whether the cache and the depot are on the same filesystem, so that files
+    can be hardlinked between them.
+    """
+    return disk.same_device(cache_dir(), resolve_env_vars(venv_depot))
+
+
+def check_cache(venv_depot) -> Optional[str]:
+    """
+    A warning if uv cannot hardlink files from the cache to the depot.
+    """
+    if link_mode() not in (None, "hardlink") or same_device(venv_depot):
+        return None
+    return (
+        f"The uv cache {cache_dir()} is not on the filesystem of the environments "
+        f"{resolve_env_vars(venv_depot)}: files will be copied instead of "
+        "hardlinked. Set `uv_cache.location` in the configuration of the cluster."
+    )
+
+
+def cache_entries() -> dict:
+    """
+    The entries of the cache that can be removed independently (a package,
+    an archive, a built wheel...), by path relative to the cache.
+    """
+    root = cache_dir()
+    entries = {}
+    if not root.is_dir():
+        return entries
+    stack = [p for p in root.iterdir() if p.is_dir() and not p.is_symlink()]
+    while stack:
+        bucket = stack.pop()
+        for entry in bucket.iterdir():
+            if entry.name in NAMESPACES and entry.is_dir():
+                stack.append(entry)
+            elif not entry.name.startswith("."):
+                entries[str(entry.relative_to(root))] = entry
+    return entries
+
+
+def scan_entries(entries: dict, jobs: Optional[int] = None) -> tuple[dict, dict]:
+    """
+    When the ENTRIES were last used by uv, as best known, and their disk usage.
+    The access times changed by the scan are restored, so that it does not
+    count as a use.
+    """
+    stats = {name: os.stat(path, follow_symlinks=False) for name, path in entries.items()}
+    usage = disk.disk_usage(entries, jobs)
+    for name, st in stats.items():
+        try:
+            os.utime(
+                entries[name], ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False
+            )
+        except OSError:
+            pass
+    ages = {name: max(st.st_atime, st.st_mtime) for name, st in stats.items()}
+    return ages, usage
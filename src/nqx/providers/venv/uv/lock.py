@@ -0,0 +1,118 @@
+"""
+Locks of the requirements files, to resolve them only once.
+
+A lock is the output of `uv pip compile` for a requirements file, stored under
+`$NQX_HOME/cache/locks` with a name derived from everything the resolution
+depends on: the contents of the requirements, the extra packages, the Python
+version, the platform and the index settings. Environments created with the
+same inputs are installed from the same lock, until `nqx lock --upgrade`
+resolves it again.
+"""
+
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import platform
+
+from nqx.cli.config import get_cache_dir
+
+from .wheelhouse import compile_requirements, index_options
+
+# Bump when the layout of the locks changes
+LOCK_VERSION = 1
+
+# Environment variables changing where uv looks for packages
+INDEX_VARIABLES = (
+    "UV_INDEX_URL",
+    "UV_EXTRA_INDEX_URL",
+    "UV_FIND_LINKS",
+    "UV_NO_INDEX",
+    "UV_INDEX_STRATEGY",
+)
+
+
+def _requirements_contents(file: Path) -> list[str]:
+    """
+    The contents of the requirements FILE and of the ones it includes.
+    """
+    contents = []
+    with open(file) as f:
+        text = f.read()
+    contents.append(text)
+    for line in text.splitlines():
+        parts = line.split("#", 1)[0].split()
+        if len(parts) > 1 and parts[0] in ("-r", "--requirement", "-c", "--constraint"):
+            contents.extend(_requirements_contents(Path(file).parent / parts[1]))
+    return contents
+
+
+def lock_key(
+    file: Path, python_version: str, *packages: str, environment: dict = None
+) -> str:
+    if environment is None:
+        environment = os.environ
+    key = {
+        "version": LOCK_VERSION,
+        "requirements": _requirements_contents(file),
+        "packages": sorted(packages),
+        "python": python_version,
+        "platform": [platform.system(), platform.machine()],
+        "index": index_options(file),
+        "environ": {k: environment.get(k) for k in INDEX_VARIABLES},
+    }
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def lock_hash(path: Path) -> str:
+    """
+    The hash of the pins of a lock, identifying what it installs.
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def lock_path(key: str) -> Path:
+    return get_cache_dir("locks") / f"{key}.txt"
+
+
+def _option_lines(options: list[str]) -> list[str]:
+    lines = []
+    for option in options:
+        if option.startswith("-"):
+            lines.append(option)
+        else:
+            lines[-1] += f" {option}"
+    return lines
+
+
+def get_lock(
+    file: Path,
+    python_version: str,
+    *packages: str,
+    upgrade: bool = False,
+    environment: dict = None,
+) -> Path:
+    """
+    Returns the lock of the requirements FILE and PACKAGES for PYTHON_VERSION,
+    resolving it if it does not exist or UPGRADE is set.
+    """
+    path = lock_path(lock_key(file, python_version, *packages, environment=environment))
+    if path.exists() and not upgrade:
+        logging.debug("Using the lock %s of %s", path, file)
+        return path
+
+    logging.debug("Locking %s for Python %s", file, python_version)
+    pins = compile_requirements(file, python_version, *packages, environment=environment)
+
+    # The index options are kept, for uv to find the pinned packages
+    lines = _option_lines(index_options(file)) + pins
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
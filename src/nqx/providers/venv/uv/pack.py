@@ -0,0 +1,284 @@
+"""
+Archives of virtual environments, to move them as a single file.
+
+An environment is written as a tar stream compressed by `zstd -T0` (or `pigz`,
+or gzip when neither is available), made of a manifest with the hash of every
+file, the virtual environment and its kernel. Unpacking rewrites the paths of
+the original location in the scripts and the records of the environment.
+"""
+
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+
+from nqx.utils import resolve_env_vars
+
+from .setup import read_env_config, write_env_config
+
+# Bump when the layout of the archives changes
+PACK_VERSION = 1
+
+MANIFEST = "nqx-manifest.json"
+VENV_DIR = "venv"
+KERNEL_DIR = "kernel"
+
+# Compressors, by order of preference, and the magic bytes of their output
+COMPRESSORS = [
+    (["zstd", "-T0", "-q", "-c"], ["zstd", "-T0", "-q", "-d", "-c"]),
+    (["pigz", "-c"], ["pigz", "-d", "-c"]),
+]
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def archive_suffix() -> str:
+    return ".tar.zst" if shutil.which("zstd") else ".tar.gz"
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_hashes(root: Path, jobs: Optional[int] = None) -> dict:
+    """
+    The sha256 of the regular files under ROOT, and the target of its
+    symlinks, by path relative to ROOT.
+    """
+    files = []
+    links = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Symlinks to directories are listed, but not walked into
+        for name in filenames + dirnames:
+            path = os.path.join(dirpath, name)
+            if name in dirnames and not os.path.islink(path):
+                continue
+            relpath = os.path.relpath(path, root)
+            if os.path.islink(path):
+                links[relpath] = "link:" + os.readlink(path)
+            else:
+                files.append(relpath)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes = executor.map(lambda p: _hash_file(os.path.join(root, p)), files)
+        return {**dict(zip(files, hashes)), **links}
+
+
+def _compressor(decompress=False, magic: bytes = None) -> Optional[list[str]]:
+    for compress_command, decompress_command in COMPRESSORS:
+        is_zstd = compress_command[0] == "zstd"
+        if magic is not None and is_zstd != (magic == ZSTD_MAGIC):
+            continue
+        if shutil.which(compress_command[0]):
+            return decompress_command if decompress else compress_command
+    return None
+
+
+def pack_env(name, venv_depot, output: Path, jobs: Optional[int] = None) -> dict:
+    """
+    Write the virtual environment NAME and its kernel to the archive OUTPUT.
+    Returns its manifest.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+    config = read_env_config(name, venv_depot)
+
+    kernel_path = config.get("kernel_path", None)
+    if kernel_path is not None and not os.path.isdir(kernel_path):
+        kernel_path = None
+
+    manifest = {
+        "version": PACK_VERSION,
+        "name": name,
+        "path": str(venv_path),
+        "kernel_path": kernel_path,
+        "files": file_hashes(venv_path, jobs),
+    }
+    manifest_data = json.dumps(manifest).encode()
+    info = tarfile.TarInfo(MANIFEST)
+    info.size = len(manifest_data)
+
+    def write(tar):
+        # The manifest comes first, to be read before the files
+        tar.addfile(info, io.BytesIO(manifest_data))
+        tar.add(venv_path, arcname=VENV_DIR)
+        if kernel_path is not None:
+            tar.add(kernel_path, arcname=KERNEL_DIR)
+
+    command = _compressor()
+    logging.debug("Packing %s to %s with %s", venv_path, output, command)
+    if command is None:
+        with tarfile.open(output, "w:gz") as tar:
+            write(tar)
+        return manifest
+
+    with open(output, "wb") as f:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=f)
+        with tarfile.open(fileobj=process.stdin, mode="w|") as tar:
+            write(tar)
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"Failed to compress {output} with {command[0]}")
+    return manifest
+
+
+def _open_archive(archive: Path):
+    """
+    Returns the process decompressing ARCHIVE (or None) and the tar stream.
+    """
+    with open(archive, "rb") as f:
+        magic = f.read(4)
+    if not magic.startswith(GZIP_MAGIC) and magic != ZSTD_MAGIC:
+        raise ValueError(f"{archive} is not a packed environment")
+
+    command = _compressor(decompress=True, magic=magic)
+    if command is None:
+        if magic == ZSTD_MAGIC:
+            raise RuntimeError(f"zstd is required to unpack {archive}")
+        return None, tarfile.open(archive, "r|gz")
+
+    process = subprocess.Popen(command + [str(archive)], stdout=subprocess.PIPE)
+    return process, tarfile.open(fileobj=process.stdout, mode="r|")
+
+
+def _extract(tar, member, path):
+    if hasattr(tarfile, "tar_filter"):
+        tar.extract(member, path, filter="tar")
+    else:
+        tar.extract(member, path)
+
+
+def relocate(root: Path, old: str, new: str):
+    """
+    Replace the path OLD by NEW in the scripts of the virtual environment ROOT:
+    shebangs and activation scripts.
+    """
+    old, new = old.encode(), new.encode()
+    for entry in os.scandir(root / "bin"):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        with open(entry.path, "rb") as f:
+            data = f.read()
+        if old not in data or b"\0" in data:
+            continue
+        mode = entry.stat().st_mode
+        with open(entry.path, "wb") as f:
+            f.write(data.replace(old, new))
+        os.chmod(entry.path, mode)
+
+
+def unpack_env(
+    archive: Path,
+    venv_depot,
+    name: Optional[str] = None,
+    *,
+    force=False,
+    verify=False,
+    jobs: Optional[int] = None,
+    relocatable=True,
+) -> str:
+    """
+    Extract the environment packed in ARCHIVE to the depot as NAME (by default,
+    its original name). Returns its name. Unless RELOCATABLE, the environment
+    can only be extracted at the path it was packed from.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_depot.mkdir(parents=True, exist_ok=True)
+    tmp_path = venv_depot / f".unpack.tmp{os.getpid()}"
+    tmp_path.mkdir()
+
+    try:
+        process, tar = _open_archive(archive)
+        with tar:
+            member = tar.next()
+            if member is None or member.name != MANIFEST:
+                raise ValueError(f"{archive} is not a packed environment")
+            manifest = json.load(tar.extractfile(member))
+            for member in tar:
+                if member.name != MANIFEST:
+                    _extract(tar, member, tmp_path)
+        if process is not None and process.wait() != 0:
+            raise RuntimeError(f"Failed to decompress {archive}")
+
+        if verify:
+            hashes = file_hashes(tmp_path / VENV_DIR, jobs)
+            if hashes != manifest["files"]:
+                changed = [p for p, h in manifest["files"].items() if hashes.get(p) != h]
+                raise RuntimeError(f"Files do not match the manifest: {changed[:10]}")
+
+        if name is None:
+            name = manifest["name"]
+        venv_path = venv_depot / name
+        if not relocatable and str(venv_path) != manifest["path"]:
+            raise ValueError(
+                f"{archive} can only be unpacked at {manifest['path']}, not {venv_path}"
+            )
+        if venv_path.exists() and not force:
+            raise FileExistsError(f"Virtual environment {venv_path} already exists")
+        if (tmp_path / KERNEL_DIR).exists():
+            kernel_path = _kernel_path(manifest, name)
+            if kernel_path.exists() and not force:
+                raise FileExistsError(f"Kernel {kernel_path} already exists")
+        if venv_path.exists():
+            shutil.rmtree(venv_path)
+        os.replace(tmp_path / VENV_DIR, venv_path)
+
+        relocate(venv_path, manifest["path"], str(venv_path))
+
+        config = read_env_config(name, venv_depot)
+        config = json.loads(json.dumps(config).replace(manifest["path"], str(venv_path)))
+        config.pop("kernel_path", None)
+        if (tmp_path / KERNEL_DIR).exists():
+            config["kernel_path"] = str(
+                _install_kernel(tmp_path / KERNEL_DIR, manifest, name, venv_path)
+            )
+        write_env_config(name, config, venv_depot)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return name
+
+
+def _kernel_path(manifest: dict, name: str) -> Path:
+    """
+    Where the kernel of the environment NAME is installed: next to the original
+    kernel if that location exists here.
+    """
+    kernels_dir = Path(manifest["kernel_path"]).parent
+    if not kernels_dir.exists():
+        kernels_dir = Path.home() / ".local" / "share" / "jupyter" / "kernels"
+    return kernels_dir / name.lower()
+
+
+def _install_kernel(path: Path, manifest: dict, name: str, venv_path: Path) -> Path:
+    """
+    Install the kernel extracted at PATH for the environment NAME, replacing
+    the kernel of the same name.
+    """
+    kernel_path = _kernel_path(manifest, name)
+    if kernel_path.exists():
+        shutil.rmtree(kernel_path)
+    kernel_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(path), str(kernel_path))
+
+    with open(kernel_path / "kernel.json") as f:
+        kernel = json.load(f)
+    data = json.dumps(kernel)
+    data = data.replace(manifest["kernel_path"], str(kernel_path))
+    data = data.replace(manifest["path"], str(venv_path))
+    kernel = json.loads(data)
+    kernel["display_name"] = f"NQX:Python ({name})"
+    with open(kernel_path / "kernel.json", "w") as f:
+        json.dump(kernel, f)
+    return kernel_path
@@ -0,0 +1,178 @@
+"""
+An index of the environments of a depot, in a single file.
+
+Listing a depot on a shared filesystem requires reading the nqx_config.json of
+every environment. Instead, the registry file of the depot records them, and is
+updated when environments are created, synchronized or removed. It is rebuilt
+by scanning the depot in parallel when it is missing or on demand.
+
+The sizes of the environments, measured by `nqx du`, are only kept in the
+registry: writing them in nqx_config.json would make the activation scripts
+stale.
+"""
+
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import logging
+import os
+
+from nqx.utils import memo, resolve_env_vars
+
+from .wheelhouse import python_version_of
+
+# Bump when the layout of the registry changes
+REGISTRY_VERSION = 1
+
+REGISTRY_FILE = ".nqx-registry.json"
+
+# Touched by the activation scripts, `nqx run` and the kernel launcher
+LAST_USED_FILE = ".nqx-last-used"
+
+
+def registry_path(venv_depot) -> Path:
+    return resolve_env_vars(venv_depot) / REGISTRY_FILE
+
+
+def env_entry(venv_path: Path) -> Optional[dict]:
+    """
+    The registry entry of the environment at VENV_PATH, or None if it is not
+    an environment.
+    """
+    try:
+        st = os.stat(venv_path / "nqx_config.json")
+        with open(venv_path / "nqx_config.json") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    return {
+        "type": config.get("type", None),
+        "created": config.get("created", st.st_ctime),
+        "python": python_version_of(venv_path),
+        "size": None,
+        "last_used": last_used(venv_path),
+    }
+
+
+def last_used(venv_path: Path) -> Optional[float]:
+    """
+    When the environment was last activated, run or launched as a kernel.
+    """
+    try:
+        return os.stat(venv_path / LAST_USED_FILE).st_mtime
+    except OSError:
+        return None
+
+
+def read_registry(venv_depot) -> Optional[dict]:
+    """
+    The entries of the environments by name, or None if there is no registry.
+    """
+    try:
+        registry = memo.load_json(registry_path(venv_depot))
+    except (OSError, ValueError):
+        return None
+    if registry.get("version", None) != REGISTRY_VERSION:
+        return None
+    return dict(registry["envs"])
+
+
+def _write_registry(venv_depot, envs: dict):
+    path = registry_path(venv_depot)
+    tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        json.dump({"version": REGISTRY_VERSION, "envs": envs}, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _locked(venv_depot):
+    """
+    Serialize the updates of the registry between processes.
+    """
+    import fcntl
+
+    path = registry_path(venv_depot).with_suffix(".lock")
+    with open(path, "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except OSError as err:
+            # Some shared filesystems do not support locks
+            logging.debug("Cannot lock the registry: %s", err)
+        yield
+
+
+def rebuild_registry(venv_depot, jobs: Optional[int] = None) -> dict:
+    """
+    Scan the environments of the depot in parallel and write the registry.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    if not venv_depot.exists():
+        return {}
+
+    with os.scandir(venv_depot) as it:
+        paths = [
+            Path(entry.path)
+            for entry in it
+            if entry.is_dir() and not entry.name.startswith(".")
+        ]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        entries = executor.map(env_entry, paths)
+        envs = {p.name: e for p, e in zip(paths, entries) if e is not None}
+
+    with _locked(venv_depot):
+        # The sizes are only known by the registry
+        previous = read_registry(venv_depot) or {}
+        for name, entry in envs.items():
+            entry["size"] = previous.get(name, {}).get("size", None)
+        _write_registry(venv_depot, envs)
+    return envs
+
+
+def get_registry(venv_depot) -> dict:
+    """
+    The entries of the environments by name, building the registry if needed.
+    """
+    envs = read_registry(venv_depot)
+    if envs is None:
+        envs = rebuild_registry(venv_depot)
+    return envs
+
+
+def record_sizes(venv_depot, sizes: dict):
+    """
+    Record the SIZES of the environments (in bytes, by name) in the registry.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    get_registry(venv_depot)
+    with _locked(venv_depot):
+        envs = read_registry(venv_depot) or {}
+        for name, size in sizes.items():
+            if name in envs:
+                envs[name] = {**envs[name], "size": size}
+        _write_registry(venv_depot, envs)
+
+
+def update_registry(name, venv_depot):
+    """
+    Record the environment NAME in the registry, or forget it if it does not
+    exist anymore.
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    if not venv_depot.exists():
+        return
+
+    with _locked(venv_depot):
+        envs = read_registry(venv_depot)
+        if envs is None:
+            # Built on the next read, with all the environments
+            return
+        entry = env_entry(venv_depot / name)
+        if entry is None:
+            envs.pop(name, None)
+        else:
+            envs[name] = entry
+        _write_registry(venv_depot, envs)
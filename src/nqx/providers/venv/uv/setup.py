@@ -0,0 +1,391 @@
+from typing import Optional
+import os
+import subprocess
+import json
+import shlex
+import shutil
+import logging
+from pathlib import Path
+
+from nqx.core import EnvConfig, EnvDelta, EnvType
+from nqx.cli.config import get_config
+from nqx.utils import resolve_env_vars
+
+from .cache import uv_environment
+from .lock import get_lock, lock_hash
+from .wheelhouse import (
+    offline_install_args,
+    prefetched_requirements,
+    python_version_of,
+)
+
+UV_BIN = resolve_env_vars("$HOME/.cargo/bin/uv")
+
+
+def is_installed():
+    return os.path.exists(UV_BIN)
+
+
+def install(verbose=False):
+    import typer
+
+    print()
+    print(
+        "UV (A replacement for pip) is not installed. To work, NQX requires UV to be installed."
+    )
+    do_continue = typer.confirm(
+        "Do you want to install it now ? (Answering no will abort)"
+    )
+    print()
+    if not do_continue:
+        print("Aborting installation of UV.")
+        raise typer.Exit(1)
+
+    result = subprocess.run(
+        "curl -LsSf https://astral.sh/uv/install.sh | sh", shell=True
+    )
+    if result.returncode != 0:
+        print(
+            "Failed to install uv. Try to install it yourself by running the following command :"
+        )
+        print()
+        print("curl -LsSf https://astral.sh/uv/install.sh | sh")
+        print()
+        raise typer.Exit(1)
+
+
+def create_env(
+    name, pkg, venv_depot: str, *, environment: EnvConfig, force=False, process=None
+):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not is_installed():
+        install()
+
+    if not venv_path.exists():
+        venv_path.mkdir(parents=True, exist_ok=False)
+    else:
+        if force:
+            shutil.rmtree(venv_path)
+            venv_path.mkdir()
+        else:
+            import typer
+
+            print(f"Virtual environment {venv_path} already exists")
+            raise typer.Exit()
+
+    logging.debug("Creating virtual environment %s", venv_path)
+    result = subprocess.run(
+        [UV_BIN, "venv", "."], cwd=venv_path, env=uv_environment(environment.env)
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to create virtual environment {name}")
+
+    environment.env["VIRTUAL_ENV"] = str(venv_path)
+    return environment
+
+
+def activate_env(name: str, venv_depot: str, *, environment: EnvConfig):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        import typer
+
+        print(f"Virtual environment {venv_path} does not exist")
+        raise typer.Exit(1)
+
+    # Set the virtual env and path in the environment
+    environment.env["VIRTUAL_ENV"] = str(venv_path)
+
+    # if path is not set, this is probably for a generic activate so we leave a $PATH
+    environment.env["PATH"] = (
+        str(venv_path / "bin") + ":" + environment.env.get("PATH", "$PATH")
+    )
+    return environment
+
+
+def activation_delta(name: str, venv_depot: str) -> EnvDelta:
+    """
+    The changes made to the environment by the activation of NAME besides the
+    ones of `activate_env`: none for a virtual environment.
+    """
+    return EnvDelta()
+
+
+def deactivate_env(venv_depot: str):
+    venv_depot = resolve_env_vars(venv_depot)
+
+    deactivate_lines = []
+
+    # disable virtual env
+    deactivate_lines.append("unset VIRTUAL_ENV")
+
+    ##################
+    # remove from path, and the duplicate entries
+    path_parts = os.environ.get("PATH", "").split(os.pathsep)
+    new_parts = [
+        path
+        for path in dict.fromkeys(path_parts)
+        if path and not path.startswith(str(venv_depot) + os.sep)
+    ]
+    if new_parts != path_parts:
+        new_path = os.pathsep.join(new_parts)
+        deactivate_lines.append(f"export PATH={shlex.quote(new_path)}")
+
+    return deactivate_lines
+
+
+def remove_env(name, venv_depot):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        import typer
+
+        print(f"Virtual environment {venv_path} does not exist")
+        raise typer.Exit(1)
+
+    logging.debug("Removing virtual environment %s", venv_path)
+    return shutil.rmtree(venv_path)
+
+
+def list_envs(venv_depot):
+    venv_depot = resolve_env_vars(venv_depot)
+    logging.debug("Listing virtual environments in %s", venv_depot)
+
+    if not os.path.exists(venv_depot):
+        logging.debug("No virtual environments found in %s", venv_depot)
+        return []
+
+    dirs = os.listdir(venv_depot)
+    envs = []
+    for d in dirs:
+        if os.path.isdir(venv_depot / d):
+            env_name = os.path.basename(d)
+            envs.append((env_name, venv_depot / d))
+
+            # if (venv_depot / d / ".venv").exists():
+            #     env_name = os.path.basename(d)
+            #     envs.append((env_name, venv_depot / d))
+            # else:
+            #     logging.debug("Skipping %s, not a virtual environment", d)
+    return envs
+
+
+def env_config_path(name, venv_depot) -> Path:
+    venv_depot = resolve_env_vars(venv_depot)
+    return venv_depot / name / "nqx_config.json"
+
+
+def read_env_config(name, venv_depot) -> dict:
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Virtual environment {venv_path} does not exist")
+
+    settings_file = env_config_path(name, venv_depot)
+    if settings_file.exists():
+        with open(settings_file) as f:
+            return json.load(f)
+    return {}
+
+
+def write_env_config(name, config: dict, venv_depot):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Virtual environment {venv_path} does not exist")
+
+    with open(env_config_path(name, venv_depot), "w") as f:
+        json.dump(config, f)
+    return config
+
+
+def set_env_config(name, venv_depot, key :str, value):
+    config = read_env_config(name, venv_depot)
+    config[key] = value
+    write_env_config(name, config, venv_depot)
+
+
+def get_env_config(name, venv_depot, key: str, default = None):
+    config = read_env_config(name, venv_depot)
+    return config.get(key, default)
+
+
+def install_packages(
+    name,
+    *packages,
+    file: Optional[Path] = None,
+    venv_depot: str,
+    environment: EnvConfig,
+):
+    config = get_config()
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Virtual environment {venv_path} does not exist")
+
+    # set the env for uv
+    args = []
+    if config["verbose"]:
+        args.append("-v")
+
+    if not config.get("internet", True):
+        args.extend(offline_install_args())
+
+    lock = None
+    if file is not None:
+        lock = requirements_lock(venv_path, file, *packages, environment=environment.env)
+    if lock is not None:
+        # Install the pins of the requirements and the packages, resolved once
+        args.append("-r")
+        args.append(str(lock))
+        if config.get("internet", True):
+            packages = ()
+    elif file is not None:
+        args.append("-r")
+        args.append(str(file))
+
+    for pkg in packages:
+        args.append(pkg)
+
+    logging.debug(
+        "Installing packages (%s) in virtual environment VIRTUAL_ENV=%s",
+        args,
+        venv_path,
+    )
+    result = subprocess.run(
+        [UV_BIN, "pip", "install", *args],
+        env=uv_environment(environment.env),
+        cwd=venv_path,
+    )  # capture_output=True
+    if result.returncode != 0:
+        import typer
+
+        print("Installation failed because of an internal error of UV")
+        # raise RuntimeError(f"Failed to install packages in virtual environment {name}")
+        raise typer.Exit(1)
+    elif lock is not None:
+        set_env_config(name, venv_depot, "lock", lock_hash(lock))
+    return result
+
+
+def requirements_lock(
+    venv_path: Path, file: Path, *packages, upgrade=False, environment: dict = None
+) -> Optional[Path]:
+    """
+    The pinned requirements FILE and PACKAGES are installed from in the virtual
+    environment: their lock, or the prefetched pins without internet. Returns
+    None if the Python version of the environment is unknown.
+    """
+    config = get_config()
+    python_version = python_version_of(venv_path)
+    if not config.get("internet", True):
+        return prefetched_requirements(file, python_version)
+    if python_version is None:
+        return None
+    return get_lock(
+        file, python_version, *packages, upgrade=upgrade, environment=environment
+    )
+
+
+def sync_packages(
+    name,
+    *packages,
+    file: Path,
+    venv_depot: str,
+    environment: EnvConfig,
+    upgrade=False,
+) -> bool:
+    """
+    Make the installed distributions match the lock of FILE and PACKAGES,
+    installing and removing only what differs. Returns False if the environment
+    was already synchronized with the lock.
+    """
+    config = get_config()
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Virtual environment {venv_path} does not exist")
+
+    lock = requirements_lock(
+        venv_path, file, *packages, upgrade=upgrade, environment=environment.env
+    )
+    if lock is None:
+        raise RuntimeError(f"Cannot find the Python version of {venv_path}")
+
+    digest = lock_hash(lock)
+    if get_env_config(name, venv_depot, "lock") == digest:
+        logging.debug("Virtual environment %s is synchronized with %s", name, lock)
+        return False
+
+    args = []
+    if config["verbose"]:
+        args.append("-v")
+    if not config.get("internet", True):
+        args.extend(offline_install_args())
+
+    logging.debug("Synchronizing virtual environment %s with %s", venv_path, lock)
+    result = subprocess.run(
+        [UV_BIN, "pip", "sync", *args, str(lock)],
+        env=uv_environment(environment.env),
+        cwd=venv_path,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to synchronize virtual environment {name}")
+
+    set_env_config(name, venv_depot, "lock", digest)
+    return True
+
+
+def compile_bytecode(name, venv_depot, *, environment: EnvConfig, jobs: int = 0):
+    """
+    Byte-compile the site-packages of the virtual environment with its own
+    interpreter, with JOBS processes (0: one per core).
+    """
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    site_packages = sorted(str(p) for p in venv_path.glob("lib/python*/site-packages"))
+    if len(site_packages) == 0:
+        return
+
+    # The bytecode must be written next to the sources, not in a pycache prefix
+    env = environment.env.copy()
+    env.pop("PYTHONPYCACHEPREFIX", None)
+
+    command = [str(venv_path / "bin" / "python"), "-m", "compileall", "-q"]
+    command += ["-j", str(jobs), *site_packages]
+    logging.debug("Compiling bytecode: %s", command)
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        # Packages ship files that do not compile (templates, tests...)
+        logging.debug("Some files could not be compiled: %s", result.stdout)
+
+
+def run_python_command(
+    name, command, *, venv_depot, environment: EnvConfig, capture_output=False
+):
+    venv_depot = resolve_env_vars(venv_depot)
+    venv_path = venv_depot / name
+
+    if not venv_path.exists():
+        raise FileNotFoundError(f"Virtual environment {venv_path} does not exist")
+
+    py_path = venv_path / "bin" / "python"
+    command = [str(py_path)] + command
+    logging.debug(
+        "Running command %s in virtual environment VIRTUAL_ENV=%s", command, venv_path
+    )
+    result = subprocess.run(
+        command, env=environment.env, cwd=venv_path, capture_output=capture_output
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to run command in virtual environment {name}")
+    return result
@@ -0,0 +1,226 @@
+"""
+A local directory of wheels and sdists to install packages without internet.
+
+`nqx prefetch` resolves the requirements of every configuration type for the
+given Python versions, and downloads (or builds, for direct URLs) the pinned
+distributions in `$NQX_HOME/wheelhouse`. The pins are stored next to them, with
+direct URLs replaced by the version that was built, so that clusters without
+internet install exactly the same packages with no index access.
+
+uv cannot download distributions without installing them: they are fetched
+with pip, the one of nqx's interpreter if it has one, or else a pip run by
+`uv tool run`.
+"""
+
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import importlib.util
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from nqx.cli.config import get_nqx_home
+
+from .cache import uv_environment
+
+# Options of a requirements file telling where to look for packages
+INDEX_OPTIONS = ("--find-links", "-f", "--index-url", "-i", "--extra-index-url")
+
+# name-version[-build]-python-abi-platform.whl or name-version.tar.gz/.zip
+_DISTRIBUTION_PATTERN = re.compile(
+    r"^(?P<name>[A-Za-z0-9_.]+?)-(?P<version>[^-]+?)(-.*\.whl|\.whl|\.tar\.gz|\.zip)$"
+)
+
+
+def wheelhouse_dir() -> Path:
+    return get_nqx_home() / "wheelhouse"
+
+
+def pinned_requirements_path(file: Path, python_version: str) -> Path:
+    """
+    The pinned requirements resolved from FILE for PYTHON_VERSION (`3.11`).
+    """
+    return wheelhouse_dir() / "requirements" / f"{Path(file).stem}-py{python_version}.txt"
+
+
+def index_options(file: Path) -> list[str]:
+    """
+    The options of the requirements FILE (and of the ones it includes) telling
+    where to look for packages, e.g. `--find-links URL`.
+    """
+    options = []
+    with open(file) as f:
+        for line in f:
+            parts = line.split("#", 1)[0].split()
+            if len(parts) == 0:
+                continue
+            if parts[0] == "--no-index":
+                options.append(parts[0])
+            elif parts[0] in ("-r", "--requirement") and len(parts) > 1:
+                options.extend(index_options(Path(file).parent / parts[1]))
+            elif parts[0] in INDEX_OPTIONS and len(parts) > 1:
+                options.extend(parts[:2])
+            elif "=" in parts[0] and parts[0].split("=", 1)[0] in INDEX_OPTIONS:
+                options.extend(parts[0].split("=", 1))
+    return options
+
+
+def parse_pins(output: str) -> list[str]:
+    """
+    The requirements of the output of `uv pip compile`, without options and
+    annotations.
+    """
+    pins = []
+    for line in output.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        if line and not line.startswith(("#", "-")):
+            pins.append(line)
+    return pins
+
+
+def compile_requirements(
+    file: Path, python_version: str, *packages: str, environment: dict = None
+) -> list[str]:
+    """
+    Resolve the requirements FILE and PACKAGES for PYTHON_VERSION.
+    """
+    from .setup import UV_BIN
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt") as extra:
+        extra.write("\n".join(packages) + "\n")
+        extra.flush()
+        command = [UV_BIN, "pip", "compile", str(file), extra.name]
+        command += ["--python-version", python_version, "--no-header", "--quiet"]
+        logging.debug("Resolving %s", command)
+        result = subprocess.run(
+            command, env=uv_environment(environment), capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to resolve {file}: {result.stderr.strip()}")
+    return parse_pins(result.stdout)
+
+
+def distribution_pin(filename: str) -> str:
+    """
+    The pin `name==version` of the distribution FILENAME.
+    """
+    match = _DISTRIBUTION_PATTERN.match(filename)
+    if match is None:
+        raise ValueError(f"Not a distribution: {filename}")
+    return f"{match.group('name')}=={match.group('version')}"
+
+
+def pip_command() -> list[str]:
+    """
+    The command running pip, which is not a dependency of nqx.
+    """
+    if importlib.util.find_spec("pip") is not None:
+        return [sys.executable, "-m", "pip"]
+
+    from .setup import UV_BIN
+
+    return [UV_BIN, "tool", "run", "--from", "pip", "pip"]
+
+
+def fetch(pin: str, python_version: str, options: list[str], dest: Path) -> str:
+    """
+    Download the distribution of PIN in DEST, or build a wheel if it is a
+    direct URL. Returns the pin of the distribution in DEST.
+    """
+    pip = pip_command() + ["--disable-pip-version-check"]
+    with tempfile.TemporaryDirectory(dir=dest) as tmp_dir:
+        if " @ " in pin:
+            command = pip + ["wheel", "--no-deps", "-w", tmp_dir, pin.split(" @ ", 1)[1]]
+        else:
+            command = pip + ["download", "--no-deps", "-d", tmp_dir, pin]
+            command += ["--python-version", python_version, *options]
+
+        logging.debug("Fetching %s", command)
+        result = subprocess.run(
+            command, env=uv_environment(), capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to fetch {pin}: {result.stderr.strip()}")
+
+        filenames = os.listdir(tmp_dir)
+        if len(filenames) != 1:
+            raise RuntimeError(f"Expected one distribution for {pin}, got {filenames}")
+        os.replace(os.path.join(tmp_dir, filenames[0]), dest / filenames[0])
+
+    if " @ " in pin:
+        return distribution_pin(filenames[0])
+    return pin
+
+
+def prefetch(
+    file: Path,
+    python_version: str,
+    *packages: str,
+    jobs: Optional[int] = None,
+    environment: dict = None,
+) -> Path:
+    """
+    Resolve the requirements FILE and PACKAGES for PYTHON_VERSION and fetch all
+    the distributions in the wheelhouse, JOBS at a time. Returns the path of
+    the pinned requirements.
+    """
+    dest = wheelhouse_dir()
+    dest.mkdir(parents=True, exist_ok=True)
+
+    pins = compile_requirements(file, python_version, *packages, environment=environment)
+    options = index_options(file)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pins = list(
+            executor.map(lambda pin: fetch(pin, python_version, options, dest), pins)
+        )
+
+    path = pinned_requirements_path(file, python_version)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(pins) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def python_version_of(venv_path: Path) -> Optional[str]:
+    """
+    The `major.minor` version of the Python of the virtual environment.
+    """
+    try:
+        with open(Path(venv_path) / "pyvenv.cfg") as f:
+            for line in f:
+                key, _, value = line.partition("=")
+                if key.strip() in ("version_info", "version"):
+                    return ".".join(value.strip().split(".")[:2])
+    except OSError:
+        pass
+    # Conda environments record their packages instead
+    for record in Path(venv_path).glob("conda-meta/python-[0-9]*.json"):
+        return ".".join(record.name.split("-")[1].split(".")[:2])
+    return None
+
+
+def prefetched_requirements(file: Path, python_version: Optional[str]) -> Path:
+    """
+    The pins prefetched for the requirements FILE and PYTHON_VERSION.
+    """
+    pinned = pinned_requirements_path(file, python_version)
+    if python_version is None or not pinned.exists():
+        raise FileNotFoundError(
+            f"No prefetched requirements for {file} and Python {python_version}, "
+            "run `nqx prefetch` on a node with internet access."
+        )
+    return pinned
+
+
+def offline_install_args() -> list[str]:
+    """
+    Arguments of uv installing from the wheelhouse only.
+    """
+    return ["--offline", "--no-index", "--find-links", str(wheelhouse_dir())]
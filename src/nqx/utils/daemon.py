@@ -0,0 +1,197 @@
+"""
+The resident nqx daemon of a user on a node.
+
+It keeps nqx imported, with its configuration and caches in memory, and
+answers the requests of `daemon_client` (marshalled dictionaries) on a Unix
+socket, one at a time. The socket is node-local, in the directory of the
+sockets of the kernel pools, which must only be accessible by the user. The
+daemon only answers the processes of the user, and stops after the idle
+timeout.
+"""
+
+from typing import Callable, Optional
+from pathlib import Path
+import logging
+import marshal
+import os
+import signal
+import socket
+import subprocess
+import time
+
+from . import daemon_client
+from .kernel_pool import make_runtime_dir, runtime_dir
+from .kernel_pool_client import peer_uid
+
+CLIENT_SCRIPT = os.path.abspath(daemon_client.__file__)
+
+# Seconds between the checks of the idle timeout
+CHECK_INTERVAL = 5
+
+# Seconds a client has to send its request
+REQUEST_TIMEOUT = 5
+
+
+def socket_path() -> Path:
+    return runtime_dir() / "daemon.sock"
+
+
+def pid_path() -> Path:
+    return socket_path().with_suffix(".pid")
+
+
+def running_pid() -> Optional[int]:
+    """
+    The PID of the daemon on this node, or None if it is not running.
+    """
+    try:
+        pid = int(pid_path().read_text())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return None
+    return pid
+
+
+def _read_request(conn: socket.socket) -> dict:
+    data = b""
+    while True:
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            break
+        data += chunk
+    return marshal.loads(data)
+
+
+class Daemon:
+    """
+    Answers the requests with HANDLER, which returns the response to send.
+    """
+
+    def __init__(
+        self, handler: Callable[[dict], dict], *, idle_timeout: Optional[float] = None
+    ):
+        self.handler = handler
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+        self.stopped = False
+        self.listener = None
+
+    def _answer(self, conn: socket.socket):
+        if peer_uid(conn) != os.getuid():
+            logging.debug("Refusing a client of another user")
+            return
+        conn.settimeout(REQUEST_TIMEOUT)
+        try:
+            request = _read_request(conn)
+        except (OSError, ValueError, EOFError, TypeError) as err:
+            logging.debug("Invalid request: %s", err)
+            return
+        try:
+            response = self.handler(request)
+        except Exception:
+            # The client runs nqx, which reports the error
+            logging.exception("Failed to answer %s", request.get("argv"))
+            response = {"fallback": True}
+        try:
+            conn.sendall(marshal.dumps(response))
+        except OSError as err:
+            logging.debug("Lost the client: %s", err)
+
+    def serve(self):
+        """
+        Serve the clients until stopped or idle.
+        """
+        make_runtime_dir()
+        path = socket_path()
+        if path.exists():
+            path.unlink()
+        self.listener = listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(path))
+        listener.listen()
+        listener.settimeout(CHECK_INTERVAL)
+
+        try:
+            while not self.stopped:
+                try:
+                    conn, _ = listener.accept()
+                except socket.timeout:
+                    if self.idle_timeout is not None:
+                        if time.monotonic() - self.last_used > self.idle_timeout:
+                            logging.debug("Stopping the idle daemon")
+                            self.stopped = True
+                    continue
+                except OSError:
+                    # Closed by `stop`
+                    if self.stopped:
+                        break
+                    raise
+                with conn:
+                    self._answer(conn)
+                self.last_used = time.monotonic()
+        finally:
+            listener.close()
+            if path.exists():
+                path.unlink()
+
+    def stop(self, *args):
+        self.stopped = True
+        # Interrupts the wait for the next client
+        if self.listener is not None:
+            self.listener.close()
+
+
+def start(command: list, log_path: Path) -> int:
+    """
+    Run COMMAND serving the daemon in the background, unless it already runs.
+    Returns its PID.
+    """
+    pid = running_pid()
+    if pid is not None:
+        return pid
+
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+    return process.pid
+
+
+def serve(daemon: Daemon) -> bool:
+    """
+    Serve DAEMON in this process, until SIGTERM or the idle timeout. Returns
+    False if the daemon already runs.
+    """
+    import fcntl
+
+    make_runtime_dir()
+    path = pid_path()
+    with open(path, "a+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        f.truncate(0)
+        f.write(str(os.getpid()))
+        f.flush()
+
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        try:
+            daemon.serve()
+        finally:
+            path.unlink()
+    return True
+
+
+def stop() -> bool:
+    pid = running_pid()
+    if pid is None:
+        return False
+    os.kill(pid, signal.SIGTERM)
+    return True
+
@@ -0,0 +1,114 @@
+"""
+Client of the resident nqx daemon, used by the `nqx()` shell function.
+
+It only uses the standard library and runs without site packages, so that it
+starts in a few milliseconds where nqx itself takes tens of them:
+
+    python -I -S daemon_client.py SOCKET NQX_EXE ARGS...
+
+It sends the arguments, working directory and environment to the daemon and
+prints its answer, or executes the command the daemon computed for `nqx run`.
+When the daemon does not answer, or does not serve the command, it executes
+`NQX_EXE ARGS...` instead.
+
+Importing `json` and `socket` would take longer than everything else the
+client does: the messages are marshalled, and sent with the builtin `_socket`.
+
+The request holds the whole environment, and the answer may be a command to
+execute: the client only talks to a daemon of the same user, whose socket is
+in a directory (not a link) owned by the user with mode 0700. Otherwise, it
+executes nqx.
+"""
+
+import _socket
+import marshal
+import os
+import stat
+import sys
+
+# Seconds to wait for the answer, which may require capturing modules
+TIMEOUT = 120
+
+
+def _columns():
+    try:
+        return os.get_terminal_size(sys.stdout.fileno()).columns
+    except (OSError, ValueError):
+        return None
+
+
+def is_private(directory: str) -> bool:
+    """
+    Whether DIRECTORY is a directory (not a link) of this user, that only they
+    can access.
+    """
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode)
+        and st.st_uid == os.getuid()
+        and stat.S_IMODE(st.st_mode) == 0o700
+    )
+
+
+def peer_uid(conn) -> int:
+    # struct ucred: pid, uid and gid as 32-bit integers
+    creds = conn.getsockopt(_socket.SOL_SOCKET, _socket.SO_PEERCRED, 12)
+    return int.from_bytes(creds[4:8], sys.byteorder)
+
+
+def ask(path: str, argv: list) -> dict:
+    if not is_private(os.path.dirname(path)):
+        raise PermissionError(f"{path} is not private")
+    conn = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    conn.settimeout(TIMEOUT)
+    try:
+        conn.connect(path)
+        if peer_uid(conn) != os.getuid():
+            raise PermissionError(f"{path} is served by another user")
+        request = {
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+            "tty": sys.stdout.isatty(),
+            "columns": _columns(),
+        }
+        conn.sendall(marshal.dumps(request))
+        conn.shutdown(_socket.SHUT_WR)
+        data = b""
+        while True:
+            chunk = conn.recv(1 << 16)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        conn.close()
+    return marshal.loads(data)
+
+
+def main(path: str, nqx_exe: str, argv: list) -> int:
+    try:
+        response = ask(path, argv)
+    except (OSError, ValueError, EOFError, TypeError, AttributeError):
+        # AttributeError: no SO_PEERCRED on this platform
+        response = {"fallback": True}
+
+    if "exec" in response:
+        command = response["exec"]
+        try:
+            os.execvpe(command[0], command, response["env"])
+        except OSError as err:
+            print(f"nqx: {command[0]}: {err.strerror}", file=sys.stderr)
+            return 127
+    if response.get("fallback", False):
+        os.execv(nqx_exe, [nqx_exe, *argv])
+
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["status"]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1], sys.argv[2], sys.argv[3:]))
@@ -0,0 +1,242 @@
+"""
+Disk usage of directory trees, and deduplication of their files with hardlinks.
+
+The trees are walked with `os.scandir` in a thread pool, one tree per task, so
+that the latency of the metadata operations of shared filesystems overlaps.
+"""
+
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
+import stat
+
+# Number of bytes hashed before the rest of the file, to discard most candidates
+PREFIX_SIZE = 1 << 16
+
+
+class FileInfo:
+    """
+    The metadata of a regular file used to find and replace duplicates.
+    """
+
+    __slots__ = (
+        "path", "size", "blocks", "dev", "ino", "nlink", "mode", "uid", "mtime"
+    )
+
+    def __init__(self, path: str, st: os.stat_result):
+        self.path = path
+        self.size = st.st_size
+        self.blocks = st.st_blocks * 512
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        self.nlink = st.st_nlink
+        self.mode = st.st_mode
+        self.uid = st.st_uid
+        self.mtime = st.st_mtime_ns
+
+
+def walk(root) -> tuple[list[FileInfo], int]:
+    """
+    The regular files under ROOT, and the number of other entries (directories,
+    symlinks...), without following symlinks.
+    """
+    files = []
+    others = 0
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError as err:
+            logging.debug("Cannot scan: %s", err)
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        others += 1
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append(FileInfo(entry.path, st))
+                    else:
+                        others += 1
+                except OSError as err:
+                    logging.debug("Cannot stat: %s", err)
+    return files, others
+
+
+def walk_all(roots: dict, jobs: Optional[int] = None) -> dict:
+    """
+    Walk the trees ROOTS (by name) in parallel.
+    """
+    names = list(roots)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(names, executor.map(walk, [roots[n] for n in names])))
+
+
+def disk_usage(roots: dict, jobs: Optional[int] = None) -> dict:
+    """
+    The disk usage of the trees ROOTS (by name): their `size` and `inodes`,
+    and the part of them `shared` with other files through hardlinks. The
+    `total` entry counts every inode once.
+    """
+    trees = walk_all(roots, jobs)
+
+    usage = {}
+    seen = set()
+    total = {"size": 0, "inodes": 0, "shared_size": 0, "shared_inodes": 0}
+    for name, (files, others) in trees.items():
+        u = {"size": 0, "inodes": others, "shared_size": 0, "shared_inodes": 0}
+        inodes = set()
+        for f in files:
+            key = (f.dev, f.ino)
+            if key in inodes:
+                continue
+            inodes.add(key)
+            u["size"] += f.blocks
+            u["inodes"] += 1
+            if f.nlink > 1:
+                u["shared_size"] += f.blocks
+                u["shared_inodes"] += 1
+            if key not in seen:
+                seen.add(key)
+                total["size"] += f.blocks
+                total["inodes"] += 1
+                if f.nlink > 1:
+                    total["shared_size"] += f.blocks
+                    total["shared_inodes"] += 1
+        total["inodes"] += others
+        usage[name] = u
+    usage["total"] = total
+    return usage
+
+
+def _hash(path: str, size: Optional[int] = None) -> Optional[str]:
+    """
+    The sha256 of the first SIZE bytes of the file (or of all of it).
+    """
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            if size is not None:
+                h.update(f.read(size))
+            else:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+    except OSError as err:
+        logging.debug("Cannot read: %s", err)
+        return None
+    return h.hexdigest()
+
+
+def _group_by_hash(groups: list, size, jobs) -> list:
+    """
+    Split the groups of files by the hash of their first SIZE bytes, keeping
+    the groups with several inodes.
+    """
+    candidates = [f for group in groups for f in group]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes = list(executor.map(lambda f: _hash(f.path, size), candidates))
+
+    by_hash = {}
+    for f, h in zip(candidates, hashes):
+        if h is not None:
+            by_hash.setdefault((f.dev, f.size, h), []).append(f)
+    return [g for g in by_hash.values() if len({f.ino for f in g}) > 1]
+
+
+def find_duplicates(
+    roots: dict, min_size: int = 1, jobs: Optional[int] = None
+) -> list[list[FileInfo]]:
+    """
+    Groups of byte-identical files of the trees ROOTS that are not hardlinks
+    of each other yet, on the same device and with the same mode and owner.
+    """
+    trees = walk_all(roots, jobs)
+
+    # Only the files of the same size can be identical
+    by_size = {}
+    for files, _ in trees.values():
+        for f in files:
+            if f.size >= min_size:
+                by_size.setdefault((f.dev, f.size, f.mode, f.uid), []).append(f)
+    groups = [g for g in by_size.values() if len({f.ino for f in g}) > 1]
+
+    groups = _group_by_hash(groups, PREFIX_SIZE, jobs)
+    large = [g for g in groups if g[0].size > PREFIX_SIZE]
+    groups = [g for g in groups if g[0].size <= PREFIX_SIZE]
+    groups += _group_by_hash(large, None, jobs)
+    return groups
+
+
+def _unchanged(f: FileInfo) -> bool:
+    try:
+        st = os.stat(f.path, follow_symlinks=False)
+    except OSError:
+        return False
+    return (
+        stat.S_ISREG(st.st_mode)
+        and (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        == (f.dev, f.ino, f.size, f.mtime)
+    )
+
+
+def dedupe(groups: list[list[FileInfo]], dry_run: bool = False) -> tuple[int, int]:
+    """
+    Replace the duplicates in GROUPS by hardlinks to a single inode per group.
+    Returns the number of files replaced and the bytes freed (or that would be,
+    with DRY_RUN).
+
+    Files changed since they were scanned are skipped, and every file is
+    replaced atomically by a new link renamed over it.
+    """
+    replaced = 0
+    freed = 0
+    for group in groups:
+        # Keep the inode that already has the most links
+        target = max(group, key=lambda f: f.nlink)
+        if not dry_run and not _unchanged(target):
+            continue
+
+        freed_inodes = set()
+        for f in group:
+            if f.ino == target.ino:
+                continue
+            if not dry_run:
+                if not _unchanged(f):
+                    continue
+                tmp_path = f"{f.path}.nqx-dedupe{os.getpid()}"
+                try:
+                    os.link(target.path, tmp_path)
+                    os.replace(tmp_path, f.path)
+                except OSError as err:
+                    logging.debug("Cannot link %s: %s", f.path, err)
+                    if os.path.lexists(tmp_path):
+                        os.remove(tmp_path)
+                    continue
+            replaced += 1
+            if f.ino not in freed_inodes:
+                freed_inodes.add(f.ino)
+                # The inode is only freed if all its links are replaced
+                links = sum(1 for g in group if g.ino == f.ino)
+                if links == f.nlink:
+                    freed += f.blocks
+    return replaced, freed
+
+
+def _existing_parent(path) -> str:
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and path != os.path.dirname(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def same_device(*paths) -> bool:
+    """
+    Whether PATHS are on the same filesystem (or will be, once created), so
+    that files can be hardlinked between them.
+    """
+    devices = {os.stat(_existing_parent(path)).st_dev for path in paths}
+    return len(devices) <= 1
@@ -0,0 +1,348 @@
+"""
+Pools of warm interpreters for the Jupyter kernels of an environment.
+
+A pool keeps a few workers (see `kernel_pool_client`) that already imported
+the slow modules of the environment, and hands one of them to every kernel
+launcher connecting to its Unix socket. The socket is node-local, under the
+temporary directory, so that a pool only serves the kernels of its node. The
+directory must only be accessible by the user, and the pool only answers the
+processes of the user.
+
+Workers that are not used before the idle timeout are stopped with the pool,
+and no new worker is started while the idle ones use more than the memory cap.
+"""
+
+from typing import Optional
+from pathlib import Path
+import logging
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+
+from . import kernel_pool_client
+
+CLIENT_SCRIPT = os.path.abspath(kernel_pool_client.__file__)
+
+# Seconds between the checks of the idle timeout and of the memory
+CHECK_INTERVAL = 5
+
+# The workers receive the standard streams of the kernels with socket.recv_fds
+MIN_PYTHON = (3, 9)
+
+
+def supports(python_version: Optional[str]) -> bool:
+    """
+    Whether the workers can run on PYTHON_VERSION (like `3.11`, None if unknown).
+    """
+    if python_version is None:
+        return True
+    return tuple(int(n) for n in python_version.split(".")[:2]) >= MIN_PYTHON
+
+
+def runtime_dir() -> Path:
+    """
+    The directory of the sockets of the user on this node.
+    """
+    return Path(tempfile.gettempdir()) / f"nqx-{os.getuid()}"
+
+
+def make_runtime_dir() -> Path:
+    """
+    Create the directory of the sockets, refusing to use it if another user
+    could have created or changed it: they would receive what the clients send.
+    """
+    path = runtime_dir()
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    else:
+        # Not restricted by the umask
+        os.chmod(path, 0o700)
+    if not kernel_pool_client.is_private(str(path)):
+        raise PermissionError(
+            f"{path} must be a directory owned by the user, with mode 0700"
+        )
+    return path
+
+
+def socket_path(name: str) -> Path:
+    return runtime_dir() / f"kernel-pool-{name}.sock"
+
+
+def pid_path(name: str) -> Path:
+    return socket_path(name).with_suffix(".pid")
+
+
+def running_pid(name: str) -> Optional[int]:
+    """
+    The PID of the pool of NAME on this node, or None if it is not running.
+    """
+    try:
+        pid = int(pid_path(name).read_text())
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return None
+    return pid
+
+
+def rss(pid: int) -> int:
+    """
+    The resident memory of the process PID, in bytes.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Worker:
+    def __init__(self, process: subprocess.Popen, control: socket.socket):
+        self.process = process
+        self.control = control
+        self.ready = False
+
+    def stop(self):
+        self.control.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+
+class KernelPool:
+    """
+    Workers of PYTHON importing PRELOAD, in the environment variables ENV.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        python: str,
+        *,
+        preload: list = (),
+        size: int = 1,
+        idle_timeout: Optional[float] = None,
+        max_memory: Optional[int] = None,
+        env: Optional[dict] = None,
+        log=None,
+    ):
+        self.name = name
+        self.python = python
+        self.preload = list(preload)
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_memory = max_memory
+        self.env = env
+        self.log = log
+        self.workers = []
+        self.selector = selectors.DefaultSelector()
+        self.last_used = time.monotonic()
+        self.stopped = False
+
+    def _spawn(self):
+        control, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        command = [self.python, CLIENT_SCRIPT, "worker", str(child.fileno())]
+        process = subprocess.Popen(
+            command + self.preload,
+            pass_fds=[child.fileno()],
+            env=self.env,
+            stdin=subprocess.DEVNULL,
+            stdout=self.log,
+            stderr=self.log,
+            start_new_session=True,
+        )
+        child.close()
+        worker = Worker(process, control)
+        self.workers.append(worker)
+        self.selector.register(control, selectors.EVENT_READ, worker)
+        logging.debug("Started the worker %s of %s", process.pid, self.name)
+
+    def _remove(self, worker: Worker):
+        self.selector.unregister(worker.control)
+        self.workers.remove(worker)
+        worker.stop()
+
+    def memory(self) -> int:
+        return sum(rss(w.process.pid) for w in self.workers)
+
+    def _fill(self):
+        """
+        Start workers up to the size of the pool, within the memory cap.
+        """
+        while len(self.workers) < self.size:
+            if self.max_memory is not None and len(self.workers) > 0:
+                per_worker = self.memory() / len(self.workers)
+                if self.memory() + per_worker > self.max_memory:
+                    break
+            self._spawn()
+
+    def _check(self):
+        if self.max_memory is not None:
+            while len(self.workers) > 0 and self.memory() > self.max_memory:
+                logging.debug("Over the memory cap of %s", self.name)
+                self._remove(self.workers[-1])
+        if self.idle_timeout is not None:
+            if time.monotonic() - self.last_used > self.idle_timeout:
+                logging.debug("Stopping the idle pool of %s", self.name)
+                self.stopped = True
+
+    def _hand_over(self, conn: socket.socket):
+        if kernel_pool_client.peer_uid(conn) != os.getuid():
+            logging.debug("Refusing a launcher of another user")
+            conn.close()
+            return
+        for worker in [w for w in self.workers if w.ready]:
+            self.selector.unregister(worker.control)
+            self.workers.remove(worker)
+            try:
+                socket.send_fds(worker.control, [b"conn"], [conn.fileno()])
+            except OSError as err:
+                logging.debug("Lost the worker %s: %s", worker.process.pid, err)
+                worker.stop()
+                continue
+            worker.control.close()
+            logging.debug("Handed the worker %s over", worker.process.pid)
+            break
+        else:
+            # The launcher starts the kernel itself
+            conn.sendall(b"busy\n")
+        conn.close()
+        self.last_used = time.monotonic()
+        self._fill()
+
+    def serve(self):
+        """
+        Serve the kernel launchers until stopped or idle.
+        """
+        make_runtime_dir()
+        path = socket_path(self.name)
+        if path.exists():
+            path.unlink()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(path))
+        listener.listen()
+        self.selector.register(listener, selectors.EVENT_READ, None)
+
+        self._fill()
+        next_check = time.monotonic() + CHECK_INTERVAL
+        try:
+            while not self.stopped:
+                for key, _ in self.selector.select(CHECK_INTERVAL):
+                    if key.data is None:
+                        conn, _ = listener.accept()
+                        self._hand_over(conn)
+                    elif key.fileobj.recv(16) == b"ready":
+                        key.data.ready = True
+                    else:
+                        # The worker died
+                        self._remove(key.data)
+                if time.monotonic() >= next_check:
+                    self._check()
+                    next_check = time.monotonic() + CHECK_INTERVAL
+        finally:
+            self.selector.unregister(listener)
+            listener.close()
+            if path.exists():
+                path.unlink()
+            for worker in list(self.workers):
+                self._remove(worker)
+
+    def stop(self, *args):
+        self.stopped = True
+
+
+def start(name: str, command: list, log_path: Path) -> int:
+    """
+    Run COMMAND serving the pool of NAME in the background, unless it already
+    runs. Returns its PID.
+    """
+    pid = running_pid(name)
+    if pid is not None:
+        return pid
+
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+    return process.pid
+
+
+def serve(pool: KernelPool) -> bool:
+    """
+    Serve POOL in this process, until SIGTERM or the idle timeout. Returns
+    False if the pool of this environment already runs.
+    """
+    import fcntl
+
+    make_runtime_dir()
+    path = pid_path(pool.name)
+    with open(path, "a+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        f.truncate(0)
+        f.write(str(os.getpid()))
+        f.flush()
+
+        signal.signal(signal.SIGTERM, pool.stop)
+        signal.signal(signal.SIGINT, pool.stop)
+        try:
+            pool.serve()
+        finally:
+            path.unlink()
+    return True
+
+
+def stop(name: str) -> bool:
+    pid = running_pid(name)
+    if pid is None:
+        return False
+    os.kill(pid, signal.SIGTERM)
+    return True
+
+
+def pool_memory(pid: int) -> int:
+    """
+    The resident memory of the pool PID and of its workers, in bytes.
+    """
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except (OSError, ValueError):
+        children = []
+    return rss(pid) + sum(rss(child) for child in children)
+
+
+def running_pools() -> dict:
+    """
+    The PIDs of the pools running on this node, by environment.
+    """
+    directory = runtime_dir()
+    pools = {}
+    if not directory.exists():
+        return pools
+    for path in directory.glob("kernel-pool-*.pid"):
+        name = path.stem[len("kernel-pool-") :]
+        pid = running_pid(name)
+        if pid is not None:
+            pools[name] = pid
+    return pools
+
+
+def client_command(name: str, python: str) -> list:
+    """
+    The command of a kernel launcher connecting to the pool of NAME.
+    """
+    return [python, "-I", "-S", CLIENT_SCRIPT, "client", str(socket_path(name))]
+
@@ -0,0 +1,198 @@
+"""
+Client and worker of the warm kernel pools of nqx.
+
+Both are run by the Python of an environment, where nqx is not installed, so
+this file only uses the standard library:
+
+    python -I -S kernel_pool_client.py client SOCKET PYTHON -m MODULE ARGS...
+    python kernel_pool_client.py worker CONTROL_FD PRELOAD...
+
+A worker imports the PRELOAD modules, then waits for the pool to hand it the
+connection of a client. The client sends its command, working directory,
+environment and standard streams, and the worker runs the MODULE in its place.
+The client stays as the process Jupyter started: it forwards the signals to the
+worker and exits with it. When no worker is available, the client executes
+its command as usual.
+
+The client only hands its streams and environment over to a pool of the same
+user: its socket must be in a directory only the user can access, and be
+served by a process of the user.
+"""
+
+from typing import Optional
+import json
+import os
+import runpy
+import signal
+import socket
+import stat
+import sys
+import threading
+
+# Signals Jupyter sends to the kernel, forwarded to the worker
+FORWARDED_SIGNALS = (
+    signal.SIGINT,
+    signal.SIGTERM,
+    signal.SIGHUP,
+    signal.SIGQUIT,
+    signal.SIGUSR1,
+    signal.SIGUSR2,
+)
+
+
+def _readline(conn: socket.socket, data: bytes = b"") -> bytes:
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+def is_private(directory: str) -> bool:
+    """
+    Whether DIRECTORY is a directory (not a link) of this user, that only they
+    can access.
+    """
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode)
+        and st.st_uid == os.getuid()
+        and stat.S_IMODE(st.st_mode) == 0o700
+    )
+
+
+def peer_uid(conn: socket.socket) -> Optional[int]:
+    """
+    The user of the process at the other end of the Unix socket CONN, or None
+    if it cannot be known.
+    """
+    try:
+        # struct ucred: pid, uid and gid as 32-bit integers
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, 12)
+    except (AttributeError, OSError):
+        return None
+    return int.from_bytes(creds[4:8], sys.byteorder)
+
+
+def client(path: str, command: list) -> int:
+    # Signals received before the worker is known are delivered to it once it
+    # has been handed over
+    worker_pid = None
+    pending = []
+
+    def forward(signum, frame):
+        if worker_pid is None:
+            pending.append(signum)
+            return
+        try:
+            os.kill(worker_pid, signum)
+        except ProcessLookupError:
+            pass
+
+    for signum in FORWARDED_SIGNALS:
+        signal.signal(signum, forward)
+
+    try:
+        if not is_private(os.path.dirname(path)):
+            raise PermissionError(f"{path} is not private")
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(10)
+        conn.connect(path)
+        if peer_uid(conn) != os.getuid():
+            conn.close()
+            raise PermissionError(f"{path} is served by another user")
+        request = {"argv": command, "cwd": os.getcwd(), "env": dict(os.environ)}
+        data = json.dumps(request).encode() + b"\n"
+        socket.send_fds(conn, [data], [0, 1, 2])
+        worker_pid = int(_readline(conn))
+    except (OSError, ValueError, AttributeError):
+        # AttributeError: no socket.send_fds before Python 3.9
+        if any(signum != signal.SIGINT for signum in pending):
+            return 1
+        # Cold start
+        os.execv(command[0], command)
+
+    for signum in pending:
+        forward(signum, None)
+
+    # The worker keeps the connection open until it exits
+    conn.settimeout(None)
+    while True:
+        try:
+            if not conn.recv(1 << 10):
+                return 0
+        except InterruptedError:
+            continue
+        except OSError:
+            return 1
+
+
+def _watch(conn: socket.socket):
+    """
+    Exit when the client exits, as Jupyter kills the kernel through it.
+    """
+    try:
+        while conn.recv(1 << 10):
+            pass
+    except OSError:
+        pass
+    os._exit(1)
+
+
+def worker(control_fd: int, preload: list):
+    # Not the directory of this file, but the one of the client, as with `-m`
+    sys.path.pop(0)
+    for module in preload:
+        try:
+            __import__(module)
+        except Exception as err:
+            print(f"nqx kernel pool: cannot import {module}: {err}", file=sys.stderr)
+
+    control = socket.socket(fileno=control_fd)
+    control.send(b"ready")
+    _, fds, _, _ = socket.recv_fds(control, 1 << 10, 1)
+    control.close()
+    if len(fds) == 0:
+        # Stopped by the pool
+        return 0
+
+    conn = socket.socket(fileno=fds[0])
+    data, std_fds, _, _ = socket.recv_fds(conn, 1 << 16, 3)
+    request = json.loads(_readline(conn, data))
+
+    # Only the commands this worker was started for
+    argv = request["argv"]
+    same_python = os.path.dirname(os.path.abspath(argv[0])) == os.path.dirname(
+        sys.executable
+    )
+    if not same_python or len(argv) < 3 or argv[1] != "-m" or len(std_fds) != 3:
+        conn.sendall(b"unsupported\n")
+        return 1
+
+    for fd, target in zip(std_fds, (0, 1, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    sys.path.insert(0, request["cwd"])
+
+    conn.sendall(f"{os.getpid()}\n".encode())
+    threading.Thread(target=_watch, args=(conn,), daemon=True).start()
+
+    sys.argv = [argv[2], *argv[3:]]
+    runpy.run_module(argv[2], run_name="__main__", alter_sys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    mode, *args = sys.argv[1:]
+    if mode == "client":
+        sys.exit(client(args[0], args[1:]))
+    elif mode == "worker":
+        sys.exit(worker(int(args[0]), args[1:]))
+    sys.exit(f"Unknown mode {mode}")
@@ -0,0 +1,42 @@
+"""
+JSON files kept in memory while they do not change.
+
+A resident process (`nqx daemon`) reads the same registries and snapshots for
+every request: once enabled, they are parsed again only when their inode, size
+or mtime change, which nqx's atomic writes always do. The commands started
+for a single operation read the files directly.
+"""
+
+import json
+import os
+
+_enabled = False
+
+# The state and content of the files read, by path
+_files = {}
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def load_json(path):
+    """
+    The content of the JSON file at PATH. The result may be shared: callers
+    must copy what they modify.
+    """
+    if not _enabled:
+        with open(path) as f:
+            return json.load(f)
+
+    st = os.stat(path)
+    state = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = _files.get(str(path))
+    if cached is not None and cached[0] == state:
+        return cached[1]
+
+    with open(path) as f:
+        data = json.load(f)
+    _files[str(path)] = (state, data)
+    return data
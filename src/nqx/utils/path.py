@@ -1,34 +1,48 @@
+import functools
 import os
 import re
 from pathlib import Path
 
+# Matches all instances of $VAR or ${VAR}
+ENV_VAR_PATTERN = re.compile(r"\$([A-Za-z0-9_]+)|\$\{([A-Za-z0-9_]+)\}")
+
+# Maximum depth of variables whose values contain other variables
+MAX_EXPANSION_DEPTH = 16
+
+
+@functools.lru_cache(maxsize=1024)
+def env_var_names(path: str) -> tuple[str, ...]:
+    """
+    Names of the environment variables referenced in a string.
+    """
+    # findall returns a tuple for each match, where one element is the matched
+    # name and the other is an empty string.
+    return tuple(dict.fromkeys(a or b for a, b in ENV_VAR_PATTERN.findall(path)))
+
+
+@functools.lru_cache(maxsize=1024)
+def _substitute(path: str, values: tuple[tuple[str, str], ...]) -> str:
+    lookup = dict(values)
+    return ENV_VAR_PATTERN.sub(lambda m: lookup[m.group(1) or m.group(2)], path)
+
 
 def resolve_env_vars(path, environment=None):
     if isinstance(path, Path):
         path = str(path)
-    # Use a regular expression to find all instances of $VAR or ${VAR}
-    matches = re.findall(r"\$([A-Za-z0-9_]+)|\$\{([A-Za-z0-9_]+)\}", path)
-
-    # For each match, replace it with the value of the environment variable
-    for match in matches:
-        # The re.findall function returns a tuple for each match, where one element is the matched string and the other is an empty string.
-        # We use next(item for item in match if item) to get the non-empty element of the tuple.
-        var = next(item for item in match if item)
 
-        if environment is None:
-            env_var_value = os.getenv(var)
-        else:
-            env_var_value = os.environ.get(var, environment.get(var, ""))
+    if environment is None:
+        lookup = os.getenv
+    else:
+        lookup = lambda var: os.environ.get(var, environment.get(var, ""))
 
+    # Replace the variables until their values do not reference others. The
+    # expansion of a string for given values of its variables is memoized.
+    for _ in range(MAX_EXPANSION_DEPTH):
+        names = env_var_names(path)
+        if len(names) == 0:
+            break
         # If the environment variable is not set, replace it with an empty string
-        if env_var_value is None:
-            env_var_value = ""
+        values = tuple((var, lookup(var) or "") for var in names)
+        path = _substitute(path, values)
 
-        # Replace the environment variable in the path with its value
-        path = path.replace("$" + var, env_var_value)
-        path = path.replace("${" + var + "}", env_var_value)
-
-    if len(matches) == 0:
-        return Path(path)
-    else:
-        return resolve_env_vars(path, environment)
+    return Path(path)
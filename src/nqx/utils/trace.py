@@ -0,0 +1,142 @@
+"""
+Timed spans of the phases and subprocesses of an nqx command.
+
+Tracing is off unless `start` is called (by `nqx --trace FILE`), and `span`
+costs nothing then. The spans are written as Chrome trace events, to be opened
+in chrome://tracing or https://ui.perfetto.dev, and can be appended to a
+rolling log to compare the timings of the commands across clusters.
+"""
+
+from typing import Optional
+from contextlib import contextmanager
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+
+# Size after which the rolling log is rotated to LOG.1
+MAX_LOG_SIZE = 1 << 20
+
+_events = None
+_start = None
+_run = subprocess.run
+
+
+def enabled() -> bool:
+    return _events is not None
+
+
+def _now() -> float:
+    """
+    Microseconds since the start of the trace.
+    """
+    return (time.perf_counter() - _start) * 1e6
+
+
+def _record(name: str, category: str, ts: float, args: dict):
+    _events.append(
+        {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": ts,
+            "dur": _now() - ts,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+    )
+
+
+@contextmanager
+def span(name: str, category: str = "phase", **args):
+    """
+    Record the time spent in the block as NAME, with ARGS.
+    """
+    if _events is None:
+        yield args
+        return
+    ts = _now()
+    try:
+        yield args
+    finally:
+        _record(name, category, ts, args)
+
+
+def _output_size(output) -> int:
+    return len(output) if isinstance(output, (str, bytes)) else 0
+
+
+def _traced_run(args, *popenargs, **kwargs):
+    command = args if isinstance(args, str) else " ".join(str(a) for a in args)
+    with span(os.path.basename(command.split(" ", 1)[0]), "subprocess") as info:
+        info["command"] = command
+        try:
+            result = _run(args, *popenargs, **kwargs)
+        except subprocess.CalledProcessError as err:
+            info["returncode"] = err.returncode
+            raise
+        info["returncode"] = result.returncode
+        info["output_bytes"] = _output_size(result.stdout) + _output_size(result.stderr)
+        return result
+
+
+def start():
+    """
+    Start recording, with a span for every `subprocess.run`.
+    """
+    global _events, _start
+    _events = []
+    _start = time.perf_counter()
+    subprocess.run = _traced_run
+
+
+def stop() -> list:
+    """
+    Stop recording, and return the events.
+    """
+    global _events
+    events = _events
+    _events = None
+    subprocess.run = _run
+    return events or []
+
+
+def write(path, events: list):
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def summary(events: list) -> list[tuple]:
+    """
+    The total time in seconds, number and category of the spans, by name,
+    from the longest.
+    """
+    totals = {}
+    for event in events:
+        total, count, category = totals.get(event["name"], (0, 0, event["cat"]))
+        totals[event["name"]] = (total + event["dur"] / 1e6, count + 1, category)
+    rows = [(name, *values) for name, values in totals.items()]
+    return sorted(rows, key=lambda row: -row[1])
+
+
+def append_log(path, command: list, events: list, cluster: Optional[str] = None):
+    """
+    Append the timings of COMMAND to the rolling log PATH (JSON lines).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists() and path.stat().st_size > MAX_LOG_SIZE:
+        os.replace(path, path.with_name(path.name + ".1"))
+
+    record = {
+        "time": time.time(),
+        "host": socket.gethostname(),
+        "cluster": cluster,
+        "command": command,
+        "total": max((e["ts"] + e["dur"] for e in events), default=0) / 1e6,
+        "spans": {name: total for name, total, _, _ in summary(events)},
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
@@ -0,0 +1,97 @@
+"""
+Offline benchmarks of the latency of nqx, with stand-ins for `module` and `uv`.
+
+Every benchmark records the median of a few rounds, printed at the end of the
+session, and fails when it is over its limit:
+
+- the seconds in `thresholds.json`, or in the file NQX_BENCH_THRESHOLDS,
+  multiplied by NQX_BENCH_FACTOR (default 1);
+- with NQX_BENCH_BASELINE, the result of the same benchmark in that file
+  (written with NQX_BENCH_SAVE) increased by NQX_BENCH_MAX_REGRESSION (default
+  0.25, i.e. 25%).
+"""
+
+from pathlib import Path
+import json
+import os
+import statistics
+import time
+
+import pytest
+
+from ..conftest import make_env
+
+THRESHOLDS = Path(__file__).with_name("thresholds.json")
+
+_results = {}
+
+
+def _load(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _limit(name: str):
+    thresholds = _load(os.environ.get("NQX_BENCH_THRESHOLDS", THRESHOLDS))
+    limits = []
+    if name in thresholds:
+        limits.append(thresholds[name] * float(os.environ.get("NQX_BENCH_FACTOR", 1)))
+    if "NQX_BENCH_BASELINE" in os.environ:
+        baseline = _load(os.environ["NQX_BENCH_BASELINE"]).get(name)
+        if baseline is not None:
+            regression = float(os.environ.get("NQX_BENCH_MAX_REGRESSION", 0.25))
+            limits.append(baseline["median"] * (1 + regression))
+    return min(limits, default=None)
+
+
+@pytest.fixture
+def bench():
+    """
+    `bench(name, fn, rounds=5)` times FN and checks the median against the
+    limit of NAME.
+    """
+
+    def run(name, fn, rounds=5, setup=None):
+        times = []
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        result = {"median": statistics.median(times), "min": min(times)}
+        _results[name] = result
+
+        limit = _limit(name)
+        if limit is not None:
+            assert result["median"] <= limit, (
+                f"{name} took {result['median']:.3f}s, over {limit:.3f}s"
+            )
+        return result
+
+    return run
+
+
+@pytest.fixture(params=[10, 100, 1000])
+def depot(request, venv_depot):
+    """
+    A venv depot with 10, 100 or 1000 environments.
+    """
+    for i in range(request.param):
+        path = make_env(venv_depot, f"env{i:04d}", type="cpu")
+        (path / "pyvenv.cfg").write_text("version_info = 3.11.4\n")
+    return request.param
+
+
+def pytest_terminal_summary(terminalreporter):
+    if len(_results) == 0:
+        return
+    terminalreporter.section("nqx benchmarks")
+    for name, result in sorted(_results.items()):
+        terminalreporter.write_line(
+            f"{name:<28} median {result['median'] * 1e3:9.1f} ms"
+            f"   min {result['min'] * 1e3:9.1f} ms"
+        )
+    if "NQX_BENCH_SAVE" in os.environ:
+        with open(os.environ["NQX_BENCH_SAVE"], "w") as f:
+            json.dump(_results, f, indent=2)
@@ -0,0 +1,83 @@
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from nqx.cli import config as nqx_config
+from nqx.cli import shell
+from nqx.core import EnvConfig
+from nqx.providers.modules import execute_module_in_env
+from nqx.providers.venv import uv
+
+from ..conftest import make_env
+
+pytestmark = pytest.mark.benchmark
+
+
+def _nqx(*args):
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", *args], capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    return result
+
+
+def test_cli_startup(nqx_home, bench):
+    bench("cli_startup", lambda: _nqx("deactivate"))
+
+
+def test_cli_list(depot, bench):
+    # The registry is built by the first call
+    bench(f"cli_list[{depot}]", lambda: _nqx("list", "--json"))
+
+
+def test_load_config(nqx_home, bench):
+    bench("load_config", nqx_config._load_config, rounds=20)
+
+
+def test_execute_module_in_env(moduleshome, monkeypatch, bench):
+    monkeypatch.setenv("FAKE_MODULE_DELAY", "0.05")
+
+    def load():
+        env = execute_module_in_env(
+            "load", "mpi/4.1", environment=EnvConfig(env=os.environ.copy())
+        )
+        assert env.env["LOADEDMODULES"] == "mpi/4.1"
+
+    bench("execute_module_in_env", load)
+
+
+def test_list_envs(venv_depot, depot, bench):
+    def list_envs():
+        envs = uv.list_envs(venv_depot)
+        assert len(envs) == depot
+        for name, _ in envs:
+            uv.get_env_config(name, venv_depot, "type")
+
+    bench(f"list_envs[{depot}]", list_envs)
+
+
+def test_activate_lines(venv_depot, bench):
+    make_env(venv_depot, "foo")
+    bench("activate_lines", lambda: shell.activate_lines("foo"), rounds=20)
+
+
+def test_create(nqx_home, venv_depot, fake_uv, bench):
+    (nqx_home / "requirements").mkdir()
+    (nqx_home / "requirements" / "cpu.txt").write_text("# pins\nnumpy==2.0.0\n")
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "configurations": {"cpu": {"requirements": "requirements/cpu.txt"}},
+            },
+            f,
+        )
+
+    names = (f"env{i}" for i in itertools.count())
+    options = ["--no-kernel", "--no-precompile"]
+    bench("create", lambda: _nqx("create", next(names), "cpu", *options), rounds=3)
+    assert (venv_depot / "env0" / shell.ACTIVATE_SCRIPT).exists()
@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+
+import pytest
+
+from nqx.cli import config as nqx_config
+
+
+@pytest.fixture
+def nqx_home(tmp_path, monkeypatch):
+    """
+    A NQX_HOME with a user configuration pointing to an empty venv depot.
+    """
+    home = tmp_path / "home"
+    depot = tmp_path / "venv"
+    home.mkdir()
+    depot.mkdir()
+    with open(home / "config.json", "w") as f:
+        json.dump({"venv_location": str(depot)}, f)
+
+    monkeypatch.setenv("NQX_HOME", str(home))
+    monkeypatch.delenv("NQX_ENV", raising=False)
+    monkeypatch.setattr(nqx_config, "_config", None)
+    return home
+
+
+@pytest.fixture
+def venv_depot(nqx_home):
+    return nqx_home.parent / "venv"
+
+
+def make_env(venv_depot, name, type="cpu"):
+    """
+    Create a fake environment NAME in the depot, as written by `nqx create`.
+    """
+    path = venv_depot / name
+    (path / "bin").mkdir(parents=True)
+    with open(path / "nqx_config.json", "w") as f:
+        json.dump({"type": type}, f)
+    return path
+
+
+FAKE_MODULE_INIT = """\
+echo x >> "$MODULESHOME/init.count"
+module() {
+    case "$1" in
+        load)
+            shift
+            if [ -n "${FAKE_MODULE_DELAY:-}" ]; then sleep "$FAKE_MODULE_DELAY"; fi
+            for name in "$@"; do
+                if [ ! -f "$MODULEPATH/$name" ]; then
+                    echo "ERROR: Unable to locate a modulefile for '$name'" >&2
+                    return 1
+                fi
+                . "$MODULEPATH/$name"
+                export LOADEDMODULES="${LOADEDMODULES:+$LOADEDMODULES:}$name"
+            done
+            ;;
+        purge)
+            unset LOADEDMODULES
+            ;;
+    esac
+}
+"""
+
+# The Python interface of Environment Modules: `module(...)` changes os.environ
+FAKE_MODULE_PYTHON = """\
+import os
+import subprocess
+
+
+def module(*args):
+    script = '. "$MODULESHOME/init/bash" && module "$@" && env -0'
+    result = subprocess.run(
+        ["bash", "-c", script, "module", *args], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return False
+    env = dict(line.split("=", 1) for line in result.stdout.split("\\0") if "=" in line)
+    os.environ.clear()
+    os.environ.update(env)
+    return True
+"""
+
+
+@pytest.fixture
+def moduleshome(tmp_path, monkeypatch):
+    """
+    A stand-in for Environment Modules whose modulefiles are shell scripts
+    sourced by `module load`, taking FAKE_MODULE_DELAY seconds if set.
+    """
+    home = tmp_path / "modules"
+    modulefiles = tmp_path / "modulefiles"
+    (home / "init").mkdir(parents=True)
+    (modulefiles / "mpi").mkdir(parents=True)
+    (home / "init" / "bash").write_text(FAKE_MODULE_INIT)
+    (home / "init" / "python.py").write_text(FAKE_MODULE_PYTHON)
+    (modulefiles / "mpi" / "4.1").write_text(
+        'export PATH="/opt/mpi/bin:$PATH"\nexport MPI_MOTD="line 1\nline 2"\n'
+    )
+
+    monkeypatch.setenv("MODULESHOME", str(home))
+    monkeypatch.setenv("MODULEPATH", str(modulefiles))
+    monkeypatch.delenv("LOADEDMODULES", raising=False)
+    return home
+
+
+@pytest.fixture
+def fake_uv(tmp_path, monkeypatch):
+    """
+    A `uv` creating virtual environments with this Python, resolving the
+    requirements to themselves and installing nothing. It is found in
+    $HOME/.cargo/bin, like the real one.
+    """
+    from nqx.providers.venv.uv import setup
+
+    home = tmp_path / "user"
+    uv = home / ".cargo" / "bin" / "uv"
+    uv.parent.mkdir(parents=True)
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    uv.write_text(
+        f"""#!/bin/sh
+case "$1 $2" in
+    "venv .")
+        mkdir -p bin
+        ln -sf {sys.executable} bin/python
+        echo "version_info = {version}.0" > pyvenv.cfg
+        ;;
+    "pip compile")
+        grep -v "^#" "$3"
+        ;;
+esac
+"""
+    )
+    os.chmod(uv, 0o755)
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setattr(setup, "UV_BIN", str(uv))
+    return uv
@@ -0,0 +1,186 @@
+import json
+import os
+import subprocess
+import sys
+
+from nqx.cli import config as nqx_config
+from nqx.cli import shell
+
+from .conftest import make_env
+
+
+def _source(script, then="env"):
+    result = subprocess.run(
+        ["bash", "-c", f'. "{script}" || exit 7; {then}'],
+        capture_output=True,
+        text=True,
+    )
+    return result.returncode, result.stdout
+
+
+def test_scripts_activate_and_deactivate(venv_depot):
+    path = make_env(venv_depot, "foo")
+    activate, deactivate = shell.write_activation_scripts("foo")
+
+    returncode, output = _source(activate)
+    assert returncode == 0
+    assert f"VIRTUAL_ENV={path}" in output.splitlines()
+    assert "NQX_ENV=foo" in output.splitlines()
+
+    returncode, output = _source(
+        activate, then=f'. "{deactivate}"; echo "$PATH"; env'
+    )
+    assert returncode == 0
+    assert output.splitlines()[0] == os.environ["PATH"]
+    assert "NQX_ENV=foo" not in output.splitlines()
+
+
+def test_stale_scripts_are_refreshed(nqx_home, venv_depot):
+    make_env(venv_depot, "foo")
+    activate, _ = shell.write_activation_scripts("foo")
+    assert not shell.refresh_activation_scripts("foo")
+
+    # Changing the configuration makes the script bail out
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump({"venv_location": str(venv_depot), "internet": False}, f)
+    returncode, output = _source(activate)
+    assert returncode == 7
+
+    assert shell.refresh_activation_scripts("foo")
+    returncode, output = _source(activate)
+    assert returncode == 0
+
+
+def test_pycache_prefix_policy(venv_depot):
+    path = make_env(venv_depot, "foo")
+    with open(path / "nqx_config.json", "w") as f:
+        json.dump({"type": "cpu", "pycache_prefix": "$HOME/pycache"}, f)
+    activate, deactivate = shell.write_activation_scripts("foo")
+
+    returncode, output = _source(
+        activate, then=f'echo "$PYTHONPYCACHEPREFIX"; . "{deactivate}"; env'
+    )
+    assert returncode == 0
+    lines = output.splitlines()
+    assert lines[0] == os.path.expanduser("~/pycache")
+    assert not any(line.startswith("PYTHONPYCACHEPREFIX=") for line in lines)
+
+
+def test_run_and_exec_wrapper(nqx_home, venv_depot, tmp_path):
+    path = make_env(venv_depot, "foo")
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "configurations": {"cpu": {"env": {"FOO_DATA": "$HOME/data"}}},
+            },
+            f,
+        )
+    nqx_config._config = None
+    show = 'echo "$VIRTUAL_ENV $NQX_ENV $FOO_DATA"'
+    expected = f"{path} foo {os.path.expanduser('~/data')}\n"
+
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "run", "foo", "--", "sh", "-c", show],
+        capture_output=True,
+        text=True,
+    )
+    assert result.stdout == expected
+
+    # The wrapper does not start nqx, unless it is stale
+    shell.write_activation_scripts("foo")
+    fallback = tmp_path / "fallback"
+    fallback.write_text('#!/bin/sh\necho "fallback $*"\n')
+    os.chmod(fallback, 0o755)
+    wrapper = [str(path / shell.EXEC_SCRIPT), "sh", "-c", show]
+    env = {**os.environ, "NQX_EXE": str(fallback)}
+
+    result = subprocess.run(wrapper, capture_output=True, text=True, env=env)
+    assert result.stdout == expected
+
+    (path / "nqx_config.json").write_text(json.dumps({"type": "gpu"}))
+    mtime = os.stat(path / shell.EXEC_SCRIPT).st_mtime + 5
+    os.utime(path / "nqx_config.json", (mtime, mtime))
+    result = subprocess.run(wrapper, capture_output=True, text=True, env=env)
+    assert result.stdout == f"fallback run foo -- sh -c {show}\n"
+
+
+def test_kernel_launcher(nqx_home, venv_depot, tmp_path):
+    path = make_env(venv_depot, "foo")
+    kernel = tmp_path / "kernels" / "foo"
+    kernel.mkdir(parents=True)
+    with open(path / "nqx_config.json", "w") as f:
+        json.dump({"type": "cpu", "kernel_path": str(kernel)}, f)
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "configurations": {"cpu": {"env": {"FOO_DATA": "$HOME/data"}}},
+            },
+            f,
+        )
+    nqx_config._config = None
+
+    shell.write_activation_scripts("foo")
+    launcher = kernel / shell.KERNEL_LAUNCHER
+    show = 'echo "$VIRTUAL_ENV $NQX_ENV $FOO_DATA"'
+    expected = f"{path} foo {os.path.expanduser('~/data')}\n"
+    nqx = tmp_path / "nqx"
+    nqx.write_text(
+        f'#!/bin/sh\necho called >> {tmp_path}/calls\n'
+        f'exec {sys.executable} -m nqx "$@"\n'
+    )
+    os.chmod(nqx, 0o755)
+    env = {**os.environ, "NQX_EXE": str(nqx)}
+
+    result = subprocess.run(
+        [launcher, "sh", "-c", show], capture_output=True, text=True, env=env
+    )
+    assert result.stdout == expected
+    assert not (tmp_path / "calls").exists()
+
+    # Regenerated once when the configuration changes
+    mtime = os.stat(path / "nqx_config.json").st_mtime - 5
+    os.utime(launcher, (mtime, mtime))
+    os.utime(path / shell.ACTIVATE_SCRIPT, (mtime - 1, mtime - 1))
+    for _ in range(2):
+        result = subprocess.run(
+            [launcher, "sh", "-c", show], capture_output=True, text=True, env=env
+        )
+        assert result.stdout == expected
+    assert (tmp_path / "calls").read_text() == "called\n"
+    # Alone, as the other scripts depend on the modules of the Jupyter server
+    assert os.stat(path / shell.ACTIVATE_SCRIPT).st_mtime < mtime
+
+
+def test_exec_wrapper_in_activated_shell(nqx_home, venv_depot, moduleshome, tmp_path):
+    make_env(venv_depot, "foo")
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "configurations": {"cpu": {"modules": ["mpi/4.1"]}},
+            },
+            f,
+        )
+    nqx_config._config = None
+    activate, _ = shell.write_activation_scripts("foo")
+    fallback = tmp_path / "fallback"
+    fallback.write_text('#!/bin/sh\necho "FALLBACK $*"\n')
+    os.chmod(fallback, 0o755)
+    wrapper = venv_depot / "foo" / shell.EXEC_SCRIPT
+
+    # The modules are loaded once, by the activation
+    returncode, output = _source(
+        activate,
+        then=f'NQX_EXE={fallback} {wrapper} sh -c \'echo "$LOADEDMODULES"\'',
+    )
+    assert returncode == 0
+    assert output == "mpi/4.1\n"
+
+    # As does `nqx run` in the activated shell
+    returncode, output = _source(
+        activate,
+        then=f"{sys.executable} -m nqx run foo -- sh -c 'echo \"$LOADEDMODULES\"'",
+    )
+    assert output == "mpi/4.1\n"
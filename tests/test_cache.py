@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from nqx.cli import config as nqx_config
+from nqx.providers.venv.uv import cache
+
+
+@pytest.fixture
+def uv_cache(nqx_home, monkeypatch):
+    """
+    A uv cache in the temporary directory, configured with a link mode.
+    """
+    root = nqx_home.parent / "uv-cache"
+    with open(nqx_home / "config.json") as f:
+        config = json.load(f)
+    config["uv_cache"] = {"location": str(root), "link_mode": "hardlink"}
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(config, f)
+    monkeypatch.setattr(nqx_config, "_config", None)
+    # No uv: `nqx cache prune` only applies its own policy
+    monkeypatch.setenv("HOME", str(nqx_home.parent))
+    return root
+
+
+def make_entry(root, relpath, size, used):
+    path = root / relpath
+    path.mkdir(parents=True)
+    (path / "data").write_bytes(b"x" * size)
+    os.utime(path, (used, used))
+    return path
+
+
+def test_uv_environment(uv_cache):
+    env = cache.uv_environment({"PATH": "/bin"})
+    assert env == {
+        "PATH": "/bin",
+        "UV_CACHE_DIR": str(uv_cache),
+        "UV_LINK_MODE": "hardlink",
+    }
+    assert cache.check_cache(uv_cache.parent / "venv") is None
+    assert cache.same_device(uv_cache.parent / "venv" / "not-yet-created")
+
+
+def test_invalid_link_mode(nqx_home, monkeypatch):
+    monkeypatch.setattr(
+        nqx_config, "_config", {"uv_cache": {"link_mode": "reflink"}}
+    )
+    with pytest.raises(ValueError, match="reflink"):
+        cache.uv_environment()
+
+
+def test_prune(uv_cache):
+    make_entry(uv_cache, "wheels-v1/pypi/old", 4096, 1000)
+    make_entry(uv_cache, "wheels-v1/pypi/middle", 4096, 2000)
+    recent = make_entry(uv_cache, "archive-v0/recent", 4096, 3000)
+    os.utime(recent, None)
+    assert set(cache.cache_entries()) == {
+        "wheels-v1/pypi/old",
+        "wheels-v1/pypi/middle",
+        "archive-v0/recent",
+    }
+
+    def prune(*args):
+        return subprocess.run(
+            [sys.executable, "-m", "nqx", "cache", "prune", *args],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "COLUMNS": "200"},
+        )
+
+    result = prune("--older-than", "1d", "--dry-run")
+    assert result.returncode == 0, result.stderr
+    assert "wheels-v1/pypi/old" in result.stdout
+    assert "wheels-v1/pypi/middle" in result.stdout
+    assert (uv_cache / "wheels-v1/pypi/old").exists()
+
+    result = prune("--max-size", "6K")
+    assert result.returncode == 0, result.stderr
+    assert not (uv_cache / "wheels-v1/pypi/old").exists()
+    assert not (uv_cache / "wheels-v1/pypi/middle").exists()
+    assert recent.exists()
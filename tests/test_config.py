@@ -0,0 +1,42 @@
+import json
+
+from nqx.cli import config as nqx_config
+from nqx.utils import resolve_env_vars
+
+
+def test_resolve_env_vars(monkeypatch):
+    monkeypatch.setenv("NQX_TEST_ROOT", "/scratch")
+    monkeypatch.setenv("NQX_TEST_DIR", "$NQX_TEST_ROOT/nqx")
+    monkeypatch.delenv("NQX_TEST_UNSET", raising=False)
+
+    assert str(resolve_env_vars("${NQX_TEST_DIR}/venv")) == "/scratch/nqx/venv"
+    assert str(resolve_env_vars("$NQX_TEST_UNSET/venv")) == "/venv"
+    assert str(resolve_env_vars("$NQX_TEST_X/a", {"NQX_TEST_X": "/x"})) == "/x/a"
+
+
+def test_config_is_compiled(nqx_home, monkeypatch):
+    config = nqx_config.get_config()
+    assert nqx_config.config_cache_path().exists()
+
+    cached = nqx_config.read_config_cache()
+    assert cached == config
+    assert cached.sources == config.sources
+
+    # The compiled configuration is used instead of the sources
+    monkeypatch.setattr(nqx_config, "_config", None)
+    monkeypatch.setattr(nqx_config, "_load_config", None)
+    assert nqx_config.get_config() == config
+
+
+def test_config_cache_is_invalidated(nqx_home, monkeypatch):
+    nqx_config.get_config()
+
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump({"venv_location": "/somewhere/else"}, f)
+    assert nqx_config.read_config_cache() is None
+
+    monkeypatch.setattr(nqx_config, "_config", None)
+    assert nqx_config.get_config()["venv_location"] == "/somewhere/else"
+
+    monkeypatch.setenv("NQX_INTERNAL_CONFIG", str(nqx_home))
+    assert nqx_config.read_config_cache() is None
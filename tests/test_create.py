@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+
+from nqx.cli import shell
+
+
+def test_create_with_kernel_and_modules(
+    nqx_home, venv_depot, fake_uv, moduleshome, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("JUPYTER_DATA_DIR", str(tmp_path / "jupyter"))
+    (nqx_home / "requirements").mkdir()
+    (nqx_home / "requirements" / "cpu.txt").write_text("numpy==2.0.0\n")
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "configurations": {
+                    "cpu": {
+                        "requirements": "requirements/cpu.txt",
+                        "modules": ["mpi/4.1"],
+                    }
+                },
+            },
+            f,
+        )
+
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "create", "Foo", "cpu", "--no-precompile"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "COLUMNS": "200"},
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    kernel_path = tmp_path / "jupyter" / "kernels" / "foo"
+    with open(kernel_path / "kernel.json") as f:
+        kernel = json.load(f)
+    assert kernel["argv"][:4] == [
+        str(kernel_path / shell.KERNEL_LAUNCHER),
+        str(venv_depot / "Foo" / "bin" / "python"),
+        "-m",
+        "ipykernel_launcher",
+    ]
+    assert kernel["env"]["MODULEPATH"] == os.environ["MODULEPATH"]
+
+    with open(venv_depot / "Foo" / "nqx_config.json") as f:
+        assert json.load(f)["kernel_path"] == str(kernel_path)
+    launcher = (kernel_path / shell.KERNEL_LAUNCHER).read_text()
+    assert "/opt/mpi/bin" in launcher
+
+
+def test_no_kernel_when_the_installation_fails(
+    nqx_home, venv_depot, fake_uv, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("JUPYTER_DATA_DIR", str(tmp_path / "jupyter"))
+    (nqx_home / "requirements").mkdir()
+    (nqx_home / "requirements" / "cpu.txt").write_text("numpy==2.0.0\n")
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "configurations": {"cpu": {"requirements": "requirements/cpu.txt"}},
+            },
+            f,
+        )
+    script = fake_uv.read_text()
+    fake_uv.write_text(script.replace("esac", '    "pip install") exit 2 ;;\nesac'))
+
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "create", "foo", "cpu"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert os.listdir(tmp_path / "jupyter") == []
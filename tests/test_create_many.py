@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+from nqx.cli import create
+from nqx.core import EnvType
+
+# Waits until all the builds have started, so that it only succeeds if they run
+# concurrently, and fails for the environments whose name starts with "bad".
+FAKE_CREATE = """
+import pathlib, sys, time
+name, directory = sys.argv[1], pathlib.Path(sys.argv[2])
+(directory / name).touch()
+deadline = time.monotonic() + 10
+while len(list(directory.iterdir())) < int(sys.argv[3]) and time.monotonic() < deadline:
+    time.sleep(0.01)
+print("building", name)
+sys.exit(3 if name.startswith("bad") else 0)
+"""
+
+
+def test_parse_env_specs():
+    types = [EnvType.cpu, EnvType.gpu]
+    assert create.parse_env_specs(["a", "b:gpu-mpi"], types) == [
+        ("a-cpu", EnvType.cpu),
+        ("a-gpu", EnvType.gpu),
+        ("b", EnvType.gpu_mpi),
+    ]
+    assert create.parse_env_specs(["a"], [EnvType.gpu]) == [("a", EnvType.gpu)]
+
+    with pytest.raises(ValueError, match="a-cpu"):
+        create.parse_env_specs(["a", "a-cpu:cpu"], types)
+
+
+def test_create_envs_concurrently(tmp_path, monkeypatch):
+    started = tmp_path / "started"
+    started.mkdir()
+    envs = [("good", EnvType.cpu), ("bad", EnvType.gpu), ("other", EnvType.cpu)]
+
+    def fake_command(name, type, options):
+        return [sys.executable, "-c", FAKE_CREATE, name, str(started), str(len(envs))]
+
+    monkeypatch.setattr(create, "_create_command", fake_command)
+    results = create.create_envs(envs, [], jobs=3, log_dir=tmp_path / "logs")
+
+    assert {name: returncode for name, (returncode, _) in results.items()} == {
+        "good": 0,
+        "bad": 3,
+        "other": 0,
+    }
+    for name, _ in envs:
+        assert (tmp_path / "logs" / f"{name}.log").read_text() == f"building {name}\n"
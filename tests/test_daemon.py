@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+from nqx.utils import daemon
+
+from .conftest import make_env
+
+
+@pytest.fixture
+def fake_nqx(tmp_path):
+    """
+    The nqx executable the client falls back to.
+    """
+    path = tmp_path / "nqx"
+    path.write_text('#!/bin/sh\necho "fallback $*"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+@pytest.fixture
+def running_daemon(nqx_home, tmp_path, monkeypatch):
+    # The path of a Unix socket is limited to about 100 characters
+    tmpdir = tempfile.mkdtemp(prefix="nqx-test-")
+    monkeypatch.setenv("TMPDIR", tmpdir)
+    monkeypatch.setattr(tempfile, "tempdir", tmpdir)
+
+    with open(tmp_path / "daemon.log", "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "nqx", "daemon", "serve"], stdout=log, stderr=log
+        )
+    deadline = time.monotonic() + 30
+    while not daemon.socket_path().exists():
+        assert process.poll() is None, (tmp_path / "daemon.log").read_text()
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    yield process
+    process.terminate()
+    process.wait()
+    assert not daemon.socket_path().exists()
+    os.rmdir(daemon.socket_path().parent)
+    os.rmdir(tmpdir)
+
+
+def _client(fake_nqx, *args, env=None):
+    command = [sys.executable, "-I", "-S", daemon.CLIENT_SCRIPT]
+    command += [str(daemon.socket_path()), str(fake_nqx), *args]
+    return subprocess.run(command, capture_output=True, text=True, env=env)
+
+
+def _nqx(*args):
+    command = [sys.executable, "-m", "nqx", *args]
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def test_activate(running_daemon, fake_nqx, venv_depot):
+    make_env(venv_depot, "foo")
+    result = _client(fake_nqx, "activate", "foo")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == _nqx("activate", "foo").stdout
+    assert 'export NQX_ENV="foo"' in result.stdout
+
+    # Answered for the environment of the client
+    env = {**os.environ, "NQX_SHLVL": "0", "NQX_ENV": "foo"}
+    result = _client(fake_nqx, "deactivate", env=env)
+    assert result.stdout.splitlines()[0] == "unset VIRTUAL_ENV"
+
+    # Errors are reported by nqx
+    assert _client(fake_nqx, "activate", "bar").stdout == "fallback activate bar\n"
+
+
+def test_configuration_changes(running_daemon, fake_nqx, nqx_home, venv_depot):
+    make_env(venv_depot, "foo")
+
+    def write_config(value):
+        with open(nqx_home / "config.json", "w") as f:
+            json.dump(
+                {
+                    "venv_location": str(venv_depot),
+                    "configurations": {"cpu": {"env": {"FOO_DATA": value}}},
+                },
+                f,
+            )
+
+    write_config("first")
+    assert 'export FOO_DATA="first"' in _client(fake_nqx, "activate", "foo").stdout
+    write_config("second")
+    assert 'export FOO_DATA="second"' in _client(fake_nqx, "activate", "foo").stdout
+
+
+def test_run_and_list(running_daemon, fake_nqx, venv_depot):
+    path = make_env(venv_depot, "foo")
+    result = _client(fake_nqx, "run", "foo", "--", "sh", "-c", 'echo "$NQX_ENV $PWD"')
+    assert result.stdout == f"foo {os.getcwd()}\n"
+    assert (path / ".nqx-last-used").exists()
+
+    result = _client(fake_nqx, "list", "--json")
+    assert [env["name"] for env in json.loads(result.stdout)] == ["foo"]
+
+
+def test_fallback(fake_nqx, nqx_home, tmp_path, monkeypatch):
+    # Without daemon
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    assert _client(fake_nqx, "activate", "foo").stdout == "fallback activate foo\n"
+
+
+def test_socket_of_another_user(fake_nqx, nqx_home, monkeypatch):
+    tmpdir = tempfile.mkdtemp(prefix="nqx-test-")
+    monkeypatch.setattr(tempfile, "tempdir", tmpdir)
+    # Others can create sockets in this directory
+    daemon.socket_path().parent.mkdir(mode=0o777)
+    os.chmod(daemon.socket_path().parent, 0o777)
+    with pytest.raises(PermissionError):
+        daemon.Daemon(lambda request: {}).serve()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(daemon.socket_path()))
+    listener.listen()
+    listener.settimeout(0.1)
+    assert _client(fake_nqx, "activate", "foo").stdout == "fallback activate foo\n"
+    with pytest.raises(socket.timeout):
+        listener.accept()
+    listener.close()
+    shutil.rmtree(tmpdir)
+
+
+def test_commands_not_served(running_daemon, fake_nqx):
+    assert _client(fake_nqx, "create", "foo").stdout == "fallback create foo\n"
+    assert _client(fake_nqx, "--debug", "list").stdout == "fallback --debug list\n"
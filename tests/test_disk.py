@@ -0,0 +1,40 @@
+import os
+
+from nqx.utils import disk
+
+
+def test_disk_usage_and_dedupe(tmp_path):
+    data = os.urandom(100_000)
+    roots = {}
+    for name in ("a", "b", "c"):
+        root = tmp_path / name
+        (root / "lib").mkdir(parents=True)
+        (root / "lib" / "big.so").write_bytes(data)
+        (root / "lib" / "own.py").write_bytes(os.urandom(2000))
+        roots[name] = root
+    # Same size and prefix, but different contents
+    (roots["c"] / "lib" / "big.so").write_bytes(data[:-1] + b"x")
+
+    usage = disk.disk_usage(roots)
+    assert usage["a"]["inodes"] == 3
+    assert usage["a"]["shared_inodes"] == 0
+    assert usage["total"]["inodes"] == 9
+
+    groups = disk.find_duplicates(roots)
+    assert [sorted(f.path for f in g) for g in groups] == [
+        [str(roots["a"] / "lib" / "big.so"), str(roots["b"] / "lib" / "big.so")]
+    ]
+
+    assert disk.dedupe(groups, dry_run=True)[0] == 1
+    assert os.stat(roots["a"] / "lib" / "big.so").st_nlink == 1
+
+    replaced, freed = disk.dedupe(groups)
+    assert replaced == 1 and freed > 0
+    a, b = (os.stat(roots[n] / "lib" / "big.so") for n in ("a", "b"))
+    assert a.st_ino == b.st_ino
+    assert (roots["b"] / "lib" / "big.so").read_bytes() == data
+
+    usage = disk.disk_usage(roots)
+    assert usage["a"]["shared_inodes"] == 1
+    assert usage["total"]["inodes"] == 8
+    assert disk.find_duplicates(roots) == []
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+from nqx.cli.du import parse_duration, parse_size, select_evictions
+from nqx.cli.shell import LAST_USED_FILE
+
+from .conftest import make_env
+
+
+def test_parse():
+    assert parse_size("500M") == 500 << 20
+    assert parse_size("1.5GB") == 3 << 29
+    assert parse_duration("2w") == 14 * 86400
+    assert parse_duration("12h") == 12 * 3600
+
+
+def test_select_evictions():
+    last_used = {"old": 0, "recent": 900, "middle": 500}
+    usage = {
+        "old": {"size": 100, "inodes": 10, "shared_size": 50, "shared_inodes": 5},
+        "middle": {"size": 100, "inodes": 10, "shared_size": 0, "shared_inodes": 0},
+        "recent": {"size": 100, "inodes": 10, "shared_size": 0, "shared_inodes": 0},
+        "total": {"size": 300, "inodes": 30},
+    }
+    assert select_evictions(last_used, usage, max_size=300) == []
+    # Shared files of "old" are not freed
+    assert select_evictions(last_used, usage, max_size=260) == ["old"]
+    assert select_evictions(last_used, usage, max_size=240) == ["old", "middle"]
+    assert select_evictions(last_used, usage, max_inodes=25) == ["old"]
+    assert select_evictions(last_used, usage, older_than=200, now=1000) == [
+        "old", "middle"
+    ]
+
+
+def test_gc(nqx_home, venv_depot):
+    for name, used in [("old", 1000), ("recent", 2000)]:
+        make_env(venv_depot, name)
+        marker = venv_depot / name / LAST_USED_FILE
+        marker.touch()
+        os.utime(marker, (used, used))
+
+    def gc(*args):
+        return subprocess.run(
+            [sys.executable, "-m", "nqx", "gc", *args],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "COLUMNS": "200"},
+        )
+
+    result = gc("--older-than", "1d", "--dry-run")
+    assert result.returncode == 0, result.stderr
+    assert "old" in result.stdout and "recent" in result.stdout
+    assert (venv_depot / "old").exists()
+
+    result = gc("--max-inodes", "1")
+    assert result.returncode == 0, result.stderr
+    assert not (venv_depot / "old").exists()
+    assert not (venv_depot / "recent").exists()
+
+
+def test_exec_wrapper_records_use(nqx_home, venv_depot):
+    from nqx.cli.shell import last_used_lines
+
+    make_env(venv_depot, "foo")
+    [line] = last_used_lines("foo", first_rank=True)
+    marker = venv_depot / "foo" / LAST_USED_FILE
+    subprocess.run(["sh", "-c", line], env={"SLURM_PROCID": "1"}, check=True)
+    assert not marker.exists()
+    subprocess.run(["sh", "-c", line], env={}, check=True)
+    assert marker.exists()
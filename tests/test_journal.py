@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+
+from nqx.core import journal
+
+from .conftest import make_env
+
+NQX = f'"{sys.executable}" -m nqx'
+
+
+def _bash(script, env=None):
+    """
+    Run SCRIPT in bash, with `nqx` evaluating the lines printed by nqx like
+    the shell hook does.
+    """
+    prelude = f'nqx() {{ __out="$({NQX} "$@")" || return; eval "$__out"; }}\n'
+    result = subprocess.run(
+        ["bash", "-c", prelude + script],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout.splitlines(), result.stderr
+
+
+def test_undo_restores_the_previous_values():
+    ops = [
+        ("set", "FOO", "bar"),
+        ("set", "NEW", "1"),
+        ("prepend", "PATH", "/env/bin"),
+    ]
+    # PS1 is not inherited by non-interactive shells
+    lines = ["PS1='$ '"] + journal.activation_lines(ops, 1, label="foo")
+    tokens = journal.journal_tokens(ops)
+    lines += ['echo "$FOO|${NEW-unset}|$PATH|$PS1"']
+    lines += journal.undo_lines(tokens, 1)
+    lines += ['echo "$FOO|${NEW-unset}|$PATH|$PS1|$NQX_SHLVL"']
+
+    env = {"FOO": "before", "PATH": "/usr/bin:/bin:/usr/bin"}
+    result = subprocess.run(
+        ["/bin/bash", "-c", "\n".join(lines)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    active, inactive = result.stdout.splitlines()
+    assert active == "bar|1|/env/bin:/usr/bin:/bin|(nqx:foo) $ "
+    # The duplicate entries are gone after the activation
+    assert inactive == "before|unset|/usr/bin:/bin|$ |0"
+
+
+def test_undo_keeps_entries_present_before():
+    ops = [("prepend", "PATH", "/usr/local/bin:/env/bin")]
+    env = {"PATH": "/usr/local/bin:/usr/bin"}
+    lines = journal.activation_lines(ops, 1)
+    lines += ["env -0"]
+    result = subprocess.run(
+        ["/bin/bash", "-c", "\n".join(lines)], capture_output=True, text=True, env=env
+    )
+    active = dict(l.split("=", 1) for l in result.stdout.split("\0") if "=" in l)
+    assert active["PATH"] == "/usr/local/bin:/env/bin:/usr/bin"
+
+    lines = journal.undo_lines(journal.journal(active, 1), 1) + ['echo "$PATH"']
+    result = subprocess.run(
+        ["/bin/bash", "-c", "\n".join(lines)], capture_output=True, text=True, env=active
+    )
+    assert result.stdout.strip() == "/usr/local/bin:/usr/bin"
+    assert journal.undo_environ(active, 1)["PATH"] == "/usr/local/bin:/usr/bin"
+
+
+def test_stacked_activations(venv_depot):
+    foo = make_env(venv_depot, "foo")
+    bar = make_env(venv_depot, "bar")
+    show = 'echo "$NQX_SHLVL $NQX_ENV $VIRTUAL_ENV $PATH"'
+    path = os.environ["PATH"]
+
+    output, _ = _bash(
+        f"nqx activate foo; {show}; "
+        f"nqx activate bar --stack; {show}; "
+        f"nqx deactivate; {show}; "
+        f"nqx activate bar; {show}; "
+        f"nqx deactivate; {show}"
+    )
+    assert output[0] == f"1 foo {foo} {foo}/bin:{path}"
+    assert output[1] == f"2 bar {bar} {bar}/bin:{foo}/bin:{path}"
+    assert output[2] == f"1 foo {foo} {foo}/bin:{path}"
+    # Without --stack, the current environment is replaced
+    assert output[3] == f"1 bar {bar} {bar}/bin:{path}"
+    assert output[4] == f"0   {path}"
+
+
+def test_repeated_activations_do_not_grow_path(venv_depot):
+    make_env(venv_depot, "foo")
+    output, _ = _bash(
+        'for i in 1 2 3; do nqx activate foo; nqx activate foo; nqx deactivate; done; echo "$PATH"'
+    )
+    assert output == [os.environ["PATH"]]
+
+
+def test_reactivate(venv_depot):
+    foo = make_env(venv_depot, "foo")
+    bar = make_env(venv_depot, "bar")
+    env = {**os.environ, "FOO_SENTINEL": "kept"}
+    output, _ = _bash(
+        "nqx activate foo; nqx activate bar --stack; nqx reactivate; "
+        'echo "$NQX_SHLVL $NQX_ENV $PATH $FOO_SENTINEL"',
+        env=env,
+    )
+    assert output == [f"2 bar {bar}/bin:{foo}/bin:{os.environ['PATH']} kept"]
+
+    # A removed environment is dropped from the stack
+    script = (
+        "nqx activate foo; nqx activate bar --stack; "
+        f'rm -r "{bar}"; nqx reactivate; echo "$NQX_SHLVL $NQX_ENV"'
+    )
+    output, stderr = _bash(script, env=env)
+    assert output == ["1 foo"]
+    assert "bar does not exist anymore" in stderr
+
+
+def test_active_envs():
+    env = {"PATH": "/bin"}
+    for level, name in enumerate(["foo", "bar"], start=1):
+        if "NQX_ENV" in env:
+            env[journal.saved_var(level, "NQX_ENV")] = env["NQX_ENV"]
+        env["NQX_ENV"] = name
+        env[journal.journal_var(level)] = "saved:NQX_ENV"
+        env[journal.SHLVL] = str(level)
+    assert journal.active_envs(env) == ["foo", "bar"]
+    assert journal.undo_environ(env, 2)["NQX_ENV"] == "foo"
+    assert journal.active_envs({"NQX_ENV": "foo"}) == []
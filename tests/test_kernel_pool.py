@@ -0,0 +1,158 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from nqx.cli import shell
+from nqx.utils import kernel_pool
+
+from .conftest import make_env
+
+KERNEL = """
+import os, signal, sys
+signal.signal(signal.SIGINT, lambda *args: sys.exit(print("interrupted", flush=True)))
+state = "warm" if "warmmod" in sys.modules else "cold"
+print(state, os.environ.get("FOO"), sys.argv[1:], os.getpid(), flush=True)
+if sys.argv[1:] == ["wait"]:
+    signal.pause()
+"""
+
+
+def _wait(condition):
+    deadline = time.monotonic() + 20
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_kernel_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(kernel_pool, "CHECK_INTERVAL", 0.1)
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "warmmod.py").write_text("")
+    (tmp_path / "kernelmod.py").write_text(KERNEL)
+
+    env = {**os.environ, "PYTHONPATH": str(tmp_path / "lib")}
+    pool = kernel_pool.KernelPool("foo", sys.executable, preload=["warmmod"], env=env)
+    client = kernel_pool.client_command("foo", sys.executable)
+
+    def launch(*args, **kwargs):
+        return subprocess.Popen(
+            client + [sys.executable, "-m", "kernelmod", *args],
+            cwd=tmp_path,
+            env={**os.environ, "FOO": "bar"},
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+    # Without a pool, the kernel starts as usual
+    output = launch("cold").communicate()[0]
+    assert output.startswith("cold bar ['cold']")
+
+    thread = threading.Thread(target=pool.serve)
+    thread.start()
+    try:
+        _wait(lambda: len(pool.workers) == 1 and pool.workers[0].ready)
+        worker_pid = pool.workers[0].process.pid
+
+        process = launch("wait")
+        line = process.stdout.readline()
+        assert line == f"warm bar ['wait'] {worker_pid}\n"
+
+        # Interrupts reach the worker through the launcher
+        process.send_signal(signal.SIGINT)
+        assert process.stdout.read() == "interrupted\n"
+        assert process.wait(timeout=20) == 0
+
+        # A new worker replaces the one handed over
+        _wait(lambda: len(pool.workers) == 1 and pool.workers[0].ready)
+        assert pool.workers[0].process.pid != worker_pid
+    finally:
+        pool.stop()
+        thread.join()
+    assert not kernel_pool.socket_path("foo").exists()
+    assert len(pool.workers) == 0
+
+
+def test_client_without_send_fds(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    (tmp_path / "kernelmod.py").write_text(KERNEL)
+    pool = kernel_pool.KernelPool("foo", sys.executable)
+    thread = threading.Thread(target=pool.serve)
+    thread.start()
+    try:
+        _wait(lambda: len(pool.workers) == 1 and pool.workers[0].ready)
+        # Like on Python 3.8, where the kernel starts as usual
+        client = kernel_pool.client_command("foo", sys.executable)
+        code = "import runpy, socket, sys; del socket.send_fds; "
+        code += "sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__')"
+        output = subprocess.run(
+            [sys.executable, "-c", code, *client[3:], sys.executable, "-m", "kernelmod"],
+            cwd=tmp_path,
+            capture_output=True,
+            text=True,
+        ).stdout
+        assert output.startswith("cold")
+    finally:
+        pool.stop()
+        thread.join()
+
+
+def test_pool_of_another_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    (tmp_path / "kernelmod.py").write_text(KERNEL)
+
+    # A directory others can write to may hold the socket of another user
+    kernel_pool.runtime_dir().mkdir(mode=0o777)
+    os.chmod(kernel_pool.runtime_dir(), 0o777)
+    pool = kernel_pool.KernelPool("foo", sys.executable)
+    with pytest.raises(PermissionError):
+        pool.serve()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(kernel_pool.socket_path("foo")))
+    listener.listen()
+    listener.settimeout(0.1)
+    client = kernel_pool.client_command("foo", sys.executable)
+    output = subprocess.run(
+        client + [sys.executable, "-m", "kernelmod", "cold"],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert output.startswith("cold")
+    # The client did not even connect
+    with pytest.raises(socket.timeout):
+        listener.accept()
+    listener.close()
+
+
+def test_kernel_launcher_uses_pool(nqx_home, venv_depot, tmp_path):
+    path = make_env(venv_depot, "foo")
+    kernel = tmp_path / "kernel"
+    kernel.mkdir()
+    config = {"type": "cpu", "kernel_path": str(kernel)}
+    (path / "nqx_config.json").write_text(json.dumps(config))
+    shell.write_activation_scripts("foo")
+    assert "kernel-pool" not in (kernel / shell.KERNEL_LAUNCHER).read_text()
+
+    config["kernel_pool"] = {"enabled": True, "preload": ["jax"]}
+    (path / "nqx_config.json").write_text(json.dumps(config))
+    assert shell.kernel_pool_config("foo") == {"enabled": True, "preload": ["jax"]}
+    shell.write_activation_scripts("foo")
+    launcher = (kernel / shell.KERNEL_LAUNCHER).read_text()
+    assert str(kernel_pool.socket_path("foo")) in launcher
+    assert "kernel-pool start foo" in launcher
+
+    # The workers need Python 3.9
+    (path / "pyvenv.cfg").write_text("version_info = 3.8.18\n")
+    assert shell.kernel_pool_config("foo") is None
+    shell.write_activation_scripts("foo")
+    assert "kernel-pool" not in (kernel / shell.KERNEL_LAUNCHER).read_text()
@@ -0,0 +1,32 @@
+from nqx.providers.venv.uv import lock
+
+
+def test_lock_is_resolved_once(nqx_home, tmp_path, monkeypatch):
+    requirements = tmp_path / "gpu.txt"
+    requirements.write_text("--find-links https://example.org/jax.html\njax\n")
+
+    resolutions = []
+
+    def compile_requirements(file, python_version, *packages, environment=None):
+        resolutions.append((python_version, packages))
+        return ["jax==0.4.30", "ipykernel==6.29.5"]
+
+    monkeypatch.setattr(lock, "compile_requirements", compile_requirements)
+
+    path = lock.get_lock(requirements, "3.11", "ipykernel")
+    assert path.read_text() == (
+        "--find-links https://example.org/jax.html\njax==0.4.30\nipykernel==6.29.5\n"
+    )
+    assert lock.get_lock(requirements, "3.11", "ipykernel") == path
+    assert len(resolutions) == 1
+
+    # Upgrading resolves again, in place
+    assert lock.get_lock(requirements, "3.11", "ipykernel", upgrade=True) == path
+    assert len(resolutions) == 2
+
+    # Any change of the inputs gives another lock
+    assert lock.get_lock(requirements, "3.12", "ipykernel") != path
+    assert lock.get_lock(requirements, "3.11") != path
+    requirements.write_text("jax\n")
+    assert lock.get_lock(requirements, "3.11", "ipykernel") != path
+    assert len(resolutions) == 5
@@ -0,0 +1,252 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from nqx.cli import config as nqx_config
+from nqx.cli import shell
+from nqx.core import EnvConfig, VenvProviderType
+from nqx.providers import get_venv_provider
+from nqx.providers.venv import mamba, uv
+from nqx.providers.venv.mamba import setup as mamba_setup
+from nqx.providers.venv.uv.wheelhouse import python_version_of
+
+PYTHON_VERSION = f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
+
+# Installs the packages of the file:// channels given with -c in the prefix,
+# as records in conda-meta, with the Python being this one
+FAKE_MICROMAMBA = """\
+import json, os, re, sys
+from urllib.parse import urlparse
+
+args = sys.argv[1:]
+command, args = args[0], args[1:]
+prefix, channels, specs = None, [], []
+while args:
+    arg = args.pop(0)
+    if arg == "--prefix":
+        prefix = args.pop(0)
+    elif arg == "-c":
+        channels.append(args.pop(0))
+    elif arg == "--file":
+        with open(args.pop(0)) as f:
+            specs += [l.strip() for l in f if l.strip() and not l.startswith("#")]
+    elif not arg.startswith("-"):
+        specs.append(arg)
+
+with open(os.environ["FAKE_MAMBA_LOG"], "a") as f:
+    f.write(json.dumps({
+        "argv": sys.argv[1:],
+        "pkgs_dirs": os.environ.get("CONDA_PKGS_DIRS"),
+        "extract_threads": os.environ.get("MAMBA_EXTRACT_THREADS"),
+    }) + "\\n")
+
+available = {}
+for channel in channels:
+    if channel.startswith("file://"):
+        with open(os.path.join(urlparse(channel).path, "noarch", "repodata.json")) as f:
+            for record in json.load(f)["packages"].values():
+                available.setdefault(record["name"], record["version"])
+
+os.makedirs(os.path.join(prefix, "conda-meta"), exist_ok=True)
+for spec in specs:
+    name = re.split("[=<>!~ ]", spec)[0]
+    if name not in available:
+        sys.exit(f"nothing provides {spec}")
+    version = available[name]
+    with open(os.path.join(prefix, "conda-meta", f"{name}-{version}-0.json"), "w") as f:
+        json.dump({"name": name, "version": version}, f)
+    if name == "python":
+        os.makedirs(os.path.join(prefix, "bin"), exist_ok=True)
+        os.symlink(sys.executable, os.path.join(prefix, "bin", "python"))
+"""
+
+
+@pytest.fixture
+def local_channel(tmp_path):
+    """
+    A stand-in for a local conda channel, with only its repodata.
+    """
+    channel = tmp_path / "channel"
+    (channel / "noarch").mkdir(parents=True)
+    packages = {"python": PYTHON_VERSION, "numpy": "2.0.0", "ipykernel": "6.29.0"}
+    repodata = {
+        "packages": {
+            f"{name}-{version}-0.tar.bz2": {"name": name, "version": version}
+            for name, version in packages.items()
+        }
+    }
+    with open(channel / "noarch" / "repodata.json", "w") as f:
+        json.dump(repodata, f)
+    return channel
+
+
+@pytest.fixture
+def fake_micromamba(nqx_home, venv_depot, local_channel, tmp_path, monkeypatch):
+    micromamba = tmp_path / "bin" / "micromamba"
+    micromamba.parent.mkdir()
+    micromamba.write_text(f"#!{sys.executable}\n" + FAKE_MICROMAMBA)
+    os.chmod(micromamba, 0o755)
+
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(
+            {
+                "venv_location": str(venv_depot),
+                "venv_provider": "mamba",
+                "internet": False,
+                "mamba": {
+                    "bin": str(micromamba),
+                    "local_channel": str(local_channel),
+                    "pkgs_dirs": str(tmp_path / "pkgs"),
+                    "extract_threads": 4,
+                },
+            },
+            f,
+        )
+    monkeypatch.setattr(nqx_config, "_config", None)
+    monkeypatch.setenv("FAKE_MAMBA_LOG", str(tmp_path / "micromamba.log"))
+    return micromamba
+
+
+def mamba_calls(tmp_path):
+    with open(tmp_path / "micromamba.log") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_same_interface_as_uv():
+    assert get_venv_provider(VenvProviderType.mamba) is mamba
+    submodules = {"cache", "lock", "pack", "registry", "setup", "wheelhouse"}
+    public = {name for name in dir(uv) if not name.startswith("_")} - submodules
+    assert public - set(dir(mamba)) == set()
+
+
+def test_create_and_sync(fake_micromamba, local_channel, venv_depot, tmp_path):
+    requirements = tmp_path / "cpu.txt"
+    requirements.write_text("# conda packages\nnumpy=2.0\n")
+    env = EnvConfig(env=dict(os.environ))
+
+    env = mamba.create_env("foo", None, str(venv_depot), environment=env)
+    assert env.env["VIRTUAL_ENV"] == str(venv_depot / "foo")
+    mamba.set_env_config("foo", str(venv_depot), "type", "cpu")
+    mamba.install_packages(
+        "foo", "ipykernel", file=requirements, venv_depot=str(venv_depot), environment=env
+    )
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    assert python_version_of(venv_depot / "foo") == version
+    assert (venv_depot / "foo" / "conda-meta" / "numpy-2.0.0-0.json").exists()
+    assert [name for name, _ in mamba.list_envs(str(venv_depot))] == ["foo"]
+
+    create, install = mamba_calls(tmp_path)
+    # Offline, from the local channel only, with the shared cache
+    assert create["argv"][:4] == ["create", "--yes", "--prefix", str(venv_depot / "foo")]
+    assert local_channel.as_uri() in create["argv"]
+    assert "--offline" in create["argv"] and "conda-forge" not in create["argv"]
+    assert install["pkgs_dirs"] == str(tmp_path / "pkgs")
+    assert install["extract_threads"] == "4"
+
+    # Up to date until the requirements change
+    sync = lambda: mamba.sync_packages(
+        "foo", "ipykernel", file=requirements, venv_depot=str(venv_depot), environment=env
+    )
+    assert not sync()
+    requirements.write_text("numpy=2.0\npandas\n")
+    with pytest.raises(RuntimeError, match="synchronize"):
+        sync()
+    assert len(mamba_calls(tmp_path)) == 3
+
+
+def test_offline_without_local_channel(nqx_home, monkeypatch):
+    monkeypatch.setattr(nqx_config, "_config", {"internet": False, "mamba": {}})
+    with pytest.raises(RuntimeError, match="local_channel"):
+        mamba_setup.channel_args()
+
+
+def test_nqx_create(fake_micromamba, venv_depot, nqx_home, tmp_path, monkeypatch):
+    monkeypatch.setenv("JUPYTER_DATA_DIR", str(tmp_path / "jupyter"))
+    (nqx_home / "requirements").mkdir()
+    (nqx_home / "requirements" / "cpu.txt").write_text("numpy\n")
+    with open(nqx_home / "config.json") as f:
+        config = json.load(f)
+    config["python_provider"] = "mamba"
+    config["configurations"] = {"cpu": {"requirements": "requirements/cpu.txt"}}
+    with open(nqx_home / "config.json", "w") as f:
+        json.dump(config, f)
+
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "create", "Foo", "cpu", "--no-precompile"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "COLUMNS": "200"},
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert (venv_depot / "Foo" / "conda-meta" / "ipykernel-6.29.0-0.json").exists()
+    with open(venv_depot / "Foo" / "nqx_config.json") as f:
+        assert json.load(f)["type"] == "cpu"
+
+
+def test_activate_scripts(fake_micromamba, venv_depot, monkeypatch):
+    monkeypatch.setenv("MANPATH", "/usr/share/man")
+    monkeypatch.setenv("OLD_DATA", "old")
+    env = EnvConfig(env=dict(os.environ))
+    env = mamba.create_env("foo", None, str(venv_depot), environment=env)
+    mamba.set_env_config("foo", str(venv_depot), "type", "cpu")
+    activate_d = venv_depot / "foo" / "etc" / "conda" / "activate.d"
+    activate_d.mkdir(parents=True)
+    (activate_d / "gdal.sh").write_text(
+        'export GDAL_DATA="$CONDA_PREFIX/share/gdal"\n'
+        'export MANPATH="$CONDA_PREFIX/man${MANPATH:+:$MANPATH}"\n'
+        "export GREETING='say \"hi\" $HOME `id`'\n"
+        "unset OLD_DATA\n"
+    )
+    mamba.install_packages("foo", "numpy", venv_depot=str(venv_depot), environment=env)
+
+    path = venv_depot / "foo"
+    env = mamba.activate_env("foo", str(venv_depot), environment=EnvConfig(env={}))
+    assert env.env["CONDA_PREFIX"] == str(path)
+    assert env.env["CONDA_DEFAULT_ENV"] == "foo"
+
+    # Replayed literally by the activation scripts, and undone
+    activate, deactivate = shell.write_activation_scripts("foo")
+    show = 'echo "$GDAL_DATA|$MANPATH|$GREETING|${OLD_DATA-unset}"'
+    result = subprocess.run(
+        ["bash", "-c", f'. "{activate}" || exit 7; {show}; . "{deactivate}"; {show}'],
+        capture_output=True,
+        text=True,
+    )
+    assert result.stdout.splitlines() == [
+        f'{path}/share/gdal|{path}/man:/usr/share/man|say "hi" $HOME `id`|unset',
+        "|/usr/share/man||old",
+    ]
+
+    # As by `nqx run`
+    env, _ = shell.run_environment("foo")
+    assert env["GREETING"] == 'say "hi" $HOME `id`'
+    assert env["MANPATH"] == f"{path}/man:/usr/share/man"
+    assert "OLD_DATA" not in env
+
+
+def test_unpack_at_original_path(fake_micromamba, venv_depot, tmp_path, monkeypatch):
+    monkeypatch.setenv("SCRATCH", "/scratch/old")
+    env = EnvConfig(env=dict(os.environ))
+    mamba.create_env("foo", None, str(venv_depot), environment=env)
+    activate_d = venv_depot / "foo" / "etc" / "conda" / "activate.d"
+    activate_d.mkdir(parents=True)
+    (activate_d / "cache.sh").write_text('export FOO_CACHE="$SCRATCH/foo"\n')
+    mamba.install_packages("foo", "numpy", venv_depot=str(venv_depot), environment=env)
+    archive = tmp_path / "foo.tar"
+    mamba.pack_env("foo", str(venv_depot), archive)
+
+    # Conda packages embed their prefix in binaries: no moving them
+    with pytest.raises(ValueError, match="can only be unpacked at"):
+        mamba.unpack_env(archive, str(venv_depot), "bar")
+    with pytest.raises(ValueError, match="can only be unpacked at"):
+        mamba.unpack_env(archive, str(tmp_path / "depot"))
+    assert not (venv_depot / "bar").exists()
+
+    # The activate.d scripts are run again on the host where it is unpacked
+    monkeypatch.setenv("SCRATCH", "/scratch/new")
+    assert mamba.unpack_env(archive, str(venv_depot), force=True) == "foo"
+    delta = mamba.activation_delta("foo", str(venv_depot))
+    assert delta.apply({})["FOO_CACHE"] == "/scratch/new/foo"
@@ -0,0 +1,57 @@
+import subprocess
+
+from nqx.core import EnvConfig, EnvDelta
+from nqx.providers.modules import snapshot
+
+
+def test_env_delta_roundtrip():
+    before = {"PATH": "/usr/bin", "KEEP": "1", "GONE": "x"}
+    after = {
+        "PATH": "/opt/mpi/bin:/usr/bin",
+        "KEEP": "1",
+        "MANPATH": "/opt/mpi/man",
+        "LOADEDMODULES": "mpi",
+    }
+    delta = EnvDelta.between(before, after)
+
+    assert ("prepend", "PATH", "/opt/mpi/bin") in delta.ops
+    assert delta.apply(before) == after
+    assert EnvDelta.from_list(delta.to_list()) == delta
+
+    script = "\n".join(
+        ["export PATH=/usr/bin KEEP=1 GONE=x"]
+        + delta.shell_lines()
+        + ['echo "$PATH"']
+        + delta.inverse_shell_lines()
+        + ['echo "$PATH ${MANPATH-unset}"']
+    )
+    output = subprocess.run(
+        ["bash", "-c", script], capture_output=True, text=True
+    ).stdout.splitlines()
+    assert output == ["/opt/mpi/bin:/usr/bin", "/usr/bin unset"]
+
+
+def test_snapshot_is_captured_once(nqx_home, tmp_path, monkeypatch):
+    modulefiles = tmp_path / "modulefiles"
+    (modulefiles / "mpi").mkdir(parents=True)
+    (modulefiles / "mpi" / "4.1").write_text("#%Module")
+
+    captures = []
+
+    def capture(module_names, environment):
+        captures.append(module_names)
+        return EnvDelta([("prepend", "PATH", "/opt/mpi/bin")])
+
+    monkeypatch.setattr(snapshot, "capture", capture)
+    env = EnvConfig(env={"MODULEPATH": str(modulefiles), "PATH": "/usr/bin"})
+
+    key, delta = snapshot.get_snapshot("mpi/4.1", environment=env)
+    assert snapshot.get_snapshot("mpi/4.1", environment=env) == (key, delta)
+    assert snapshot.read_snapshot(key) == delta
+    assert len(captures) == 1
+
+    # Changing the modulefile captures the modules again
+    (modulefiles / "mpi" / "4.1").write_text("#%Module\nprepend-path PATH /x")
+    new_key, _ = snapshot.get_snapshot("mpi/4.1", environment=env)
+    assert new_key != key
+    assert len(captures) == 2
@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from nqx.core import EnvConfig
+from nqx.providers.modules import execute_module_in_env, snapshot, worker
+
+
+@pytest.fixture
+def module_worker(moduleshome, monkeypatch):
+    monkeypatch.setattr(worker, "_worker", None)
+    yield
+    if worker._worker is not None:
+        worker._worker.close()
+
+
+def test_module_commands_share_one_worker(moduleshome, module_worker):
+    env = EnvConfig(env=os.environ.copy())
+
+    loaded = execute_module_in_env("load", "mpi/4.1", environment=env)
+    assert loaded.env["LOADEDMODULES"] == "mpi/4.1"
+    assert loaded.env["PATH"].startswith("/opt/mpi/bin:")
+    assert loaded.env["MPI_MOTD"] == "line 1\nline 2"
+
+    # The next command starts again from the environment it is given
+    purged = execute_module_in_env("purge", environment=loaded)
+    assert "LOADEDMODULES" not in purged.env
+    again = execute_module_in_env("load", "mpi/4.1", environment=env)
+    assert again.env["LOADEDMODULES"] == "mpi/4.1"
+
+    assert (moduleshome / "init.count").read_text() == "x\n"
+
+
+def test_failing_module_command(moduleshome, module_worker):
+    env = EnvConfig(env=os.environ.copy())
+    with pytest.raises(RuntimeError, match="Unable to locate"):
+        execute_module_in_env("load", "missing", environment=env)
+
+    # The worker is still usable
+    loaded = execute_module_in_env("load", "mpi/4.1", environment=env)
+    assert loaded.env["LOADEDMODULES"] == "mpi/4.1"
+
+    # Without the changes made before the failure
+    with pytest.raises(RuntimeError, match="Unable to locate"):
+        execute_module_in_env("load", "mpi/4.1", "missing", environment=env)
+    loaded = execute_module_in_env("load", "mpi/4.1", environment=env)
+    assert loaded.env["LOADEDMODULES"] == "mpi/4.1"
+
+
+def test_snapshot_through_worker(nqx_home, moduleshome, module_worker):
+    _, delta = snapshot.get_snapshot("mpi/4.1")
+    env = delta.apply(os.environ.copy())
+    assert env["LOADEDMODULES"] == "mpi/4.1"
+    assert env["MPI_MOTD"] == "line 1\nline 2"
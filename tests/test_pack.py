@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+from nqx.providers.venv.uv import pack, setup
+
+from .conftest import make_env
+
+
+@pytest.mark.parametrize("compressors", [pack.COMPRESSORS, []])
+def test_pack_and_unpack(venv_depot, tmp_path, monkeypatch, compressors):
+    monkeypatch.setattr(pack, "COMPRESSORS", compressors)
+
+    path = make_env(venv_depot, "foo")
+    os.symlink("/usr/bin/python3", path / "bin" / "python")
+    script = path / "bin" / "tool"
+    script.write_text(f"#!{path}/bin/python\nimport tool\n")
+    os.chmod(script, 0o755)
+    (path / "lib").mkdir()
+    (path / "lib" / "data.bin").write_bytes(os.urandom(4096))
+
+    kernel = tmp_path / "kernels" / "foo"
+    kernel.mkdir(parents=True)
+    with open(kernel / "kernel.json", "w") as f:
+        json.dump({"argv": [f"{kernel}/launch_kernel", f"{path}/bin/python"]}, f)
+    setup.set_env_config("foo", venv_depot, "kernel_path", str(kernel))
+
+    archive = tmp_path / "foo.tar"
+    manifest = pack.pack_env("foo", venv_depot, archive)
+    assert manifest["files"]["bin/python"] == "link:/usr/bin/python3"
+
+    depot = tmp_path / "other"
+    assert pack.unpack_env(archive, depot, "bar", verify=True) == "bar"
+    new_path = depot / "bar"
+
+    assert os.readlink(new_path / "bin" / "python") == "/usr/bin/python3"
+    assert (new_path / "bin" / "tool").read_text().startswith(f"#!{new_path}/bin/python")
+    assert os.access(new_path / "bin" / "tool", os.X_OK)
+    assert (new_path / "lib" / "data.bin").read_bytes() == (
+        path / "lib" / "data.bin"
+    ).read_bytes()
+
+    new_kernel = setup.get_env_config("bar", depot, "kernel_path")
+    assert new_kernel == str(tmp_path / "kernels" / "bar")
+    with open(os.path.join(new_kernel, "kernel.json")) as f:
+        kernel_config = json.load(f)
+    assert kernel_config["argv"] == [
+        f"{new_kernel}/launch_kernel",
+        f"{new_path}/bin/python",
+    ]
+    assert not any(p.name.startswith(".unpack") for p in depot.iterdir())
+
+    with pytest.raises(FileExistsError):
+        pack.unpack_env(archive, depot, "bar")
+
+    # The kernel of another environment is not replaced without force
+    with pytest.raises(FileExistsError, match="Kernel"):
+        pack.unpack_env(archive, tmp_path / "third", "foo")
+    assert not (tmp_path / "third" / "foo").exists()
+    assert pack.unpack_env(archive, tmp_path / "third", "foo", force=True) == "foo"
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+from nqx.core import EnvConfig
+from nqx.providers.python import modules as modules_provider, registry
+
+
+def make_python(directory):
+    """
+    A `python` in DIRECTORY running this interpreter.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    python = directory / "python"
+    python.write_text(f'#!/bin/sh\nexec {sys.executable} "$@"\n')
+    os.chmod(python, 0o755)
+    return python
+
+
+def test_interpreter_is_probed_once(nqx_home, tmp_path, monkeypatch):
+    python = make_python(tmp_path / "bin")
+    probes = []
+    probe = registry.probe
+    monkeypatch.setattr(
+        registry, "probe", lambda *args: probes.append(args) or probe(*args)
+    )
+    env = {"PATH": f"{python.parent}:/usr/bin"}
+
+    entry = registry.get_interpreter(env)
+    assert entry["path"] == str(python)
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    assert entry["version"].startswith(f"{version}.")
+    assert registry.get_interpreter(env) == entry
+    assert len(probes) == 1
+
+    # A changed interpreter is probed again
+    os.utime(python, (1000, 1000))
+    assert not registry.is_valid(entry)
+    registry.get_interpreter(env)
+    assert len(probes) == 2
+
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "python", "list"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "COLUMNS": "300"},
+    )
+    assert result.returncode == 0, result.stderr
+    assert str(python) in result.stdout
+
+
+def test_modules_provider(nqx_home, moduleshome, tmp_path, monkeypatch):
+    python = make_python(tmp_path / "opt" / "python" / "bin")
+    modulefiles = tmp_path / "modulefiles"
+    (modulefiles / "python").write_text(f'export PATH="{python.parent}:$PATH"\n')
+
+    env = modules_provider.get_env_with_python(
+        EnvConfig(env={**os.environ, "PATH": "/usr/bin:/bin"})
+    )
+    # The environment with the module loaded
+    assert env.env["PATH"].split(os.pathsep)[0] == str(python.parent)
+
+    (entry,) = registry.read_registry().values()
+    assert entry["path"] == str(python)
+    assert entry["modules"] == ["python"]
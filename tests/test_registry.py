@@ -0,0 +1,54 @@
+import json
+import shutil
+import subprocess
+import sys
+
+from nqx.providers.venv.uv import registry
+
+from .conftest import make_env
+
+
+def test_registry_updates(venv_depot):
+    make_env(venv_depot, "foo")
+    make_env(venv_depot, "bar", type="gpu")
+    (venv_depot / "bar" / "pyvenv.cfg").write_text("version_info = 3.12.1\n")
+    (venv_depot / "not-an-env").mkdir()
+
+    assert registry.read_registry(venv_depot) is None
+    envs = registry.get_registry(venv_depot)
+    assert sorted(envs) == ["bar", "foo"]
+    assert envs["bar"]["type"] == "gpu"
+    assert envs["bar"]["python"] == "3.12"
+
+    make_env(venv_depot, "baz")
+    shutil.rmtree(venv_depot / "foo")
+    registry.update_registry("baz", venv_depot)
+    registry.update_registry("foo", venv_depot)
+    assert sorted(registry.read_registry(venv_depot)) == ["bar", "baz"]
+
+
+def test_list_json(nqx_home, venv_depot):
+    make_env(venv_depot, "foo")
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "list", "--json"],
+        capture_output=True,
+        text=True,
+    )
+    envs = json.loads(result.stdout)
+    assert [(e["name"], e["type"], e["path"]) for e in envs] == [
+        ("foo", "cpu", str(venv_depot / "foo"))
+    ]
+
+
+def test_sizes(nqx_home, venv_depot):
+    path = make_env(venv_depot, "foo")
+    config = (path / "nqx_config.json").read_text()
+    result = subprocess.run(
+        [sys.executable, "-m", "nqx", "du", "--json"], capture_output=True, text=True
+    )
+    size = json.loads(result.stdout)["foo"]["size"]
+    assert registry.read_registry(venv_depot)["foo"]["size"] == size
+
+    # Without changing the environment, nor forgetting the size when rebuilt
+    assert (path / "nqx_config.json").read_text() == config
+    assert registry.rebuild_registry(venv_depot)["foo"]["size"] == size
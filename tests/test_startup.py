@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import time
+
+from .conftest import make_env
+
+# Maximum time (in ms) that importing the shell fast path may add to the
+# interpreter startup. The default leaves room for slow CI machines, tighten it
+# with NQX_IMPORT_BUDGET_MS when benchmarking on a cluster.
+IMPORT_BUDGET_MS = float(os.environ.get("NQX_IMPORT_BUDGET_MS", 100))
+
+HEAVY_MODULES = ("typer", "click", "rich")
+
+
+def _python(code, *args):
+    result = subprocess.run(
+        [sys.executable, "-c", code, *args],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return result.stdout
+
+
+def _best_time(code, repeats=5):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _python(code)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def test_activate_does_not_import_full_cli(venv_depot):
+    make_env(venv_depot, "foo")
+
+    code = (
+        "import sys\n"
+        "from nqx.cli import main\n"
+        "main(sys.argv[1:])\n"
+        f"print([m for m in sys.modules if m.split('.')[0] in {HEAVY_MODULES}])\n"
+    )
+    output = _python(code, "activate", "foo").splitlines()
+
+    assert f'export VIRTUAL_ENV="{venv_depot / "foo"}"' in output
+    assert 'export NQX_ENV="foo"' in output
+    assert output[-1] == "[]"
+
+
+def test_deactivate_does_not_import_full_cli(nqx_home):
+    code = (
+        "import sys\n"
+        "from nqx.cli import main\n"
+        "main(['deactivate'])\n"
+        f"print([m for m in sys.modules if m.split('.')[0] in {HEAVY_MODULES}])\n"
+    )
+    output = _python(code).splitlines()
+
+    assert output[0] == "unset VIRTUAL_ENV"
+    assert output[-1] == "[]"
+
+
+def test_shell_import_budget(nqx_home):
+    baseline = _best_time("pass")
+    shell = _best_time("import nqx.cli.shell")
+
+    assert (shell - baseline) * 1000 < IMPORT_BUDGET_MS
@@ -0,0 +1,77 @@
+import os
+import sys
+
+from nqx.cli.config import get_config
+from nqx.core import EnvConfig
+from nqx.providers.venv.uv import lock, setup
+
+from .conftest import make_env
+
+
+def test_sync_only_when_the_lock_changes(venv_depot, tmp_path, monkeypatch):
+    path = make_env(venv_depot, "foo")
+    (path / "pyvenv.cfg").write_text("version_info = 3.11.7\n")
+    requirements = tmp_path / "cpu.txt"
+    requirements.write_text("jax\n")
+
+    # uv records the synchronized locks
+    calls = tmp_path / "calls"
+    uv = tmp_path / "uv"
+    uv.write_text(f'#!/bin/sh\necho "$*" >> {calls}\n')
+    os.chmod(uv, 0o755)
+    monkeypatch.setattr(setup, "UV_BIN", str(uv))
+    monkeypatch.setattr(
+        lock,
+        "compile_requirements",
+        lambda file, python_version, *packages, environment=None: [
+            line.replace("jax", "jax==0.4.30") for line in file.read_text().split()
+        ],
+    )
+    get_config()["verbose"] = False
+
+    def sync():
+        return setup.sync_packages(
+            "foo",
+            "ipykernel",
+            file=requirements,
+            venv_depot=venv_depot,
+            environment=EnvConfig(env=os.environ.copy()),
+        )
+
+    assert sync()
+    assert not sync()
+    assert len(calls.read_text().splitlines()) == 1
+    assert calls.read_text().startswith("pip sync ")
+
+    requirements.write_text("jax\nnetket\n")
+    assert sync()
+    assert len(calls.read_text().splitlines()) == 2
+    assert setup.get_env_config("foo", venv_depot, "lock") is not None
+
+
+def test_compile_bytecode(venv_depot):
+    path = make_env(venv_depot, "foo")
+    os.symlink(sys.executable, path / "bin" / "python")
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    site_packages = path / "lib" / f"python{version}" / "site-packages"
+    site_packages.mkdir(parents=True)
+    (site_packages / "good.py").write_text("x = 1\n")
+    (site_packages / "bad.py").write_text("x = \n")
+
+    env = EnvConfig(env={**os.environ, "PYTHONPYCACHEPREFIX": str(path / "prefix")})
+    setup.compile_bytecode("foo", venv_depot, environment=env)
+    assert [p.name.split(".")[0] for p in (site_packages / "__pycache__").iterdir()] == [
+        "good"
+    ]
+
+
+def test_no_bytecode_with_pycache_prefix(venv_depot, monkeypatch):
+    from nqx.cli import create
+
+    make_env(venv_depot, "foo")
+    setup.set_env_config("foo", venv_depot, "pycache_prefix", "$TMPDIR/pycache")
+    calls = []
+    monkeypatch.setattr(setup, "compile_bytecode", lambda *args, **kwargs: calls.append(args))
+    env = EnvConfig(env=os.environ.copy())
+    create.compile_bytecode(setup, "foo", venv_depot, env)
+    assert calls == []
@@ -0,0 +1,52 @@
+import json
+import subprocess
+import sys
+
+from nqx.cli import _find_command
+from nqx.utils import trace
+
+from .conftest import make_env
+
+
+def test_spans_and_subprocesses():
+    trace.start()
+    try:
+        with trace.span("phase"):
+            subprocess.run(["sh", "-c", "echo hello; exit 3"], capture_output=True)
+    finally:
+        events = trace.stop()
+    assert subprocess.run is trace._run
+
+    command, phase = events
+    assert phase["name"] == "phase"
+    assert command["cat"] == "subprocess"
+    assert command["args"]["returncode"] == 3
+    assert command["args"]["output_bytes"] == len("hello\n")
+    assert phase["ts"] <= command["ts"]
+    assert command["ts"] + command["dur"] <= phase["ts"] + phase["dur"]
+    assert [row[0] for row in trace.summary(events)] == ["phase", "sh"]
+
+
+def test_trace_option(nqx_home, venv_depot, tmp_path):
+    make_env(venv_depot, "foo")
+    trace_file = tmp_path / "trace.json"
+    for _ in range(2):
+        result = subprocess.run(
+            [sys.executable, "-m", "nqx", "--trace", trace_file, "--trace-log", "du"],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+    assert "Timings" in result.stderr
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert [e["name"] for e in events if e["cat"] == "command"] == ["du"]
+
+    log = (nqx_home / "logs" / "trace.jsonl").read_text().splitlines()
+    assert len(log) == 2
+    assert json.loads(log[0])["command"][-1] == "du"
+
+
+def test_command_after_trace_option():
+    assert _find_command(["--trace", "t.json", "activate", "foo"]) == "activate"
+    assert _find_command(["--trace=t.json", "--debug", "list"]) == "list"
@@ -0,0 +1,96 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+from nqx.providers.venv.uv import setup, wheelhouse
+
+
+def make_wheel(directory, name, version):
+    """
+    Write a minimal pure-Python wheel of NAME in DIRECTORY.
+    """
+    dist_info = f"{name}-{version}.dist-info"
+    path = directory / f"{name}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(path, "w") as whl:
+        whl.writestr(f"{name}/__init__.py", "")
+        whl.writestr(
+            f"{dist_info}/METADATA",
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n",
+        )
+        whl.writestr(
+            f"{dist_info}/WHEEL",
+            "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+        )
+        whl.writestr(f"{dist_info}/RECORD", "")
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    """
+    A local directory acting as the package index.
+    """
+    index = tmp_path / "index"
+    index.mkdir()
+    make_wheel(index, "demo", "1.0")
+    make_wheel(index, "demo", "2.0")
+    return index
+
+
+@pytest.mark.parametrize("has_pip", [True, False])
+def test_prefetch_from_local_index(nqx_home, tmp_path, index, monkeypatch, has_pip):
+    if not has_pip:
+        # pip is then run by uv
+        calls = tmp_path / "calls"
+        uv = tmp_path / "uv"
+        uv.write_text(
+            f'#!/bin/sh\necho "$1 $2" >> {calls}\nshift 5\n'
+            f'exec {sys.executable} -m pip "$@"\n'
+        )
+        os.chmod(uv, 0o755)
+        monkeypatch.setattr(setup, "UV_BIN", str(uv))
+        monkeypatch.setattr(wheelhouse.importlib.util, "find_spec", lambda name: None)
+
+    direct = make_wheel(tmp_path, "direct", "0.3")
+    requirements = tmp_path / "cpu.txt"
+    requirements.write_text(f"--no-index\n--find-links {index}\ndemo<2\n")
+
+    def compile_requirements(file, python_version, *packages, environment=None):
+        assert packages == ("ipykernel",)
+        return wheelhouse.parse_pins(
+            "# This file was autogenerated\n"
+            "demo==1.0\n"
+            "    # via -r cpu.txt\n"
+            f"direct @ {direct.as_uri()}  # via -r cpu.txt\n"
+        )
+
+    monkeypatch.setattr(wheelhouse, "compile_requirements", compile_requirements)
+    path = wheelhouse.prefetch(requirements, "3.11", "ipykernel", jobs=2)
+
+    assert path == wheelhouse.pinned_requirements_path(requirements, "3.11")
+    assert path.read_text() == "demo==1.0\ndirect==0.3\n"
+    assert sorted(p.name for p in wheelhouse.wheelhouse_dir().glob("*.whl")) == [
+        "demo-1.0-py3-none-any.whl",
+        "direct-0.3-py3-none-any.whl",
+    ]
+    if not has_pip:
+        assert calls.read_text() == "tool run\ntool run\n"
+
+
+def test_prefetched_requirements(nqx_home, tmp_path):
+    venv = tmp_path / "env"
+    venv.mkdir()
+    (venv / "pyvenv.cfg").write_text("home = /usr/bin\nversion_info = 3.11.7\n")
+    requirements = tmp_path / "cpu.txt"
+    python_version = wheelhouse.python_version_of(venv)
+    assert python_version == "3.11"
+
+    with pytest.raises(FileNotFoundError, match="nqx prefetch"):
+        wheelhouse.prefetched_requirements(requirements, python_version)
+
+    pinned = wheelhouse.pinned_requirements_path(requirements, python_version)
+    pinned.parent.mkdir(parents=True)
+    pinned.write_text("demo==1.0\n")
+    assert wheelhouse.prefetched_requirements(requirements, python_version) == pinned